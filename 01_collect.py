@@ -6,7 +6,11 @@ from pathlib import Path
 
 from src.adapters.mfa_pressers import MFAPressersAdapter
 from src.adapters.party_reports import PartyReportsAdapter
+from src.journal import StageJournal, journal_config
+from src.metrics import METRICS
+from src.shards import DATA_DIR, hash_shard, hash_sharded, shard_data_dir, shard_range
 from src.utils import (
+    atomic_write_text,
     ensure_dir,
     jsonl_write,
     load_config_bundle,
@@ -15,7 +19,16 @@ from src.utils import (
 )
 
 
-def collect_docs(config_dir: str, analysis_start: str | None, analysis_end: str | None, force: bool) -> None:
+def collect_docs(
+    config_dir: str,
+    analysis_start: str | None,
+    analysis_end: str | None,
+    force: bool,
+    write: bool = True,
+    data_dir: Path = DATA_DIR,
+    shard: str | None = None,
+    resume: bool = False,
+) -> list[dict]:
     cfg = load_config_bundle(config_dir)
     sources = cfg["sources"]
     analysis = cfg["analysis"]
@@ -23,9 +36,9 @@ def collect_docs(config_dir: str, analysis_start: str | None, analysis_end: str
     if analysis.get("sample_mode", False):
         sample_year = str(analysis.get("sample_year", start[:4]))
         start, end = f"{sample_year}-01-01", f"{sample_year}-12-31"
-    cache_dir = Path("data/cache")
-    raw_dir = ensure_dir(Path("data/raw"))
-    parsed_dir = ensure_dir(Path("data/parsed"))
+    cache_dir = DATA_DIR / "cache"
+    raw_dir = ensure_dir(data_dir / "raw")
+    parsed_dir = ensure_dir(data_dir / "parsed")
 
     adapters = [
         PartyReportsAdapter(sources["party_reports"], cache_dir / "party"),
@@ -33,17 +46,31 @@ def collect_docs(config_dir: str, analysis_start: str | None, analysis_end: str
         # CentralConferenceAdapter(sources["central_conferences"], cache_dir / "conference"),
     ]
 
+    journal = StageJournal(data_dir, "collect", resume, journal_config(analysis)["checkpoint_every"])
+    finished = journal.load()
     docs_out = []
     for adapter in adapters:
-        docs = adapter.list_doc_urls((start, end))
+        source_type = adapter.config["source_type"]
+        with METRICS.substep("list_urls"):
+            if shard is None:
+                docs = adapter.list_doc_urls((start, end))
+            elif hash_sharded(source_type, analysis):
+                docs = [d for d in adapter.list_doc_urls((start, end)) if hash_shard(d["url"], analysis) == shard]
+            else:
+                docs = adapter.list_doc_urls(shard_range(shard, start, end))
         print(f"[collect] {adapter.config['source_type']}: {len(docs)} docs in range")
         for doc in docs:
             url = doc["url"]
             doc_id = sha1_text(url)[:16]
-            raw_html = adapter.fetch(url, force=force)
+            if doc_id in finished:
+                docs_out.append(finished[doc_id])
+                continue
+            with METRICS.substep("fetch"):
+                raw_html = adapter.fetch(url, force=force)
             raw_path = raw_dir / f"{doc_id}.html"
-            raw_path.write_text(raw_html, encoding="utf-8")
-            parsed = adapter.parse(raw_html)
+            atomic_write_text(raw_path, raw_html)
+            with METRICS.substep("parse"):
+                parsed = adapter.parse(raw_html)
             parsed["title"] = doc.get("title") or parsed.get("title")
             parsed["date"] = doc.get("date") or parsed.get("date")
             parsed["metadata"].update({"source_type": adapter.config["source_type"], "source_org": adapter.config["source_org"]})
@@ -61,9 +88,15 @@ def collect_docs(config_dir: str, analysis_start: str | None, analysis_end: str
                 "segments": [],
             }
             save_json(parsed_dir / f"{doc_id}.json", parsed_doc)
+            journal.record(doc_id, parsed_doc)
             docs_out.append(parsed_doc)
+            METRICS.count("docs")
+    journal.close()
 
-    jsonl_write(parsed_dir / "docs.jsonl", docs_out)
+    if write:
+        jsonl_write(parsed_dir / "docs.jsonl", docs_out)
+    journal.discard()
+    return docs_out
 
 
 def main() -> None:
@@ -72,8 +105,21 @@ def main() -> None:
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
     parser.add_argument("--force", action="store_true")
+    parser.add_argument("--resume", action="store_true", help="Skip documents already finished in the stage journal")
+    parser.add_argument("--shard", default=None, help="Year shard to run (reads/writes data/shards/<year>/)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    collect_docs(args.config_dir, args.analysis_start, args.analysis_end, args.force)
+    with METRICS.stage("collect", profile=args.profile):
+        collect_docs(
+            args.config_dir,
+            args.analysis_start,
+            args.analysis_end,
+            args.force,
+            data_dir=shard_data_dir(args.shard),
+            shard=args.shard,
+            resume=args.resume,
+        )
+    METRICS.write()
 
 
 if __name__ == "__main__":
@@ -4,18 +4,33 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
+import pandas as pd
+
 from src.adapters.mfa_pressers import MFAPressersAdapter
 from src.adapters.party_reports import PartyReportsAdapter
-from src.segment import build_segments, merge_document
-from src.utils import ensure_utf8, jsonl_read, jsonl_write, load_config_bundle, load_json, save_json
+from src.embed import load_token_counter
+from src.journal import StageJournal, journal_config
+from src.metrics import METRICS
+from src.ngram_index import ngram_index_config, update_index
+from src.segment import build_segments, merge_document, pack_segments, segmentation_config
+from src.shards import DATA_DIR, report_path, shard_data_dir
+from src.utils import ensure_dir, ensure_utf8, jsonl_read, jsonl_write, load_config_bundle, save_json
 
 
-def segment_docs(config_dir: str) -> None:
+def segment_docs(
+    config_dir: str,
+    docs: list[dict] | None = None,
+    write: bool = True,
+    data_dir: Path = DATA_DIR,
+    resume: bool = False,
+) -> list[dict]:
     cfg = load_config_bundle(config_dir)
     sources = cfg["sources"]
-    cache_dir = Path("data/cache")
-    parsed_dir = Path("data/parsed")
-    segments_dir = Path("data/segments")
+    seg_cfg = segmentation_config(cfg["analysis"], cfg["models"]["embedding"])
+    count_tokens = load_token_counter(cfg["models"]["embedding"]) if seg_cfg["mode"] == "sentences" else None
+    cache_dir = DATA_DIR / "cache"
+    parsed_dir = data_dir / "parsed"
+    segments_dir = data_dir / "segments"
     segments_dir.mkdir(parents=True, exist_ok=True)
 
     adapters = {
@@ -24,26 +39,78 @@ def segment_docs(config_dir: str) -> None:
         # "central_conference": CentralConferenceAdapter(sources["central_conferences"], cache_dir / "conference"),
     }
 
-    docs = jsonl_read(parsed_dir / "docs.jsonl")
+    def cut(adapter, text: str) -> list[dict]:
+        segments = adapter.segment(text)
+        if count_tokens is not None:
+            segments = pack_segments(segments, seg_cfg["max_tokens"], count_tokens)
+        return segments
+
+    if docs is None:
+        docs = jsonl_read(parsed_dir / "docs.jsonl")
+    journal = StageJournal(data_dir, "segment", resume, journal_config(cfg["analysis"])["checkpoint_every"])
+    finished = journal.load()
     out_docs = []
+    report = []
     for doc in docs:
         if doc["source_type"] not in adapters:
             continue
+        if doc["doc_id"] in finished:
+            out_docs.append(finished[doc["doc_id"]]["doc"])
+            report.extend(finished[doc["doc_id"]]["report"])
+            continue
         adapter = adapters[doc["source_type"]]
         raw_bytes = Path(doc["raw_path"]).read_bytes()
         raw_html = ensure_utf8(raw_bytes)
-        parsed = adapter.parse(raw_html)
-        segments = adapter.segment(parsed["text"])
-        segments = [
-            {**seg, "text": adapter.normalize(seg["text"])}
-            for seg in segments
-        ]
+        with METRICS.substep("parse"):
+            parsed = adapter.parse(raw_html)
+        with METRICS.substep("segment"):
+            segments = cut(adapter, parsed["text"])
+            segments = [
+                {**seg, "text": adapter.normalize(seg["text"])}
+                for seg in segments
+            ]
         seg_rows = build_segments(doc["doc_id"], segments)
+        doc_report = []
+        if "full_text" in parsed:
+            full_segments = len(cut(adapter, parsed["full_text"]))
+            doc_report.append(
+                {
+                    "doc_id": doc["doc_id"],
+                    "source_type": doc["source_type"],
+                    "method": parsed["metadata"]["extraction"]["method"],
+                    "segments_full_page": full_segments,
+                    "segments_kept": len(seg_rows),
+                    "segments_removed": full_segments - len(seg_rows),
+                    "chars_full_page": len(parsed["full_text"]),
+                    "chars_kept": len(parsed["text"]),
+                }
+            )
+            METRICS.count("segments_removed", full_segments - len(seg_rows))
         merged = merge_document(doc, seg_rows)
         save_json(segments_dir / f"{doc['doc_id']}.json", merged)
+        journal.record(doc["doc_id"], {"doc": merged, "report": doc_report})
+        report.extend(doc_report)
         out_docs.append(merged)
+        METRICS.count("docs")
+        METRICS.count("segments", len(seg_rows))
+
+    journal.close()
 
-    jsonl_write(segments_dir / "segments.jsonl", out_docs)
+    if report:
+        path = report_path(data_dir, "extraction_report.csv")
+        ensure_dir(path.parent)
+        pd.DataFrame(report).to_csv(path, index=False, encoding="utf-8")
+        removed = sum(r["segments_removed"] for r in report)
+        chars = sum(r["chars_full_page"] - r["chars_kept"] for r in report)
+        print(f"[segment] main-content extraction removed {removed} segments, {chars} chars across {len(report)} docs")
+    if write:
+        jsonl_write(segments_dir / "segments.jsonl", out_docs)
+    # The index is its own artifact: keep it current even when segments.jsonl is left to a later stage.
+    if ngram_index_config(cfg["analysis"])["enabled"]:
+        stats = update_index(out_docs, cfg["analysis"], data_dir)
+        print("[segment] n-gram index: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    journal.discard()
+    return out_docs
 
 
 def main() -> None:
@@ -51,8 +118,13 @@ def main() -> None:
     parser.add_argument("--config-dir", default="config")
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
+    parser.add_argument("--resume", action="store_true", help="Skip documents already finished in the stage journal")
+    parser.add_argument("--shard", default=None, help="Year shard to run (reads/writes data/shards/<year>/)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    segment_docs(args.config_dir)
+    with METRICS.stage("segment", profile=args.profile):
+        segment_docs(args.config_dir, data_dir=shard_data_dir(args.shard), resume=args.resume)
+    METRICS.write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from src.dedup import dedup_config, mark_duplicates
+from src.metrics import METRICS
+from src.shards import DATA_DIR, shard_data_dir
+from src.utils import jsonl_read, jsonl_write, load_config_bundle, save_json
+
+
+def dedup_docs(
+    config_dir: str, docs: list[dict] | None = None, write: bool = True, data_dir: Path = DATA_DIR
+) -> list[dict]:
+    cfg = dedup_config(load_config_bundle(config_dir)["analysis"])
+    segments_dir = data_dir / "segments"
+    if docs is None:
+        docs = jsonl_read(segments_dir / "segments.jsonl")
+    if not cfg["enabled"]:
+        return docs
+    with METRICS.substep("minhash"):
+        stats = mark_duplicates(docs, cfg)
+    for key, value in stats.items():
+        METRICS.count(key, value)
+    print(
+        f"[dedup] {stats['dup_docs']}/{stats['docs']} duplicate docs, "
+        f"{stats['dup_segments']}/{stats['segments']} duplicate segments (Jaccard >= {cfg['threshold']})"
+    )
+    for doc in docs:
+        save_json(segments_dir / f"{doc['doc_id']}.json", doc)
+    if write:
+        jsonl_write(segments_dir / "segments.jsonl", docs)
+    return docs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-dir", default="config")
+    parser.add_argument("--analysis-start", default=None)
+    parser.add_argument("--analysis-end", default=None)
+    parser.add_argument("--shard", default=None, help="Year shard to run (reads/writes data/shards/<year>/)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
+    args = parser.parse_args()
+    with METRICS.stage("dedup", profile=args.profile):
+        dedup_docs(args.config_dir, data_dir=shard_data_dir(args.shard))
+    METRICS.write()
+
+
+if __name__ == "__main__":
+    main()
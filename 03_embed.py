@@ -4,31 +4,77 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
+import numpy as np
+
+from src.dedup import doc_order_key
 from src.embed import EmbeddingEngine
+from src.journal import StageJournal, journal_config
+from src.metrics import METRICS
+from src.quantize import calibration_texts, quantize_config
+from src.shards import DATA_DIR, shard_data_dir
 from src.utils import jsonl_read, jsonl_write, load_config_bundle, save_json
 
 
-def embed_segments(config_dir: str, force: bool) -> None:
+def embed_segments(
+    config_dir: str,
+    force: bool,
+    docs: list[dict] | None = None,
+    embedder: EmbeddingEngine | None = None,
+    write: bool = True,
+    data_dir: Path = DATA_DIR,
+    resume: bool = False,
+) -> tuple[list[dict], dict[str, np.ndarray]]:
     cfg = load_config_bundle(config_dir)
     models = cfg["models"]
-    embedder = EmbeddingEngine(models["embedding"], Path("data/embeddings"))
-    segments_dir = Path("data/segments")
-    docs = jsonl_read(segments_dir / "segments.jsonl")
-    out_docs = []
-    for doc in docs:
+    if embedder is None:
+        embedder = EmbeddingEngine(models["embedding"], data_dir / "embeddings")
+    segments_dir = data_dir / "segments"
+    if docs is None:
+        docs = jsonl_read(segments_dir / "segments.jsonl")
+    journal = StageJournal(data_dir, "embed", resume, journal_config(cfg["analysis"])["checkpoint_every"])
+    finished = journal.load()
+    if embedder.embedding_dtype == "int8" and (embedder.codec is None or (force and not finished)):
+        quant_cfg = quantize_config(models["embedding"])
+        texts = calibration_texts(docs, quant_cfg["sample_size"], quant_cfg["seed"])
+        codec = embedder.calibrate(texts, quant_cfg["pca_dim"])
+        print(f"[embed] fitted int8 codec {codec.codec_id} ({codec.dim} dims) on {len(texts)} segments")
+    arrays: dict[str, np.ndarray] = {}
+    # Canonical segments that near-duplicates (see 02b_dedup.py) point at; their vectors are reused.
+    canonical_ids = {seg["dup_of"] for doc in docs for seg in doc["segments"] if seg.get("dup_of")}
+    shared: dict[str, np.ndarray] = {}
+    shared_refs: dict[str, str] = {}
+    # Visit documents in dedup order so every canonical segment is embedded before its duplicates.
+    for doc in sorted(docs, key=doc_order_key):
+        # A journaled document's vectors are already in the embedding cache (unless cache_mode is scores_only).
+        done = doc["doc_id"] in finished
+        if done:
+            doc["segments"] = finished[doc["doc_id"]]
         segments = doc["segments"]
         embed_targets = [seg for seg in segments if seg["segment_type"] != "heading"]
         if embed_targets:
-            embeddings = embedder.embed_segments(doc["doc_id"], embed_targets, force=force)
-            for seg in embed_targets:
-                seg["embedding_ref"] = embedder.embedding_ref(seg["text"])
+            with METRICS.substep("embed"):
+                arrays[doc["doc_id"]] = embedder.embed_segments(
+                    doc["doc_id"], embed_targets, force=force and not done, shared=shared
+                )
+            METRICS.count("segments", len(embed_targets))
+            for idx, seg in enumerate(embed_targets):
+                seg["embedding_ref"] = shared_refs.get(seg.get("dup_of")) or embedder.embedding_ref(seg["text"])
+                if seg["segment_id"] in canonical_ids:
+                    shared[seg["segment_id"]] = arrays[doc["doc_id"]][idx]
+                    shared_refs[seg["segment_id"]] = seg["embedding_ref"]
         for seg in segments:
             if seg["segment_type"] == "heading":
                 seg["embedding_ref"] = None
         doc["segments"] = segments
-        save_json(segments_dir / f"{doc['doc_id']}.json", doc)
-        out_docs.append(doc)
-    jsonl_write(segments_dir / "segments_embedded.jsonl", out_docs)
+        if not done:
+            save_json(segments_dir / f"{doc['doc_id']}.json", doc)
+            journal.record(doc["doc_id"], segments)
+        METRICS.count("docs")
+    journal.close()
+    if write:
+        jsonl_write(segments_dir / "segments_embedded.jsonl", docs)
+    journal.discard()
+    return docs, arrays
 
 
 def main() -> None:
@@ -37,8 +83,13 @@ def main() -> None:
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
     parser.add_argument("--force", action="store_true")
+    parser.add_argument("--resume", action="store_true", help="Skip documents already finished in the stage journal")
+    parser.add_argument("--shard", default=None, help="Year shard to run (reads/writes data/shards/<year>/)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    embed_segments(args.config_dir, args.force)
+    with METRICS.stage("embed", profile=args.profile):
+        embed_segments(args.config_dir, args.force, data_dir=shard_data_dir(args.shard), resume=args.resume)
+    METRICS.write()
 
 
 if __name__ == "__main__":
@@ -2,66 +2,259 @@
 from __future__ import annotations
 
 import argparse
+import json
 from pathlib import Path
+from typing import Iterable
 
 import numpy as np
+import pandas as pd
 
+from src.ann import index_config, update_index
 from src.axes import build_axis_vectors, score_segments
 from src.embed import EmbeddingEngine
-from src.outward_filter import compute_year_thresholds, mark_outward
-from src.utils import jsonl_read, jsonl_write, load_config_bundle
+from src.journal import StageJournal, journal_config
+from src.metrics import METRICS
+from src.outward_filter import compute_year_thresholds, mark_outward, outward_group, sketch_year_thresholds
+from src.shards import DATA_DIR, report_path, shard_data_dir
+from src.sketch import KLLSketch
+from src.stats_store import ADD_CHUNK_ROWS, StatsStore, docs_digest, update_store
+from src.utils import atomic_open, ensure_dir, jsonl_iter, jsonl_read, jsonl_write, load_config_bundle
 
 
-def score_axes(config_dir: str, force: bool) -> None:
+SCORED_NAME = "segments_scored.jsonl"
+AXIS_NAMES = ("security_axis", "growth_axis", "outward_axis")
+
+
+def update_search_index(
+    config_dir: str, cfg: dict, data_dir: Path, embedder: EmbeddingEngine, arrays: dict[str, np.ndarray]
+) -> None:
+    """With ``index.auto_update``, append newly scored documents to the nearest-neighbour index."""
+    if data_dir != DATA_DIR or not index_config(cfg["analysis"])["auto_update"]:
+        return
+    with METRICS.substep("index"):
+        stats = update_index(config_dir, data_dir, embedder=embedder, arrays=arrays)
+    print(f"[score] search index: {stats['added']} segments added, {stats['rows']} indexed")
+
+
+def doc_scores(
+    doc: dict,
+    axes: dict,
+    embedder: EmbeddingEngine,
+    arrays: dict[str, np.ndarray],
+    force: bool,
+) -> dict[str, list[float]]:
+    """Axis scores per segment id, in ``AXIS_NAMES`` order; headings score 0 on every axis."""
+    segments = doc["segments"]
+    embed_targets = [seg for seg in segments if seg["segment_type"] != "heading"]
+    if embed_targets:
+        embeddings = arrays.get(doc["doc_id"])
+        if embeddings is None:
+            with METRICS.substep("load_embeddings"):
+                embeddings = embedder.embed_segments(doc["doc_id"], embed_targets, force=force)
+        with METRICS.substep("score"):
+            scores = score_segments(embeddings, axes, embedder.codec)
+    else:
+        scores = {name: [] for name in AXIS_NAMES}
+    target_iter = iter(range(len(embed_targets)))
+    out = {}
+    for seg in segments:
+        if seg["segment_type"] == "heading":
+            out[seg["segment_id"]] = [0.0] * len(AXIS_NAMES)
+        else:
+            idx = next(target_iter)
+            out[seg["segment_id"]] = [float(scores[name][idx]) for name in AXIS_NAMES]
+    METRICS.count("docs")
+    METRICS.count("segments", len(segments))
+    return out
+
+
+def doc_rows(doc: dict, seg_scores: dict[str, list[float]]) -> list[dict]:
+    """Scored rows of a document from its per-segment axis scores."""
+    rows = []
+    for seg in doc["segments"]:
+        seg["scores"].update(zip(AXIS_NAMES, seg_scores[seg["segment_id"]]))
+        rows.append(
+            {
+                "segment_id": seg["segment_id"],
+                "doc_id": doc["doc_id"],
+                "title": doc["title"],
+                "date": doc["date"],
+                "source_type": doc["source_type"],
+                "source_org": doc["source_org"],
+                "url": doc["url"],
+                "text": seg["text"],
+                "segment_type": seg["segment_type"],
+                "char_len": seg["char_len"],
+                "scores": seg["scores"],
+                "dup_of": seg.get("dup_of"),
+                "doc_dup_of": doc.get("dup_of"),
+            }
+        )
+    return rows
+
+
+def score_doc(
+    doc: dict,
+    axes: dict,
+    embedder: EmbeddingEngine,
+    arrays: dict[str, np.ndarray],
+    force: bool,
+) -> list[dict]:
+    return doc_rows(doc, doc_scores(doc, axes, embedder, arrays, force))
+
+
+def score_axes(
+    config_dir: str,
+    force: bool,
+    docs: list[dict] | None = None,
+    embedder: EmbeddingEngine | None = None,
+    arrays: dict[str, np.ndarray] | None = None,
+    write: bool = True,
+    data_dir: Path = DATA_DIR,
+    resume: bool = False,
+) -> list[dict]:
     cfg = load_config_bundle(config_dir)
-    axes_cfg = cfg["axes"]
-    models_cfg = cfg["models"]
-    embedder = EmbeddingEngine(models_cfg["embedding"], Path("data/embeddings"))
-    docs = jsonl_read(Path("data/segments") / "segments_embedded.jsonl")
-    axes = build_axis_vectors(axes_cfg, embedder)
+    if embedder is None:
+        embedder = EmbeddingEngine(cfg["models"]["embedding"], data_dir / "embeddings")
+    if docs is None:
+        docs = jsonl_read(data_dir / "segments" / "segments_embedded.jsonl")
+    arrays = arrays or {}
+    with METRICS.substep("axes"):
+        axes = build_axis_vectors(cfg["axes"], embedder)
 
+    # Only the axis scores are journaled; rows are rebuilt from the input documents on resume.
+    journal = StageJournal(data_dir, "score_values", resume, journal_config(cfg["analysis"])["checkpoint_every"])
+    finished = journal.load()
     flat_rows = []
     for doc in docs:
-        segments = doc["segments"]
-        embed_targets = [seg for seg in segments if seg["segment_type"] != "heading"]
-        if embed_targets:
-            embeddings = embedder.embed_segments(doc["doc_id"], embed_targets, force=force)
-            scores = score_segments(embeddings, axes)
-        else:
-            scores = {"security_axis": [], "growth_axis": [], "outward_axis": []}
-        target_iter = iter(range(len(embed_targets))) if embed_targets else iter([])
-        for seg in segments:
-            if seg["segment_type"] == "heading":
-                seg_scores = {"security_axis": 0.0, "growth_axis": 0.0, "outward_axis": 0.0}
-            else:
-                idx = next(target_iter)
-                seg_scores = {
-                    "security_axis": float(scores["security_axis"][idx]),
-                    "growth_axis": float(scores["growth_axis"][idx]),
-                    "outward_axis": float(scores["outward_axis"][idx]),
-                }
-            seg["scores"].update(seg_scores)
-            flat_rows.append(
-                {
-                    "segment_id": seg["segment_id"],
-                    "doc_id": doc["doc_id"],
-                    "title": doc["title"],
-                    "date": doc["date"],
-                    "source_type": doc["source_type"],
-                    "source_org": doc["source_org"],
-                    "url": doc["url"],
-                    "text": seg["text"],
-                    "segment_type": seg["segment_type"],
-                    "char_len": seg["char_len"],
-                    "scores": seg["scores"],
-                }
-            )
-        doc["segments"] = segments
-
-    thresholds = compute_year_thresholds(flat_rows, cfg["analysis"]["outward_percentile"])
-    mark_outward(flat_rows, thresholds)
-
-    jsonl_write(Path("data/segments") / "segments_scored.jsonl", flat_rows)
+        seg_scores = finished.get(doc["doc_id"])
+        if seg_scores is None:
+            seg_scores = doc_scores(doc, axes, embedder, arrays, force)
+            journal.record(doc["doc_id"], seg_scores)
+        flat_rows.extend(doc_rows(doc, seg_scores))
+    journal.close()
+
+    with METRICS.substep("thresholds"):
+        thresholds = compute_year_thresholds(flat_rows, cfg["analysis"]["outward_percentile"])
+        mark_outward(flat_rows, thresholds)
+    report_store(update_store(cfg, flat_rows, thresholds, data_dir))
+
+    if write:
+        jsonl_write(data_dir / "segments" / SCORED_NAME, flat_rows)
+        update_search_index(config_dir, cfg, data_dir, embedder, arrays)
+    journal.discard()
+    return flat_rows
+
+
+def report_store(stats: dict[str, int]) -> None:
+    print(f"[score] statistics store: {stats['groups_rebuilt']} of {stats['groups']} (year, source) groups rebuilt")
+
+
+def score_axes_streaming(
+    config_dir: str,
+    force: bool,
+    docs: Iterable[dict] | None = None,
+    embedder: EmbeddingEngine | None = None,
+    arrays: dict[str, np.ndarray] | None = None,
+    data_dir: Path = DATA_DIR,
+    resume: bool = False,
+) -> Path:
+    """Score documents one at a time with bounded memory.
+
+    Rows are appended to the stage journal while outward scores feed one KLL
+    sketch per (year, source_type); a second pass over the journal applies
+    ``is_outward`` from the sketch thresholds. Rank-error bounds go to
+    ``outward_thresholds.csv``. With ``resume``, journaled documents are not
+    scored again; their rows are replayed from the journal into the sketches.
+    """
+    cfg = load_config_bundle(config_dir)
+    stream_cfg = cfg["analysis"].get("scoring", {})
+    chunk_docs = int(stream_cfg.get("chunk_docs", 500))
+    sketch_k = int(stream_cfg.get("sketch_k", 400))
+    if embedder is None:
+        embedder = EmbeddingEngine(cfg["models"]["embedding"], data_dir / "embeddings")
+    segments_dir = ensure_dir(data_dir / "segments")
+    scored_path = segments_dir / SCORED_NAME
+    # Shard-local thresholds are provisional; merging shards recomputes them.
+    threshold_report = report_path(data_dir, "outward_thresholds.csv")
+    if docs is None:
+        docs = jsonl_iter(segments_dir / "segments_embedded.jsonl")
+    arrays = arrays or {}
+    with METRICS.substep("axes"):
+        axes = build_axis_vectors(cfg["axes"], embedder)
+
+    sketches: dict[tuple[str, str], KLLSketch] = {}
+    group_docs: dict[tuple[str, str], set[str]] = {}
+
+    def flush(chunk: list[dict]) -> None:
+        grouped: dict[tuple[str, str], list[float]] = {}
+        for row in chunk:
+            grouped.setdefault(outward_group(row), []).append(row["scores"]["outward_axis"])
+            group_docs.setdefault(outward_group(row), set()).add(row["doc_id"])
+        for key, values in grouped.items():
+            if key not in sketches:
+                sketches[key] = KLLSketch(sketch_k, seed=len(sketches))
+            sketches[key].update(values)
+        METRICS.count("chunks")
+
+    journal = StageJournal(data_dir, "score", resume, journal_config(cfg["analysis"])["checkpoint_every"])
+    resumed = set(journal.done)
+    doc_ids: set[str] = set()
+    chunk: list[dict] = []
+    pos = 0
+    for doc in docs:
+        doc_ids.add(doc["doc_id"])
+        if doc["doc_id"] in resumed:
+            continue
+        rows = score_doc(doc, axes, embedder, arrays, force)
+        journal.record(doc["doc_id"], rows)
+        chunk.extend(rows)
+        pos += 1
+        if pos % chunk_docs == 0:
+            flush(chunk)
+            chunk = []
+    for doc_id, rows in journal.entries() if resumed else []:
+        if doc_id in resumed and doc_id in doc_ids:
+            chunk.extend(rows)
+            pos += 1
+            if pos % chunk_docs == 0:
+                flush(chunk)
+                chunk = []
+    flush(chunk)
+    journal.close()
+
+    with METRICS.substep("thresholds"):
+        report = sketch_year_thresholds(sketches, cfg["analysis"]["outward_percentile"])
+        thresholds = {(r["year"], r["source_type"]): r["threshold"] for r in report}
+        ensure_dir(threshold_report.parent)
+        pd.DataFrame(report).to_csv(threshold_report, index=False)
+    worst = max((r["rank_error_p99"] for r in report), default=0.0)
+    print(f"[score] {len(report)} outward thresholds; rank error <= {worst:.4f} (99% bound) vs exact percentiles")
+    METRICS.observe("outward.rank_error_p99", worst)
+
+    store = StatsStore(cfg, data_dir)
+    stale = store.begin({group: docs_digest(ids) for group, ids in group_docs.items()}, thresholds)
+    with METRICS.substep("mark_outward"):
+        pending: list[dict] = []
+        with atomic_open(scored_path, durable=True) as out:
+            for doc_id, rows in journal.entries():
+                if doc_id not in doc_ids:
+                    continue
+                mark_outward(rows, thresholds)
+                for row in rows:
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                if rows and outward_group(rows[0]) in stale:
+                    pending.extend(rows)
+                    if len(pending) >= ADD_CHUNK_ROWS:
+                        store.add(pending)
+                        pending = []
+        store.add(pending)
+    # segments_scored.jsonl now holds every journaled row.
+    journal.discard()
+    with METRICS.substep("stats_store"):
+        report_store(store.commit())
+    update_search_index(config_dir, cfg, data_dir, embedder, arrays)
+    return scored_path
 
 
 def main() -> None:
@@ -70,8 +263,19 @@ def main() -> None:
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
     parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--stream", action="store_true", help="Score in chunks with bounded memory (sketch-based thresholds)"
+    )
+    parser.add_argument("--resume", action="store_true", help="Skip documents already finished in the stage journal")
+    parser.add_argument("--shard", default=None, help="Year shard to run (reads/writes data/shards/<year>/)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    score_axes(args.config_dir, args.force)
+    with METRICS.stage("score", profile=args.profile):
+        if args.stream or load_config_bundle(args.config_dir)["analysis"].get("scoring", {}).get("stream"):
+            score_axes_streaming(args.config_dir, args.force, data_dir=shard_data_dir(args.shard), resume=args.resume)
+        else:
+            score_axes(args.config_dir, args.force, data_dir=shard_data_dir(args.shard), resume=args.resume)
+    METRICS.write()
 
 
 if __name__ == "__main__":
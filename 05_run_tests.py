@@ -2,106 +2,201 @@
 from __future__ import annotations
 
 import argparse
+import os
+import tempfile
+from contextlib import ExitStack
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from src.tests.coupling import run_coupling
-from src.tests.elasticity import cluster_embeddings, slogan_entropy
+from src.binning import binning_config, build_cube, day_codes, labels_for_days
+from src.dag import Task, run_tasks, select_tasks, shared
+from src.dedup import is_duplicate
+from src.embed import model_cache_dir
+from src.metrics import METRICS
+from src.ngram_index import NgramIndex
+from src.quantize import CODEC_NAME, as_matrix, load_codec
+from src.tests.changepoints import changepoint_config, changepoint_table, detect_changepoints, wide_series
+from src.tests.coupling import coupling_from_cube, coupling_regression, run_coupling
+from src.tests.elasticity import (
+    cluster_embeddings,
+    fit_minibatch,
+    sampled_silhouette,
+    select_k,
+    slogan_entropy,
+    sweep_config,
+)
 from src.tests.keyness import compute_keyness
 from src.tests.slogans import extract_candidates, slogan_metrics, slogan_presence
-from src.tests.trend import run_trend
-from src.utils import jsonl_read, load_config_bundle, load_curated, load_stoplist, save_json
+from src.tests.trend import run_trend, trend_from_cube
+from src.utils import ensure_dir, jsonl_read, load_config_bundle, load_curated, load_json, load_stoplist, save_json
+
+
+BIN_AXIS_LABELS = {"daily": "Day", "monthly": "Month", "quarterly": "Quarter", "yearly": "Year", "custom": "Period"}
+
+
+def pyplot():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
 
 
 def percentile_threshold(values: list[float], pct: float) -> float:
     return float(np.percentile(values, pct * 100)) if values else 0.0
 
 
-def run_keyness(rows: list[dict], analysis_cfg: dict) -> None:
+def keyness_params(analysis_cfg: dict) -> tuple:
+    cfg = analysis_cfg["keyness"]
+    return (
+        cfg["ngram_min"],
+        cfg["ngram_max"],
+        cfg["method"],
+        cfg["alpha"],
+        cfg["top_n"],
+        cfg.get("permutations", 0),
+        cfg.get("seed", 42),
+    )
+
+
+def outward_rows_by_year(rows: list[dict]) -> dict[str, list[dict]]:
+    by_year: dict[str, list[dict]] = {}
+    for row in rows:
+        if row["scores"].get("is_outward"):
+            by_year.setdefault(row["date"][:4], []).append(row)
+    return by_year
+
+
+def run_keyness_year(year: str, analysis_cfg: dict) -> None:
     output_dir = Path("outputs/tables")
     output_dir.mkdir(parents=True, exist_ok=True)
-    method = analysis_cfg["keyness"]["method"]
-    n_min = analysis_cfg["keyness"]["ngram_min"]
-    n_max = analysis_cfg["keyness"]["ngram_max"]
-    top_n = analysis_cfg["keyness"]["top_n"]
-    alpha = analysis_cfg["keyness"]["alpha"]
-
-    df = pd.DataFrame([r for r in rows if r["scores"].get("is_outward")])
-    if df.empty:
-        return
-    for year, group in df.groupby(df["date"].str.slice(0, 4)):
-        sec_vals = group["scores"].apply(lambda x: x["security_axis"]).tolist()
-        growth_vals = group["scores"].apply(lambda x: x["growth_axis"]).tolist()
-        sec_hi = percentile_threshold(sec_vals, analysis_cfg["security_top_decile"])
-        sec_lo = percentile_threshold(sec_vals, analysis_cfg["security_bottom_decile"])
-        grow_hi = percentile_threshold(growth_vals, analysis_cfg["growth_top_decile"])
-        grow_lo = percentile_threshold(growth_vals, analysis_cfg["growth_bottom_decile"])
-
-        sec_high_texts = group[group["scores"].apply(lambda x: x["security_axis"] >= sec_hi)]["text"].tolist()
-        sec_low_texts = group[group["scores"].apply(lambda x: x["security_axis"] <= sec_lo)]["text"].tolist()
-        grow_high_texts = group[group["scores"].apply(lambda x: x["growth_axis"] >= grow_hi)]["text"].tolist()
-        grow_low_texts = group[group["scores"].apply(lambda x: x["growth_axis"] <= grow_lo)]["text"].tolist()
-
-        sec_df = compute_keyness(sec_high_texts, sec_low_texts, n_min, n_max, method, alpha, top_n)
-        grow_df = compute_keyness(grow_high_texts, grow_low_texts, n_min, n_max, method, alpha, top_n)
-        sec_df.to_csv(output_dir / f"keyness_security_{year}.csv", index=False, encoding="utf-8")
-        grow_df.to_csv(output_dir / f"keyness_growth_{year}.csv", index=False, encoding="utf-8")
-
-    period_a = df[df["date"] <= "2017-12-31"]["text"].tolist()
-    period_b = df[df["date"] >= "2022-01-01"]["text"].tolist()
+    group = shared()["outward_by_year"][year]
+    sec_vals = [r["scores"]["security_axis"] for r in group]
+    growth_vals = [r["scores"]["growth_axis"] for r in group]
+    sec_hi = percentile_threshold(sec_vals, analysis_cfg["security_top_decile"])
+    sec_lo = percentile_threshold(sec_vals, analysis_cfg["security_bottom_decile"])
+    grow_hi = percentile_threshold(growth_vals, analysis_cfg["growth_top_decile"])
+    grow_lo = percentile_threshold(growth_vals, analysis_cfg["growth_bottom_decile"])
+
+    sec_high_texts = [r["text"] for r in group if r["scores"]["security_axis"] >= sec_hi]
+    sec_low_texts = [r["text"] for r in group if r["scores"]["security_axis"] <= sec_lo]
+    grow_high_texts = [r["text"] for r in group if r["scores"]["growth_axis"] >= grow_hi]
+    grow_low_texts = [r["text"] for r in group if r["scores"]["growth_axis"] <= grow_lo]
+
+    params = keyness_params(analysis_cfg)
+    sec_df = compute_keyness(sec_high_texts, sec_low_texts, *params)
+    grow_df = compute_keyness(grow_high_texts, grow_low_texts, *params)
+    sec_df.to_csv(output_dir / f"keyness_security_{year}.csv", index=False, encoding="utf-8")
+    grow_df.to_csv(output_dir / f"keyness_growth_{year}.csv", index=False, encoding="utf-8")
+
+
+def run_keyness_period(analysis_cfg: dict) -> None:
+    output_dir = Path("outputs/tables")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outward = [r for group in shared()["outward_by_year"].values() for r in group]
+    period_a = [r["text"] for r in outward if r["date"] <= "2017-12-31"]
+    period_b = [r["text"] for r in outward if r["date"] >= "2022-01-01"]
     if period_a and period_b:
-        sec_period = compute_keyness(period_a, period_b, n_min, n_max, method, alpha, top_n)
-        sec_period.to_csv(output_dir / "keyness_security_period.csv", index=False, encoding="utf-8")
-        grow_period = compute_keyness(period_a, period_b, n_min, n_max, method, alpha, top_n)
-        grow_period.to_csv(output_dir / "keyness_growth_period.csv", index=False, encoding="utf-8")
+        # Both period tables contrast the same two periods, so the (permutation) test runs once.
+        period = compute_keyness(period_a, period_b, *keyness_params(analysis_cfg))
+        period.to_csv(output_dir / "keyness_security_period.csv", index=False, encoding="utf-8")
+        period.to_csv(output_dir / "keyness_growth_period.csv", index=False, encoding="utf-8")
+
 
+def plot_series(ax, df, x: str, y: str, label: str) -> str:
+    (line,) = ax.plot(df[x], df[y], label=label)
+    if f"{y}_lo" in df.columns:
+        ax.fill_between(df[x], df[f"{y}_lo"], df[f"{y}_hi"], alpha=0.2)
+    return line.get_color()
 
-def run_trends(rows: list[dict]) -> None:
-    trend_df = run_trend(rows)
+
+def plot_changepoints(ax, df, columns: dict[str, str], analysis_cfg: dict) -> None:
+    """Dashed line at each change point of the plotted ``columns`` (column -> line colour)."""
+    found = detect_changepoints(wide_series(df, [], list(columns)), changepoint_config(analysis_cfg))
+    for row in found.itertuples():
+        ax.axvline(row.bin, color=columns[row.series], linestyle="--", linewidth=1, alpha=0.7)
+
+
+def run_trends(analysis_cfg: dict) -> None:
+    binning, periods = binning_config(analysis_cfg)
+    cube = shared()["cube"]
+    trend_df = run_trend(
+        shared()["rows"], analysis_cfg.get("bootstrap"), binning, periods, cube=cube, bins=shared()["bins"]
+    )
     output_dir = Path("outputs/tables")
     output_dir.mkdir(parents=True, exist_ok=True)
-    trend_df.to_csv(output_dir / "q1_trend_quarterly.csv", index=False, encoding="utf-8")
+    trend_df.to_csv(output_dir / f"q1_trend_{binning}.csv", index=False, encoding="utf-8")
+    for view in analysis_cfg.get("binning_views") or []:
+        view_df = trend_from_cube(cube, view, periods).sort_values(["bin", "source_type"])
+        view_df.to_csv(output_dir / f"q1_trend_{view}.csv", index=False, encoding="utf-8")
 
+    plt = pyplot()
     fig, ax = plt.subplots(figsize=(10, 5))
     mfa = trend_df[trend_df["source_type"] == "mfa_presser"]
-    ax.plot(mfa["bin"], mfa["security_mean"], label="security")
-    ax.plot(mfa["bin"], mfa["growth_mean"], label="growth")
-    ax.set_xlabel("Quarter")
+    colors = {
+        "security_mean": plot_series(ax, mfa, "bin", "security_mean", "security"),
+        "growth_mean": plot_series(ax, mfa, "bin", "growth_mean", "growth"),
+    }
+    plot_changepoints(ax, mfa, colors, analysis_cfg)
+    ax.set_xlabel(BIN_AXIS_LABELS[binning])
     ax.set_ylabel("Mean score")
     ax.legend()
     plt.xticks(rotation=45, ha="right")
     fig.tight_layout()
-    fig_path = Path("outputs/figures") / "q1_trend_quarterly.png"
+    fig_path = Path("outputs/figures") / f"q1_trend_{binning}.png"
     fig_path.parent.mkdir(parents=True, exist_ok=True)
     fig.savefig(fig_path, dpi=150)
     plt.close(fig)
 
 
-def run_coupling_tests(rows: list[dict]) -> None:
-    coupling_df = run_coupling(rows)
+def run_coupling_tests(analysis_cfg: dict) -> None:
+    binning, periods = binning_config(analysis_cfg)
+    cube = shared()["cube"]
+    coupling_df = run_coupling(
+        shared()["rows"], analysis_cfg.get("bootstrap"), binning, periods, cube=cube, bins=shared()["bins"]
+    )
     output_dir = Path("outputs/tables")
     output_dir.mkdir(parents=True, exist_ok=True)
-    coupling_df.to_csv(output_dir / "q2_coupling_quarterly.csv", index=False, encoding="utf-8")
+    coupling_df.to_csv(output_dir / f"q2_coupling_{binning}.csv", index=False, encoding="utf-8")
+    for view in analysis_cfg.get("binning_views") or []:
+        view_df = coupling_from_cube(cube, view, periods).sort_values("bin")
+        view_df.to_csv(output_dir / f"q2_coupling_{view}.csv", index=False, encoding="utf-8")
 
+    plt = pyplot()
     fig, ax = plt.subplots(figsize=(10, 5))
-    ax.plot(coupling_df["bin"], coupling_df["corr_outward_security"], label="outward-security")
-    ax.plot(coupling_df["bin"], coupling_df["corr_outward_growth"], label="outward-growth")
-    ax.set_xlabel("Quarter")
+    colors = {
+        "corr_outward_security": plot_series(ax, coupling_df, "bin", "corr_outward_security", "outward-security"),
+        "corr_outward_growth": plot_series(ax, coupling_df, "bin", "corr_outward_growth", "outward-growth"),
+    }
+    plot_changepoints(ax, coupling_df, colors, analysis_cfg)
+    ax.set_xlabel(BIN_AXIS_LABELS[binning])
     ax.set_ylabel("Correlation")
     ax.legend()
     plt.xticks(rotation=45, ha="right")
     fig.tight_layout()
-    fig_path = Path("outputs/figures") / "q2_coupling_quarterly.png"
+    fig_path = Path("outputs/figures") / f"q2_coupling_{binning}.png"
     fig.savefig(fig_path, dpi=150)
     plt.close(fig)
 
 
-def run_slogans(rows: list[dict], analysis_cfg: dict) -> None:
-    output_dir = Path("outputs/tables")
-    output_dir.mkdir(parents=True, exist_ok=True)
+def run_regression(analysis_cfg: dict) -> None:
+    binning, periods = binning_config(analysis_cfg)
+    rows = shared()["rows"]
+    output_dir = ensure_dir(Path("outputs/tables"))
+    coupling_regression(rows, shared()["bins"]).to_csv(
+        output_dir / f"q2_regression_{binning}.csv", index=False, encoding="utf-8"
+    )
+    views = analysis_cfg.get("binning_views") or []
+    days = day_codes([r["date"] for r in rows]) if views else None
+    for view in views:
+        view_df = coupling_regression(rows, labels_for_days(days, view, periods))
+        view_df.to_csv(output_dir / f"q2_regression_{view}.csv", index=False, encoding="utf-8")
+
+
+def slogan_inputs(rows: list[dict], analysis_cfg: dict) -> tuple:
     stoplist = load_stoplist(analysis_cfg["slogans"]["stoplist_path"])
     curated = load_curated(analysis_cfg["slogans"]["curated_path"])
     party_texts = [r["text"] for r in rows if r["source_type"] == "party_report"]
@@ -112,57 +207,231 @@ def run_slogans(rows: list[dict], analysis_cfg: dict) -> None:
         stoplist,
         analysis_cfg["slogans"]["top_n"],
     )
-    candidates.to_csv(output_dir / "slogans_candidates.csv", index=False, encoding="utf-8")
     slogans = curated if curated else candidates["slogan"].head(50).tolist()
-    metrics = slogan_metrics(rows, slogans)
-    metrics.to_csv(output_dir / "slogans_quarterly.csv", index=False, encoding="utf-8")
+    return candidates, slogans
 
 
-def run_elasticity(rows: list[dict], analysis_cfg: dict) -> None:
-    embeddings_path = Path("data/embeddings")
-    if not embeddings_path.exists():
+def run_slogans(analysis_cfg: dict) -> None:
+    binning, _ = binning_config(analysis_cfg)
+    output_dir = Path("outputs/tables")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shared()["slogan_candidates"].to_csv(output_dir / "slogans_candidates.csv", index=False, encoding="utf-8")
+    metrics = slogan_metrics(
+        shared()["rows"], shared()["slogans"], bins=shared()["bins"], index=shared()["ngram_index"]
+    )
+    metrics.to_csv(output_dir / f"slogans_{binning}.csv", index=False, encoding="utf-8")
+
+
+def run_changepoints(analysis_cfg: dict) -> None:
+    binning, _ = binning_config(analysis_cfg)
+    output_dir = Path("outputs/tables")
+    paths = [output_dir / f"{name}_{binning}.csv" for name in ["q1_trend", "q2_coupling", "slogans"]]
+    missing = [str(p) for p in paths if not p.exists()]
+    if missing:
+        print(f"[analysis] changepoints: missing {', '.join(missing)}; run trends, coupling and slogans first")
         return
+    trend, coupling, slogans = (pd.read_csv(p, encoding="utf-8") for p in paths)
+    table = changepoint_table(trend, coupling, slogans, changepoint_config(analysis_cfg))
+    table.to_csv(output_dir / f"changepoints_{binning}.csv", index=False, encoding="utf-8")
+
+
+def load_embedding_matrix(
+    rows: list[dict],
+    bins: np.ndarray,
+    arrays: dict[str, np.ndarray] | None = None,
+    embeddings_path: Path = Path("data/embeddings"),
+) -> tuple[np.ndarray | None, dict, dict]:
+    if arrays is None and not embeddings_path.exists():
+        return None, {}, {}
+    # int8 caches are clustered in codec coordinates (PCA-reduced when configured).
+    codec = load_codec(embeddings_path / CODEC_NAME)
     all_embeddings = []
     bin_map = {}
     segment_index_map = {}
+    doc_rows_map: dict[str, list[tuple[dict, str | None]]] = {}
+    for row, bin_id in zip(rows, bins):
+        if row["segment_type"] != "heading":
+            doc_rows_map.setdefault(row["doc_id"], []).append((row, bin_id))
+    start_idx = 0
     for doc_id in {r["doc_id"] for r in rows}:
-        cache = embeddings_path / f"{doc_id}.npz"
-        if not cache.exists():
-            continue
-        data = np.load(cache, allow_pickle=True)
-        emb = data["embeddings"].astype(np.float32)
-        start_idx = len(all_embeddings)
+        if arrays is not None:
+            if doc_id not in arrays:
+                continue
+            emb = as_matrix(arrays[doc_id], codec)
+        else:
+            cache = embeddings_path / f"{doc_id}.npz"
+            if not cache.exists():
+                continue
+            emb = as_matrix(np.load(cache, allow_pickle=True)["embeddings"], codec)
         all_embeddings.append(emb)
-        doc_rows = [r for r in rows if r["doc_id"] == doc_id and r["segment_type"] != "heading"]
-        for idx, row in enumerate(doc_rows):
+        for idx, (row, bin_id) in enumerate(doc_rows_map.get(doc_id, [])):
             global_idx = start_idx + idx
-            bin_map[global_idx] = row["date"]
+            if bin_id is not None:
+                bin_map[global_idx] = bin_id
             segment_index_map[row["segment_id"]] = global_idx
+        start_idx += emb.shape[0]
     if not all_embeddings:
-        return
-    matrix = np.vstack(all_embeddings)
-    labels = cluster_embeddings(matrix, analysis_cfg["cluster"]["k"], analysis_cfg["cluster"]["random_state"])
+        return None, {}, {}
+    return np.vstack(all_embeddings), bin_map, segment_index_map
 
-    stoplist = load_stoplist(analysis_cfg["slogans"]["stoplist_path"])
-    curated = load_curated(analysis_cfg["slogans"]["curated_path"])
-    party_texts = [r["text"] for r in rows if r["source_type"] == "party_report"]
-    candidates = extract_candidates(
-        party_texts,
-        analysis_cfg["slogans"]["min_len"],
-        analysis_cfg["slogans"]["max_len"],
-        stoplist,
-        analysis_cfg["slogans"]["top_n"],
-    )
-    slogans = curated if curated else candidates["slogan"].head(50).tolist()
 
-    slogan_map = slogan_presence(rows, slogans)
-    slogan_indices = {
+def slogan_embedding_indices() -> dict[str, list[int]]:
+    segment_index_map = shared()["embedding_index"]
+    slogan_map = slogan_presence(shared()["rows"], shared()["slogans"], shared()["ngram_index"])
+    return {
         slogan: [segment_index_map[seg_id] for seg_id in ids if seg_id in segment_index_map]
         for slogan, ids in slogan_map.items()
     }
-    summary, series = slogan_entropy(slogan_indices, labels, bin_map)
-    summary.to_csv(Path("outputs/tables") / "slogan_elasticity.csv", index=False, encoding="utf-8")
-    series.to_csv(Path("outputs/tables") / "slogan_entropy_timeseries.csv", index=False, encoding="utf-8")
+
+
+def run_elasticity(analysis_cfg: dict) -> None:
+    matrix = shared()["embeddings"]
+    if matrix is None:
+        return
+    labels = cluster_embeddings(matrix, analysis_cfg["cluster"]["k"], analysis_cfg["cluster"]["random_state"])
+    summary, series = slogan_entropy(slogan_embedding_indices(), labels, shared()["embedding_bins"])
+    output_dir = Path("outputs/tables")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(output_dir / "slogan_elasticity.csv", index=False, encoding="utf-8")
+    series.to_csv(output_dir / "slogan_entropy_timeseries.csv", index=False, encoding="utf-8")
+
+
+KSWEEP_DIR = Path("outputs/tables/ksweep")
+
+
+def run_k_fit(k: int, analysis_cfg: dict) -> None:
+    path = shared().get("embedding_file")
+    if path is None:
+        return
+    # Every worker maps the same .npy; pages are shared through the OS page cache.
+    matrix = np.load(path, mmap_mode="r")
+    cluster_cfg = analysis_cfg["cluster"]
+    sweep = sweep_config(cluster_cfg)
+    labels, inertia = fit_minibatch(matrix, k, cluster_cfg["random_state"], sweep["batch_size"], sweep["n_init"])
+    silhouette = sampled_silhouette(matrix, labels, sweep["silhouette_sample"], cluster_cfg["random_state"])
+    summary, series = slogan_entropy(slogan_embedding_indices(), labels, shared()["embedding_bins"])
+    output_dir = ensure_dir(KSWEEP_DIR)
+    summary.to_csv(output_dir / f"slogan_elasticity_k{k}.csv", index=False, encoding="utf-8")
+    series.to_csv(output_dir / f"slogan_entropy_timeseries_k{k}.csv", index=False, encoding="utf-8")
+    save_json(
+        output_dir / f"k{k}.json",
+        {
+            "k": k,
+            "n_segments": int(matrix.shape[0]),
+            "inertia": inertia,
+            "silhouette": silhouette,
+            "mean_slogan_entropy": float(summary["entropy"].mean()) if not summary.empty else float("nan"),
+        },
+    )
+
+
+def run_k_selection(analysis_cfg: dict) -> None:
+    paths = [KSWEEP_DIR / f"k{k}.json" for k in sweep_config(analysis_cfg["cluster"])["k_values"]]
+    metrics = [load_json(p) for p in paths if p.exists()]
+    if not metrics:
+        return
+    select_k(pd.DataFrame(metrics)).to_csv(Path("outputs/tables") / "k_selection.csv", index=False, encoding="utf-8")
+
+
+def build_tasks(analysis_cfg: dict, years: list[str]) -> list[Task]:
+    # Longest-running analyses first so per-year keyness fills the remaining workers.
+    k_values = sweep_config(analysis_cfg["cluster"])["k_values"]
+    tasks = [Task(f"ksweep:{k}", run_k_fit, (k, analysis_cfg)) for k in k_values]
+    if k_values:
+        tasks.append(Task("ksweep:select", run_k_selection, (analysis_cfg,), tuple(f"ksweep:{k}" for k in k_values)))
+    tasks += [
+        Task("elasticity", run_elasticity, (analysis_cfg,)),
+        Task("slogans", run_slogans, (analysis_cfg,)),
+        Task("trends", run_trends, (analysis_cfg,)),
+        Task("coupling", run_coupling_tests, (analysis_cfg,)),
+        Task("regression", run_regression, (analysis_cfg,)),
+    ]
+    tasks.extend(Task(f"keyness:{year}", run_keyness_year, (year, analysis_cfg)) for year in years)
+    tasks.append(Task("keyness:period", run_keyness_period, (analysis_cfg,)))
+    tasks.append(Task("changepoints", run_changepoints, (analysis_cfg,), ("trends", "coupling", "slogans")))
+    return tasks
+
+
+def load_ngram_index(rows: list[dict]) -> NgramIndex | None:
+    """The segment n-gram index when it matches ``rows``; slogan counts scan every row otherwise."""
+    index = NgramIndex.load()
+    if not index.exists:
+        return None
+    if not index.covers(rows):
+        print(f"[analysis] {index.root} is out of date for these segments; slogan searches scan every row")
+        return None
+    return index
+
+
+def run_analyses(
+    rows: list[dict],
+    analysis_cfg: dict,
+    only: list[str] | None = None,
+    skip: list[str] | None = None,
+    workers: int = 1,
+    arrays: dict[str, np.ndarray] | None = None,
+    embeddings_path: Path = Path("data/embeddings"),
+) -> dict:
+    embedding_rows = rows
+    if (analysis_cfg.get("dedup") or {}).get("exclude_from_analyses"):
+        rows = [r for r in rows if not is_duplicate(r)]
+        METRICS.count("rows_excluded_duplicates", len(embedding_rows) - len(rows))
+    outward_by_year = outward_rows_by_year(rows)
+    tasks = select_tasks(build_tasks(analysis_cfg, sorted(outward_by_year)), only, skip)
+    groups = {t.group for t in tasks}
+    binning, periods = binning_config(analysis_cfg)
+    with METRICS.substep("binning"):
+        days = day_codes([r["date"] for r in rows])
+        inputs = {
+            "rows": rows,
+            "outward_by_year": outward_by_year,
+            "bins": labels_for_days(days, binning, periods),
+            "cube": build_cube(rows, days),
+        }
+    if groups & {"slogans", "elasticity", "ksweep"}:
+        with METRICS.substep("slogan_inputs"):
+            inputs["slogan_candidates"], inputs["slogans"] = slogan_inputs(rows, analysis_cfg)
+            inputs["ngram_index"] = load_ngram_index(rows)
+    if groups & {"elasticity", "ksweep"}:
+        with METRICS.substep("load_embeddings"):
+            # Embedding arrays cover every scored segment; excluded duplicates get no bin.
+            embedding_bins = inputs["bins"]
+            if embedding_rows is not rows:
+                embedding_bins = labels_for_days(day_codes([r["date"] for r in embedding_rows]), binning, periods)
+                embedding_bins[[is_duplicate(r) for r in embedding_rows]] = None
+            inputs["embeddings"], inputs["embedding_bins"], inputs["embedding_index"] = load_embedding_matrix(
+                embedding_rows, embedding_bins, arrays, embeddings_path
+            )
+    METRICS.count("rows", len(rows))
+    with ExitStack() as stack:
+        if "ksweep" in groups:
+            for stale in KSWEEP_DIR.glob("k*.json"):
+                stale.unlink()
+            if inputs["embeddings"] is not None:
+                # Sweep workers memory-map one copy of the matrix instead of each holding its own.
+                tmp = Path(stack.enter_context(tempfile.TemporaryDirectory(dir=ensure_dir(Path("data")))))
+                np.save(tmp / "embeddings.npy", inputs["embeddings"])
+                inputs["embedding_file"] = tmp / "embeddings.npy"
+        timings = run_tasks(tasks, inputs, workers)
+    # Tasks run in worker processes, so their timings are recorded here rather than inside them.
+    for name, (wall_s, cpu_s) in timings.items():
+        METRICS.record_substep(f"task:{name}", wall_s, cpu_s)
+    return timings
+
+
+def run_tests(
+    config_dir: str,
+    rows: list[dict] | None = None,
+    arrays: dict[str, np.ndarray] | None = None,
+    only: list[str] | None = None,
+    skip: list[str] | None = None,
+    workers: int = 1,
+) -> dict:
+    cfg = load_config_bundle(config_dir)
+    if rows is None:
+        rows = jsonl_read(Path("data/segments") / "segments_scored.jsonl")
+    embeddings_path = model_cache_dir(Path("data/embeddings"), cfg["models"]["embedding"])
+    return run_analyses(rows, cfg["analysis"], only, skip, workers, arrays, embeddings_path)
 
 
 def main() -> None:
@@ -170,14 +439,14 @@ def main() -> None:
     parser.add_argument("--config-dir", default="config")
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these analyses (e.g. keyness trends keyness:2017)")
+    parser.add_argument("--skip", nargs="+", default=None, help="Skip these analyses")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    cfg = load_config_bundle(args.config_dir)
-    rows = jsonl_read(Path("data/segments") / "segments_scored.jsonl")
-    run_keyness(rows, cfg["analysis"])
-    run_trends(rows)
-    run_coupling_tests(rows)
-    run_slogans(rows, cfg["analysis"])
-    run_elasticity(rows, cfg["analysis"])
+    with METRICS.stage("analyze", profile=args.profile):
+        run_tests(args.config_dir, only=args.only, skip=args.skip, workers=args.workers)
+    METRICS.write()
 
 
 if __name__ == "__main__":
@@ -4,14 +4,71 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
-from src.export import build_excerpt_bank
-from src.utils import jsonl_read, jsonl_write
+import numpy as np
 
+from src.binning import binning_config
+from src.embed import EmbeddingEngine
+from src.export import build_excerpt_bank, excerpt_labels, stream_excerpt_bank
+from src.metrics import METRICS
+from src.utils import jsonl_write, load_config_bundle
 
-def export_excerpt_bank() -> None:
-    rows = jsonl_read(Path("data/segments") / "segments_scored.jsonl")
-    excerpt_rows = build_excerpt_bank(rows)
-    jsonl_write(Path("outputs/excerpts") / "excerpt_bank.jsonl", excerpt_rows)
+
+def cached_vectors(model_cfg: dict, data_dir: Path = Path("data")):
+    """Loader of cached segment embeddings; rows of segments missing from the cache are NaN."""
+    engine = EmbeddingEngine(model_cfg, data_dir / "embeddings")
+
+    def load(rows: list[dict]) -> np.ndarray:
+        by_doc: dict[str, list[int]] = {}
+        for pos, row in enumerate(rows):
+            by_doc.setdefault(row["doc_id"], []).append(pos)
+        found: dict[int, np.ndarray] = {}
+        for doc_id, positions in by_doc.items():
+            cached = engine.load_cache(doc_id)
+            if cached is None:
+                continue
+            emb = cached["embeddings"]
+            if emb.dtype == np.int8:
+                emb = engine.codec.reconstruct(emb)
+            where = {segment_id: i for i, segment_id in enumerate(cached["segment_ids"])}
+            for pos in positions:
+                if rows[pos]["segment_id"] in where:
+                    found[pos] = emb[where[rows[pos]["segment_id"]]]
+        METRICS.count("excerpts.uncached_rows", len(rows) - len(found))
+        dim = len(next(iter(found.values()))) if found else 1
+        vectors = np.full((len(rows), dim), np.nan, dtype=np.float32)
+        for pos, vector in found.items():
+            vectors[pos] = vector
+        return vectors
+
+    return load
+
+
+def export_excerpt_bank(config_dir: str = "config", rows: list[dict] | None = None) -> list[dict]:
+    cfg = load_config_bundle(config_dir)
+    analysis_cfg = cfg["analysis"]
+    binning, periods = binning_config(analysis_cfg)
+    export_cfg = analysis_cfg.get("excerpts", {})
+    top_n = int(export_cfg.get("top_n", 5))
+    labels = excerpt_labels(export_cfg)
+    diversity = float(export_cfg.get("diversity", 0.0))
+    options = {
+        "diversity": diversity,
+        "candidate_pool": int(export_cfg.get("candidate_pool", 50)),
+        "load_vectors": cached_vectors(cfg["models"]["embedding"]) if diversity > 0 else None,
+    }
+    with METRICS.substep("select"):
+        if rows is None:
+            excerpt_rows, n_rows = stream_excerpt_bank(
+                Path("data/segments") / "segments_scored.jsonl", top_n, binning, periods, labels, **options
+            )
+        else:
+            excerpt_rows = build_excerpt_bank(rows, top_n, binning, periods, labels, **options)
+            n_rows = len(rows)
+    METRICS.count("rows", n_rows)
+    METRICS.count("excerpts", len(excerpt_rows))
+    with METRICS.substep("write"):
+        jsonl_write(Path("outputs/excerpts") / "excerpt_bank.jsonl", excerpt_rows)
+    return excerpt_rows
 
 
 def main() -> None:
@@ -19,8 +76,11 @@ def main() -> None:
     parser.add_argument("--config-dir", default="config")
     parser.add_argument("--analysis-start", default=None)
     parser.add_argument("--analysis-end", default=None)
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
     args = parser.parse_args()
-    export_excerpt_bank()
+    with METRICS.stage("export", profile=args.profile):
+        export_excerpt_bank(args.config_dir)
+    METRICS.write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+"""Time every pipeline stage on a synthetic corpus served over local HTTP.
+
+Usage::
+
+    python -m benchmarks.run --docs 1000
+    python -m benchmarks.run --docs 1000 --compare benchmarks/baselines/1000.json
+
+Each stage runs as its own process (as in a normal scripted run) so wall time,
+CPU time and peak RSS are measured per stage. Results are written as JSON; a
+previous result passed to ``--compare`` flags stages that got slower or larger.
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+import yaml
+
+from benchmarks.synthetic import generate_site
+from src.pipeline import STAGES
+from src.utils import ensure_dir, load_yaml, save_json
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@contextmanager
+def serve_directory(root: Path) -> Iterator[str]:
+    """Serve ``root`` on an ephemeral localhost port; yields the base URL."""
+    handler = functools.partial(_QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def write_config(config_dir: Path, sources: Dict[str, Any], dim: int) -> None:
+    ensure_dir(config_dir)
+    for name in ["axes.yaml", "slogans_curated.txt", "stoplist_slogans.txt"]:
+        shutil.copy(REPO_ROOT / "config" / name, config_dir / name)
+    analysis = load_yaml(REPO_ROOT / "config" / "analysis.yaml")
+    analysis["sample_mode"] = False
+    analysis["slogans"]["stoplist_path"] = str(config_dir / "stoplist_slogans.txt")
+    analysis["slogans"]["curated_path"] = str(config_dir / "slogans_curated.txt")
+    analysis["cluster"]["k"] = 8
+    models = load_yaml(REPO_ROOT / "config" / "models.yaml")
+    models["embedding"].update({"backend": "hashing", "dim": dim})
+    for name, data in [("analysis.yaml", analysis), ("models.yaml", models), ("sources.yaml", sources)]:
+        (config_dir / name).write_text(yaml.safe_dump(data, allow_unicode=True, sort_keys=False), encoding="utf-8")
+
+
+def count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def count_segments(path: Path) -> int:
+    if not path.exists():
+        return 0
+    total = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            total += len(json.loads(line)["segments"])
+    return total
+
+
+def run_stage(script: str, workdir: Path) -> Dict[str, float]:
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), PYTHONUTF8="1")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / script), "--config-dir", "config"],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script} exited with status {proc.returncode}")
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "wall_s": wall,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss * rss_scale / 2**20,
+    }
+
+
+def run_benchmark(n_docs: int, seed: int, workdir: Path, dim: int) -> Dict[str, Any]:
+    site_dir = ensure_dir(workdir / "site")
+    results: Dict[str, Any] = {
+        "meta": {
+            "n_docs": n_docs,
+            "seed": seed,
+            "embedding_dim": dim,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": {},
+    }
+    with serve_directory(site_dir) as base_url:
+        started = time.perf_counter()
+        sources = generate_site(site_dir, base_url, n_docs, seed)
+        results["meta"]["generate_s"] = time.perf_counter() - started
+        write_config(workdir / "config", sources, dim)
+        for name, script in STAGES:
+            stats = run_stage(script, workdir)
+            docs = count_lines(workdir / "data/parsed/docs.jsonl")
+            segments = count_segments(workdir / "data/segments/segments.jsonl")
+            stats["docs"] = docs
+            stats["docs_per_s"] = docs / stats["wall_s"] if stats["wall_s"] else 0.0
+            if name != "collect":
+                stats["segments"] = segments
+                stats["segments_per_s"] = segments / stats["wall_s"] if stats["wall_s"] else 0.0
+            results["stages"][name] = stats
+            print(
+                f"[bench] {name}: {stats['wall_s']:.2f}s wall, {stats['cpu_s']:.2f}s cpu, "
+                f"{stats['peak_rss_mb']:.0f} MiB peak, {stats['docs_per_s']:.1f} docs/s"
+            )
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> list[str]:
+    regressions = []
+    for name, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        for metric in ["wall_s", "peak_rss_mb"]:
+            if base.get(metric) and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {base[metric]:.2f} -> {stats[metric]:.2f} ({stats[metric] / base[metric]:.2f}x)")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--docs", type=int, default=100, help="Synthetic documents to generate (100 to 100000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension of the hashing encoder")
+    parser.add_argument("--output", default=None, help="Result JSON (default: benchmarks/results/bench_<docs>.json)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--workdir", default=None, help="Keep the generated corpus and outputs here")
+    args = parser.parse_args()
+
+    if args.workdir:
+        workdir = ensure_dir(args.workdir)
+        results = run_benchmark(args.docs, args.seed, workdir, args.dim)
+    else:
+        with tempfile.TemporaryDirectory(prefix="fp-bench-") as tmp:
+            results = run_benchmark(args.docs, args.seed, Path(tmp), args.dim)
+    output = Path(args.output or REPO_ROOT / "benchmarks" / "results" / f"bench_{args.docs}.json")
+    save_json(output, results)
+    print(f"[bench] wrote {output}")
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            print(f"[bench] REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
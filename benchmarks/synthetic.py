@@ -0,0 +1,151 @@
+"""Deterministic synthetic corpus shaped like the live sources.
+
+``generate_site`` writes an MFA-style listing (``index.shtml``, ``index_{page}.shtml``),
+Q&A presser pages and party-report pages into a directory tree that a local HTTP
+server can serve, and returns the ``sources.yaml`` entries pointing at it.
+"""
+from __future__ import annotations
+
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+from src.utils import ensure_dir
+
+LISTING_PATH = "web/wjdt_674879/fyrbt_674889"
+LINKS_PER_PAGE = 20
+
+PHRASES = [
+    "推动构建人类命运共同体",
+    "坚持多边主义",
+    "维护以联合国为核心的国际体系",
+    "深化对外交流合作",
+    "推动共建一带一路高质量发展",
+    "维护国家主权安全发展利益",
+    "坚持总体国家安全观",
+    "反对外部干涉",
+    "防范化解重大风险",
+    "高质量发展",
+    "扩大内需",
+    "推进绿色低碳发展",
+    "中方对此表示严重关切",
+    "我们注意到有关报道",
+    "双方就共同关心的问题交换了意见",
+    "中方愿同各方一道",
+    "这一立场是一贯的明确的",
+    "有关国家应当停止错误做法",
+]
+OPENINGS = [
+    "今天的记者会开始之前，我先发布一条消息。",
+    "下面，我愿回答大家的提问。",
+]
+NAV = ["首页", "外交部", "新闻", "发言人表态", "部长", "政策文件", "国家和组织", "领事服务"]
+FOOTER = "版权所有 中华人民共和国外交部 网站标识码 京ICP备"
+
+
+def _sentence(rng: random.Random) -> str:
+    return "，".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4))) + "。"
+
+
+def _paragraph(rng: random.Random) -> str:
+    return "".join(_sentence(rng) for _ in range(rng.randint(1, 5)))
+
+
+def _presser_html(rng: random.Random, day: date) -> str:
+    title = f"{day.year}年{day.month}月{day.day}日外交部发言人主持例行记者会"
+    nav = "".join(f'<li><a href="/nav/{i}.shtml">{item}</a></li>' for i, item in enumerate(NAV))
+    turns = [f"<p>{rng.choice(OPENINGS)}</p>"]
+    for _ in range(rng.randint(3, 12)):
+        turns.append(f"<p>问：{_sentence(rng)}</p>")
+        turns.append(f"<p>答：{_paragraph(rng)}</p>")
+    related = "".join(f'<li><a href="/rel/{rng.randint(0, 10**6)}.shtml">{_sentence(rng)}</a></li>' for _ in range(4))
+    return (
+        f"<html><head><title>{title}</title></head><body>"
+        f'<div class="nav"><ul>{nav}</ul></div>'
+        f'<div class="content"><h1>{title}</h1>{"".join(turns)}</div>'
+        f'<div class="related"><ul>{related}</ul></div>'
+        f'<div class="footer"><p>{FOOTER}</p></div>'
+        "</body></html>"
+    )
+
+
+def _party_html(rng: random.Random, idx: int) -> str:
+    numerals = "一二三四五六七八九十"
+    parts = []
+    for section in range(rng.randint(4, 10)):
+        parts.append(f"<h2>第{numerals[section % 10]}部分</h2>")
+        parts.extend(f"<p>{_paragraph(rng)}</p>" for _ in range(rng.randint(5, 20)))
+    return f"<html><head><title>报告{idx}</title></head><body>{''.join(parts)}</body></html>"
+
+
+def _listing_html(entries: List[tuple[str, str, str]]) -> str:
+    items = "".join(f'<li><a href="{href}">{title}</a><span>{day}</span></li>' for href, title, day in entries)
+    return f'<html><body><div class="newsList"><ul class="list1">{items}</ul></div></body></html>'
+
+
+def generate_site(
+    site_dir: Path,
+    base_url: str,
+    n_docs: int,
+    seed: int = 0,
+    start: str = "2012-01-01",
+    end: str = "2025-12-31",
+    party_share: float = 0.01,
+) -> Dict[str, Any]:
+    """Write ``n_docs`` documents under ``site_dir``; returns a sources config for them."""
+    n_party = max(1, int(n_docs * party_share))
+    n_mfa = max(1, n_docs - n_party)
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    span = (last - first).days
+    days = sorted((first + timedelta(days=int(i * span / max(1, n_mfa - 1))) for i in range(n_mfa)), reverse=True)
+
+    listing_dir = ensure_dir(site_dir / LISTING_PATH)
+    entries = []
+    for idx, day in enumerate(days):
+        month_dir = ensure_dir(listing_dir / day.strftime("%Y%m"))
+        name = f"t{day.strftime('%Y%m%d')}_{idx}.shtml"
+        (month_dir / name).write_text(_presser_html(random.Random(seed * 1_000_003 + idx), day), encoding="utf-8")
+        entries.append((f"{day.strftime('%Y%m')}/{name}", "外交部发言人主持例行记者会", day.isoformat()))
+    pages = [entries[i : i + LINKS_PER_PAGE] for i in range(0, len(entries), LINKS_PER_PAGE)]
+    for page, chunk in enumerate(pages):
+        filename = "index.shtml" if page == 0 else f"index_{page}.shtml"
+        (listing_dir / filename).write_text(_listing_html(chunk), encoding="utf-8")
+
+    party_dir = ensure_dir(site_dir / "party")
+    party_docs = []
+    for idx in range(n_party):
+        day = first + timedelta(days=int((idx + 0.5) * span / n_party))
+        (party_dir / f"report_{idx}.html").write_text(_party_html(random.Random(seed + 7919 * idx), idx), encoding="utf-8")
+        party_docs.append(
+            {
+                "doc_id": f"party_report_{idx}",
+                "date": day.isoformat(),
+                "title": f"报告{idx}",
+                "canonical_url": f"{base_url}/party/report_{idx}.html",
+            }
+        )
+    return {
+        "party_reports": {
+            "source_type": "party_report",
+            "source_org": "cpc",
+            "language": "zh",
+            "docs": party_docs,
+        },
+        "mfa_pressers": {
+            "source_type": "mfa_presser",
+            "source_org": "mfa",
+            "language": "zh",
+            "max_docs": None,
+            "max_docs_per_year": None,
+            "max_pages": len(pages) + 1,
+            "link_patterns": ["/fyrbt_674889/"],
+            "listing_bases": [
+                {
+                    "base": f"{base_url}/{LISTING_PATH}/",
+                    "first_page": "index.shtml",
+                    "page_pattern": "index_{page}.shtml",
+                }
+            ],
+        },
+    }
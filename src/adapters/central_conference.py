@@ -3,10 +3,8 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Any, Dict, List
 
-import requests
-from bs4 import BeautifulSoup
-
-from src.utils import ensure_dir, normalize_ws, sha1_text
+from src.metrics import METRICS
+from src.utils import atomic_write_text, ensure_dir, normalize_ws, sha1_text
 
 
 class CentralConferenceAdapter:
@@ -45,14 +43,21 @@ class CentralConferenceAdapter:
     def fetch(self, url: str, force: bool = False) -> str:
         cache_path = self.cache_dir / f"{sha1_text(url)}.html"
         if cache_path.exists() and not force:
+            METRICS.count("http.cache.hit")
             return cache_path.read_text(encoding="utf-8")
+        import requests
+
+        METRICS.count("http.cache.miss")
         resp = requests.get(url, timeout=30)
+        METRICS.count("http.bytes_fetched", len(resp.content))
         resp.raise_for_status()
         html = resp.text
-        cache_path.write_text(html, encoding="utf-8")
+        atomic_write_text(cache_path, html)
         return html
 
     def parse(self, raw: str) -> Dict[str, Any]:
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(raw, "lxml")
         title = normalize_ws(soup.title.get_text()) if soup.title else ""
         paragraphs = [normalize_ws(p.get_text(" ")) for p in soup.find_all("p") if normalize_ws(p.get_text(" "))]
@@ -3,18 +3,21 @@ from __future__ import annotations
 import re
 import random
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List
 from urllib.parse import urljoin
 
-import chardet
-import requests
-from bs4 import BeautifulSoup
+from src.extract import extract_main_content, page_lines
+from src.metrics import METRICS
+from src.utils import atomic_write_text, ensure_dir, normalize_ws, sha1_text
 
-from src.utils import ensure_dir, normalize_ws, sha1_text
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 QA_Q_RE = re.compile(r"^(?:问|记者(?:问|提问)?)[:：]?\s*")
 QA_A_RE = re.compile(r"^(?:答|发言人(?:答)?)[:：]?\s*")
+# Article containers used by mfa.gov.cn / fmprc.gov.cn presser pages, tried before density scoring.
+DEFAULT_CONTENT_SELECTORS = ["#News_Body_Txt_A", ".TRS_Editor", "#content", "div.content", ".news-main"]
 
 
 class MFAPressersAdapter:
@@ -145,8 +148,14 @@ class MFAPressersAdapter:
     def fetch(self, url: str, force: bool = False, allow_404: bool = False) -> str:
         cache_path = self.cache_dir / f"{sha1_text(url)}.html"
         if cache_path.exists() and not force:
+            METRICS.count("http.cache.hit")
             return self._read_with_encoding_detection(cache_path)
+        import chardet
+        import requests
+
+        METRICS.count("http.cache.miss")
         resp = requests.get(url, timeout=30)
+        METRICS.count("http.bytes_fetched", len(resp.content))
         if allow_404 and resp.status_code == 404:
             return ""
         resp.raise_for_status()
@@ -156,10 +165,12 @@ class MFAPressersAdapter:
             html = resp.content.decode(encoding)
         except (UnicodeDecodeError, LookupError):
             html = resp.text
-        cache_path.write_text(html, encoding="utf-8")
+        atomic_write_text(cache_path, html)
         return html
 
     def _read_with_encoding_detection(self, path: Path) -> str:
+        import chardet
+
         raw_bytes = path.read_bytes()
         detected = chardet.detect(raw_bytes)
         encoding = detected.get("encoding") or "utf-8"
@@ -169,15 +180,27 @@ class MFAPressersAdapter:
             return raw_bytes.decode("utf-8", errors="replace")
 
     def parse(self, raw: str) -> Dict[str, Any]:
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(raw, "lxml")
         title = normalize_ws(soup.title.get_text()) if soup.title else ""
-        content = soup.get_text("\n")
-        text = "\n".join([normalize_ws(line) for line in content.split("\n") if normalize_ws(line)])
+        full_text = "\n".join(page_lines(soup.get_text("\n")))
+        extraction = self.config.get("extraction") or {}
+        if extraction.get("enabled", True):
+            text, info = extract_main_content(
+                soup,
+                extraction.get("selectors", DEFAULT_CONTENT_SELECTORS),
+                extraction.get("min_chars", 50),
+                extraction.get("max_link_density", 0.5),
+            )
+        else:
+            text, info = full_text, {"method": "full_page"}
         return {
             "title": title,
             "date": "",
             "text": text,
-            "metadata": {},
+            "full_text": full_text,
+            "metadata": {"extraction": info},
         }
 
     def segment(self, text: str) -> List[Dict[str, Any]]:
@@ -247,6 +270,8 @@ class MFAPressersAdapter:
         link_patterns: List[str],
         seen_urls: set[str],
     ) -> List[Dict[str, Any]]:
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(html, "lxml")
         docs: List[Dict[str, Any]] = []
         for link in self._candidate_links(soup):
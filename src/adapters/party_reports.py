@@ -4,11 +4,8 @@ import re
 from pathlib import Path
 from typing import Any, Dict, List
 
-import chardet
-import requests
-from bs4 import BeautifulSoup
-
-from src.utils import ensure_dir, normalize_ws, sha1_text
+from src.metrics import METRICS
+from src.utils import atomic_write_text, ensure_dir, normalize_ws, sha1_text
 
 
 class PartyReportsAdapter:
@@ -47,8 +44,14 @@ class PartyReportsAdapter:
     def fetch(self, url: str, force: bool = False) -> str:
         cache_path = self.cache_dir / f"{sha1_text(url)}.html"
         if cache_path.exists() and not force:
+            METRICS.count("http.cache.hit")
             return self._read_with_encoding_detection(cache_path)
+        import chardet
+        import requests
+
+        METRICS.count("http.cache.miss")
         resp = requests.get(url, timeout=30)
+        METRICS.count("http.bytes_fetched", len(resp.content))
         resp.raise_for_status()
         # Detect encoding from response content
         detected = chardet.detect(resp.content)
@@ -57,11 +60,13 @@ class PartyReportsAdapter:
             html = resp.content.decode(encoding)
         except (UnicodeDecodeError, LookupError):
             html = resp.text
-        cache_path.write_text(html, encoding="utf-8")
+        atomic_write_text(cache_path, html)
         return html
 
     def _read_with_encoding_detection(self, path: Path) -> str:
         """Read HTML file, detecting encoding from content."""
+        import chardet
+
         raw_bytes = path.read_bytes()
         detected = chardet.detect(raw_bytes)
         encoding = detected.get('encoding') or 'utf-8'
@@ -71,6 +76,8 @@ class PartyReportsAdapter:
             return raw_bytes.decode('utf-8', errors='replace')
 
     def parse(self, raw: str) -> Dict[str, Any]:
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(raw, "lxml")
         title = normalize_ws(soup.title.get_text()) if soup.title else ""
         paragraphs = []
@@ -0,0 +1,341 @@
+"""On-disk IVF nearest-neighbour index over cached segment embeddings.
+
+The index lives in ``data/index/``. Spherical k-means centroids (``nlist`` of
+them, trained on a sample) partition the unit-normalised segment vectors; each
+vector is stored once as float16 in an append-only ``vectors.f16`` file together
+with a fixed-width row record (inverted list, day code, source, segment and
+document id). A query scores the centroids, gathers the rows of the ``nprobe``
+best lists, applies date and source filters on the row records, and ranks the
+survivors by inner product; metadata and current axis scores are then read from
+``segments_scored.jsonl`` by byte offset, for the winners only.
+
+``update`` appends documents that are not indexed yet (int8 caches are
+reconstructed through the codec first), so the index grows with the corpus;
+``build`` retrains the centroids from scratch. Rows are only counted once
+``index.json`` is rewritten, so an interrupted update leaves the index as it was.
+
+    python -m src.ann update
+    python -m src.ann query "坚决反对单边主义" -k 10 --start 2018-01-01 --source-type mfa_presser
+    python -m src.ann query --like 3f2a9c0d1e4b5a67
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.binning import NAT, day_codes
+from src.metrics import METRICS
+from src.utils import atomic_write_text, ensure_dir, load_config_bundle, load_json
+
+INDEX_DIR = Path("data/index")
+ROW_DTYPE = np.dtype([("list", "<i4"), ("day", "<i8"), ("source", "<i2"), ("segment_id", "S16"), ("doc_id", "S16")])
+
+
+def index_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"nlist": None, "nprobe": 8, "train_sample": 20000, "auto_update": False, "seed": 42}
+    cfg.update(analysis_cfg.get("index") or {})
+    return cfg
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], block):
+        out[start : start + block] = np.argmax(vectors[start : start + block] @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(sample: np.ndarray, nlist: int, iters: int = 10, seed: int = 42) -> np.ndarray:
+    """Spherical k-means: centroids are unit vectors, assignment by largest inner product."""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, sample.shape[0]))
+    centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def scored_offsets(scored_path: Path) -> Dict[str, int]:
+    """Byte offset of each segment's line in ``segments_scored.jsonl``."""
+    offsets: Dict[str, int] = {}
+    if not scored_path.exists():
+        return offsets
+    with open(scored_path, "rb") as f:
+        offset = 0
+        for line in f:
+            offsets[json.loads(line)["segment_id"]] = offset
+            offset += len(line)
+    return offsets
+
+
+class IVFIndex:
+    def __init__(self, path: Path = INDEX_DIR):
+        self.path = Path(path)
+        self.info = load_json(self.path / "index.json")
+        self.n = int(self.info["rows"])
+        dim = int(self.info["dim"])
+        self.centroids = np.load(self.path / "centroids.npy")
+        self.vectors = np.zeros((0, dim), dtype=np.float16)
+        if self.n:
+            self.vectors = np.memmap(self.path / "vectors.f16", dtype=np.float16, mode="r", shape=(self.n, dim))
+        self.rows = np.fromfile(self.path / "rows.bin", dtype=ROW_DTYPE, count=self.n)
+        self.order = np.argsort(self.rows["list"], kind="stable")
+        self.bounds = np.searchsorted(self.rows["list"][self.order], np.arange(len(self.centroids) + 1))
+        offsets_path = self.path / "scored_offsets.npy"
+        self.offsets = np.load(offsets_path) if offsets_path.exists() else np.full(self.n, -1, dtype=np.int64)
+
+    def row_of(self, segment_id: str) -> int | None:
+        hits = np.flatnonzero(self.rows["segment_id"] == segment_id.encode())
+        return int(hits[0]) if hits.size else None
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        nprobe: int = 8,
+        start: str | None = None,
+        end: str | None = None,
+        source_types: List[str] | None = None,
+    ) -> List[Tuple[int, float]]:
+        """``(row, similarity)`` for the top ``k`` rows in the ``nprobe`` nearest lists that pass the filters."""
+        query = normalize_rows(query.reshape(1, -1))[0]
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.order[self.bounds[i] : self.bounds[i + 1]] for i in lists])
+        rows = self.rows[candidates]
+        keep = np.ones(candidates.size, dtype=bool)
+        if start:
+            keep &= (rows["day"] != NAT) & (rows["day"] >= day_codes([start])[0])
+        if end:
+            keep &= (rows["day"] != NAT) & (rows["day"] <= day_codes([end])[0])
+        if source_types:
+            names = self.info["sources"]
+            keep &= np.isin(rows["source"], [names.index(s) for s in source_types if s in names])
+        candidates = np.sort(candidates[keep])
+        if candidates.size == 0:
+            return []
+        sims = self.vectors[candidates].astype(np.float32) @ query
+        top = np.argpartition(-sims, min(k, sims.size) - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(int(candidates[i]), float(sims[i])) for i in top]
+
+    def records(self, hits: List[Tuple[int, float]], scored_path: Path) -> Iterator[Dict[str, Any]]:
+        with open(scored_path, "rb") as f:
+            for rank, (row, sim) in enumerate(hits, start=1):
+                record = {"rank": rank, "similarity": round(sim, 4), "segment_id": self.rows["segment_id"][row].decode()}
+                if self.offsets[row] >= 0:
+                    f.seek(int(self.offsets[row]))
+                    scored = json.loads(f.readline())
+                    record.update({key: scored.get(key) for key in ["doc_id", "date", "source_type", "title", "url", "text", "scores"]})
+                yield record
+
+
+def _write_info(path: Path, info: Dict[str, Any]) -> None:
+    atomic_write_text(path / "index.json", json.dumps(info, ensure_ascii=False, indent=2))
+
+
+def _doc_vectors(embedder: Any, doc_id: str, segment_ids: List[str], arrays: Dict[str, np.ndarray]) -> np.ndarray | None:
+    emb = arrays.get(doc_id)
+    if emb is None:
+        cached = embedder.load_cache(doc_id)
+        if cached is None or cached["segment_ids"] != segment_ids:
+            return None
+        emb = cached["embeddings"]
+    if len(emb) != len(segment_ids):
+        return None
+    if emb.dtype == np.int8:
+        return normalize_rows(embedder.codec.reconstruct(emb))
+    return normalize_rows(emb)
+
+
+def _scored_docs(scored_path: Path) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Non-heading rows of ``segments_scored.jsonl`` grouped by document, in file order."""
+    doc_id, rows = None, []
+    with open(scored_path, "r", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if row["segment_type"] == "heading":
+                continue
+            if row["doc_id"] != doc_id and rows:
+                yield doc_id, rows
+                rows = []
+            doc_id = row["doc_id"]
+            rows.append({key: row[key] for key in ["segment_id", "date", "source_type"]})
+    if rows:
+        yield doc_id, rows
+
+
+def update_index(
+    config_dir: str,
+    data_dir: Path = Path("data"),
+    index_dir: Path = INDEX_DIR,
+    embedder: Any = None,
+    arrays: Dict[str, np.ndarray] | None = None,
+    rebuild: bool = False,
+    nlist: int | None = None,
+) -> Dict[str, int]:
+    """Append scored documents missing from the index (training centroids first if it is new)."""
+    cfg = load_config_bundle(config_dir)
+    idx_cfg = index_config(cfg["analysis"])
+    model_cfg = cfg["models"]["embedding"]
+    if embedder is None:
+        from src.embed import EmbeddingEngine
+
+        embedder = EmbeddingEngine(model_cfg, data_dir / "embeddings")
+    arrays = arrays or {}
+    scored_path = data_dir / "segments" / "segments_scored.jsonl"
+    if rebuild and index_dir.exists():
+        shutil.rmtree(index_dir)
+    ensure_dir(index_dir)
+    info_path = index_dir / "index.json"
+    info = load_json(info_path) if info_path.exists() else None
+    built_for = (model_cfg["model_name"], embedder.namespace)
+    if info is not None and (info["model_name"], info.get("namespace", embedder.namespace)) != built_for:
+        raise ValueError(
+            f"Index was built for {info.get('namespace', info['model_name'])}; run `python -m src.ann build` to rebuild it"
+        )
+    indexed = set()
+    if info is not None:
+        indexed = {d.decode() for d in np.fromfile(index_dir / "rows.bin", dtype=ROW_DTYPE, count=info["rows"])["doc_id"]}
+
+    pending: List[Tuple[str, List[Dict[str, Any]], np.ndarray]] = []
+    skipped = 0
+    with METRICS.substep("index_load_vectors"):
+        for doc_id, rows in _scored_docs(scored_path):
+            if doc_id in indexed:
+                continue
+            vectors = _doc_vectors(embedder, doc_id, [r["segment_id"] for r in rows], arrays)
+            if vectors is None:
+                skipped += 1
+                continue
+            pending.append((doc_id, rows, vectors))
+
+    if info is None:
+        if not pending:
+            return {"added": 0, "rows": 0, "skipped_docs": skipped}
+        sample = np.concatenate([v for _, _, v in pending])
+        if sample.shape[0] > idx_cfg["train_sample"]:
+            picks = np.random.default_rng(idx_cfg["seed"]).choice(sample.shape[0], idx_cfg["train_sample"], replace=False)
+            sample = sample[picks]
+        total = sum(len(r) for _, r, _ in pending)
+        lists = nlist or idx_cfg["nlist"] or max(1, int(4 * np.sqrt(total)))
+        with METRICS.substep("index_train"):
+            centroids = train_centroids(sample, lists, seed=idx_cfg["seed"])
+        np.save(index_dir / "centroids.npy", centroids)
+        info = {
+            "model_name": model_cfg["model_name"],
+            "namespace": embedder.namespace,
+            "dim": int(sample.shape[1]),
+            "nlist": len(centroids),
+            "rows": 0,
+            "sources": [],
+        }
+        for name in ["vectors.f16", "rows.bin"]:
+            (index_dir / name).write_bytes(b"")
+    centroids = np.load(index_dir / "centroids.npy")
+
+    added = 0
+    with METRICS.substep("index_append"), open(index_dir / "vectors.f16", "r+b") as vec_f, open(index_dir / "rows.bin", "r+b") as row_f:
+        # Drop bytes past the committed row count left by an interrupted update.
+        vec_f.truncate(info["rows"] * info["dim"] * 2)
+        row_f.truncate(info["rows"] * ROW_DTYPE.itemsize)
+        vec_f.seek(0, 2)
+        row_f.seek(0, 2)
+        for doc_id, rows, vectors in pending:
+            records = np.zeros(len(rows), dtype=ROW_DTYPE)
+            records["list"] = assign_lists(vectors, centroids)
+            records["day"] = day_codes([r["date"] for r in rows])
+            for r in rows:
+                if r["source_type"] not in info["sources"]:
+                    info["sources"].append(r["source_type"])
+            records["source"] = [info["sources"].index(r["source_type"]) for r in rows]
+            records["segment_id"] = [r["segment_id"] for r in rows]
+            records["doc_id"] = doc_id
+            vectors.astype(np.float16).tofile(vec_f)
+            records.tofile(row_f)
+            added += len(rows)
+    info["rows"] += added
+    _write_info(index_dir, info)
+
+    with METRICS.substep("index_offsets"):
+        offsets = scored_offsets(scored_path)
+        segment_ids = np.fromfile(index_dir / "rows.bin", dtype=ROW_DTYPE, count=info["rows"])["segment_id"]
+        np.save(index_dir / "scored_offsets.npy", np.array([offsets.get(s.decode(), -1) for s in segment_ids], dtype=np.int64))
+    METRICS.count("index.rows_added", added)
+    return {"added": added, "rows": info["rows"], "skipped_docs": skipped}
+
+
+def print_records(records: List[Dict[str, Any]]) -> None:
+    for rec in records:
+        scores = rec.get("scores") or {}
+        axes = " ".join(f"{name.split('_')[0]}={scores[name]:+.3f}" for name in ["security_axis", "growth_axis", "outward_axis"] if name in scores)
+        print(f"{rec['rank']:>3} {rec['similarity']:.4f} {rec.get('date') or '':10} {rec.get('source_type') or '':12} {rec['segment_id']} {axes}")
+        print(f"    {(rec.get('text') or '')[:120]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.ann")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Train centroids and index every scored segment from scratch")
+    build.add_argument("--nlist", type=int, default=None, help="Inverted lists (default: index.nlist or 4*sqrt(rows))")
+    sub.add_parser("update", help="Append documents that are not indexed yet")
+    query = sub.add_parser("query", help="Top-k segments most similar to a text or to an indexed segment")
+    query.add_argument("text", nargs="?", default=None)
+    query.add_argument("--like", default=None, help="Use the stored vector of this segment_id as the query")
+    query.add_argument("-k", type=int, default=10)
+    query.add_argument("--nprobe", type=int, default=None, help="Lists to scan (default: index.nprobe; nlist = exact)")
+    query.add_argument("--start", default=None, help="Earliest date (YYYY-MM-DD)")
+    query.add_argument("--end", default=None, help="Latest date (YYYY-MM-DD)")
+    query.add_argument("--source-type", nargs="+", default=None)
+    query.add_argument("--json", action="store_true", help="Print JSON lines instead of a table")
+    args = parser.parse_args()
+
+    if args.command in ("build", "update"):
+        stats = update_index(args.config_dir, rebuild=args.command == "build", nlist=getattr(args, "nlist", None))
+        print("[index] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+        return
+    if (args.text is None) == (args.like is None):
+        parser.error("query needs either a text or --like SEGMENT_ID")
+    cfg = load_config_bundle(args.config_dir)
+    index = IVFIndex()
+    if args.like:
+        row = index.row_of(args.like)
+        if row is None:
+            parser.error(f"segment {args.like} is not in the index")
+        vector = index.vectors[row].astype(np.float32)
+    else:
+        from src.embed import EmbeddingEngine
+
+        vector = EmbeddingEngine(cfg["models"]["embedding"], Path("data/embeddings")).embed_texts([args.text])[0]
+    started = time.perf_counter()
+    nprobe = args.nprobe or index_config(cfg["analysis"])["nprobe"]
+    hits = index.search(vector, args.k, nprobe, args.start, args.end, args.source_type)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    records = list(index.records(hits, Path("data/segments/segments_scored.jsonl")))
+    if args.json:
+        for rec in records:
+            print(json.dumps(rec, ensure_ascii=False))
+    else:
+        print_records(records)
+        print(f"[index] {len(records)} hits from {index.n} rows in {elapsed_ms:.1f} ms (nprobe={nprobe}/{len(index.centroids)})")
+
+
+if __name__ == "__main__":
+    main()
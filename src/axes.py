@@ -5,6 +5,7 @@ from typing import Any, Dict, List
 import numpy as np
 
 from src.embed import EmbeddingEngine
+from src.quantize import EmbeddingCodec
 
 
 def build_axis_vectors(axes_cfg: Dict[str, Any], embedder: EmbeddingEngine) -> Dict[str, np.ndarray]:
@@ -18,9 +19,15 @@ def build_axis_vectors(axes_cfg: Dict[str, Any], embedder: EmbeddingEngine) -> D
     return axes
 
 
-def score_segments(embeddings: np.ndarray, axes: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+def score_segments(
+    embeddings: np.ndarray, axes: Dict[str, np.ndarray], codec: EmbeddingCodec | None = None
+) -> Dict[str, np.ndarray]:
+    """Dot products with each axis; int8 codes are scored through ``codec`` without decoding."""
     scores = {}
     for name, axis_vec in axes.items():
-        scores[name] = embeddings @ axis_vec
+        if embeddings.dtype == np.int8:
+            scores[name] = codec.scores(embeddings, axis_vec)
+        else:
+            scores[name] = embeddings @ axis_vec
     return scores
 
@@ -0,0 +1,128 @@
+"""Time binning and the per-day sufficient-statistics cube.
+
+Segments get an integer day code once (``day_codes``). ``build_cube`` aggregates
+rows into counts, weighted sums, sums of squares and cross-products per
+(day, source_type, is_outward); ``rollup`` turns that cube into any binning
+(monthly, quarterly, yearly or custom periods) without revisiting the rows.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+BINNINGS = ("daily", "monthly", "quarterly", "yearly", "custom")
+AXES = {"security": "security_axis", "growth": "growth_axis", "outward": "outward_axis"}
+CROSS = [("outward", "security"), ("outward", "growth"), ("security", "growth")]
+CUBE_KEYS = ["day", "source_type", "is_outward"]
+NAT = np.iinfo(np.int64).min
+
+
+def quarterly_bin(date_str: str) -> str:
+    month = int(date_str[5:7])
+    quarter = (month - 1) // 3 + 1
+    return f"{date_str[:4]}-Q{quarter}"
+
+
+def binning_config(analysis_cfg: Dict[str, Any]) -> tuple[str, List[Dict[str, str]]]:
+    binning = analysis_cfg.get("binning", "quarterly")
+    if binning not in BINNINGS:
+        raise ValueError(f"Unknown binning {binning!r}; choose from {BINNINGS}")
+    return binning, analysis_cfg.get("periods") or []
+
+
+def day_codes(dates: Sequence[str]) -> np.ndarray:
+    """Days since 1970-01-01 for ISO dates; missing or empty dates map to ``NAT``."""
+    return np.array([d or "NaT" for d in dates], dtype="datetime64[D]").astype(np.int64)
+
+
+def labels_for_days(days: np.ndarray, binning: str, periods: List[Dict[str, str]] | None = None) -> np.ndarray:
+    """Bin label per day code; days outside every custom period (or missing) get ``None``."""
+    days = np.asarray(days, dtype=np.int64)
+    unique, inverse = np.unique(days, return_inverse=True)
+    valid = unique != NAT
+    dt = unique[valid].astype("datetime64[D]")
+    labels = np.full(unique.shape, None, dtype=object)
+    if binning == "custom":
+        bounds = [
+            (np.datetime64(p["start"], "D"), np.datetime64(p["end"], "D"), p["name"]) for p in (periods or [])
+        ]
+        out = np.full(dt.shape, None, dtype=object)
+        assigned = np.zeros(dt.shape, dtype=bool)
+        for start, end, name in bounds:
+            hit = (dt >= start) & (dt <= end) & ~assigned
+            out[hit] = name
+            assigned |= hit
+        labels[valid] = out
+    else:
+        years = dt.astype("datetime64[Y]").astype(int) + 1970
+        months = dt.astype("datetime64[M]").astype(int) % 12 + 1
+        if binning == "daily":
+            labels[valid] = dt.astype(str)
+        elif binning == "monthly":
+            labels[valid] = [f"{y}-{m:02d}" for y, m in zip(years, months)]
+        elif binning == "quarterly":
+            labels[valid] = [f"{y}-Q{(m - 1) // 3 + 1}" for y, m in zip(years, months)]
+        elif binning == "yearly":
+            labels[valid] = years.astype(str)
+        else:
+            raise ValueError(f"Unknown binning {binning!r}; choose from {BINNINGS}")
+    return labels[inverse]
+
+
+def bin_label(date_str: str, binning: str, periods: List[Dict[str, str]] | None = None) -> str | None:
+    return labels_for_days(day_codes([date_str]), binning, periods)[0]
+
+
+def row_bins(rows: List[Dict[str, Any]], binning: str, periods: List[Dict[str, str]] | None = None) -> np.ndarray:
+    return labels_for_days(day_codes([r["date"] for r in rows]), binning, periods)
+
+
+def stat_columns() -> List[str]:
+    cols = ["n", "w"]
+    for name in AXES:
+        cols += [f"sum_{name}", f"wsum_{name}", f"sq_{name}"]
+    cols += [f"cross_{a}_{b}" for a, b in CROSS]
+    return cols
+
+
+def build_cube(rows: List[Dict[str, Any]], days: np.ndarray | None = None) -> pd.DataFrame:
+    """Sufficient statistics per (day, source_type, is_outward)."""
+    if not rows:
+        return pd.DataFrame(columns=CUBE_KEYS + stat_columns())
+    if days is None:
+        days = day_codes([r["date"] for r in rows])
+    w = np.array([r["char_len"] for r in rows], dtype=float)
+    frame: Dict[str, Any] = {
+        "day": days,
+        "source_type": [r["source_type"] for r in rows],
+        "is_outward": [bool(r["scores"].get("is_outward", False)) for r in rows],
+        "n": np.ones(len(rows)),
+        "w": w,
+    }
+    values = {name: np.array([r["scores"].get(key, 0.0) for r in rows], dtype=float) for name, key in AXES.items()}
+    for name, x in values.items():
+        frame[f"sum_{name}"] = x
+        frame[f"wsum_{name}"] = w * x
+        frame[f"sq_{name}"] = x * x
+    for a, b in CROSS:
+        frame[f"cross_{a}_{b}"] = values[a] * values[b]
+    df = pd.DataFrame(frame)
+    df = df[df["day"] != NAT]
+    return df.groupby(CUBE_KEYS, as_index=False, sort=True).sum()
+
+
+def rollup(
+    cube: pd.DataFrame,
+    binning: str,
+    periods: List[Dict[str, str]] | None = None,
+    by: Sequence[str] = ("source_type", "is_outward"),
+) -> pd.DataFrame:
+    """Aggregate the cube to ``bin`` plus the ``by`` keys."""
+    keys = ["bin", *by]
+    if cube.empty:
+        return pd.DataFrame(columns=keys + stat_columns())
+    binned = cube.assign(bin=labels_for_days(cube["day"].to_numpy(), binning, periods))
+    binned = binned[binned["bin"].notna()]
+    return binned.groupby(keys, as_index=False, sort=True)[stat_columns()].sum()
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# Inputs shared by every task. Populated in the parent before the pool starts so
+# forked workers inherit them copy-on-write instead of receiving pickled copies.
+_SHARED: Dict[str, Any] = {}
+
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...] = ()
+    deps: Tuple[str, ...] = ()
+    group: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.group:
+            self.group = self.name.split(":", 1)[0]
+
+
+def shared() -> Dict[str, Any]:
+    return _SHARED
+
+
+def _init_worker(payload: Dict[str, Any]) -> None:
+    _SHARED.clear()
+    _SHARED.update(payload)
+
+
+def _run_task(name: str, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[str, float, float]:
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    fn(*args)
+    return name, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def select_tasks(tasks: List[Task], only: Iterable[str] | None, skip: Iterable[str] | None) -> List[Task]:
+    only_set = set(only or [])
+    skip_set = set(skip or [])
+    known = {t.group for t in tasks} | {t.name for t in tasks}
+    unknown = (only_set | skip_set) - known
+    if unknown:
+        raise ValueError(f"Unknown analyses: {sorted(unknown)}; choose from {sorted({t.group for t in tasks})}")
+    selected = []
+    for task in tasks:
+        keys = {task.group, task.name}
+        if only_set and not keys & only_set:
+            continue
+        if keys & skip_set:
+            continue
+        selected.append(task)
+    names = {t.name for t in selected}
+    # Dependencies on deselected tasks are dropped: they only order work that runs.
+    for task in selected:
+        task.deps = tuple(d for d in task.deps if d in names)
+    return selected
+
+
+def _check_acyclic(tasks: List[Task]) -> None:
+    by_name = {t.name: t for t in tasks}
+    state: Dict[str, int] = {}
+
+    def visit(name: str) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Dependency cycle through task {name}")
+        state[name] = 1
+        for dep in by_name[name].deps:
+            visit(dep)
+        state[name] = 2
+
+    for task in tasks:
+        visit(task.name)
+
+
+def run_tasks(tasks: List[Task], shared_inputs: Dict[str, Any], workers: int = 1) -> Dict[str, Tuple[float, float]]:
+    """Run tasks respecting dependencies; returns {name: (wall_s, cpu_s)}."""
+    _check_acyclic(tasks)
+    _SHARED.clear()
+    _SHARED.update(shared_inputs)
+    timings: Dict[str, Tuple[float, float]] = {}
+    done: set[str] = set()
+    pending = list(tasks)
+
+    def ready() -> List[Task]:
+        out = [t for t in pending if all(d in done for d in t.deps)]
+        for t in out:
+            pending.remove(t)
+        return out
+
+    def record(name: str, wall: float, cpu: float) -> None:
+        timings[name] = (wall, cpu)
+        done.add(name)
+        print(f"[analysis] {name}: {wall:.2f}s wall, {cpu:.2f}s cpu")
+
+    if workers <= 1 or len(tasks) <= 1:
+        while pending:
+            for task in ready():
+                record(*_run_task(task.name, task.fn, task.args))
+        return timings
+
+    methods = mp.get_all_start_methods()
+    if "fork" in methods:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("fork"))
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dict(shared_inputs),))
+    running: Dict[Future, str] = {}
+    with executor:
+        while pending or running:
+            for task in ready():
+                running[executor.submit(_run_task, task.name, task.fn, task.args)] = task.name
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                running.pop(future)
+                record(*future.result())
+    return timings
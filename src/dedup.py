@@ -0,0 +1,176 @@
+"""Near-duplicate detection with MinHash signatures and LSH banding.
+
+Texts are shingled into hashed character n-grams; a ``MinHasher`` turns each
+shingle set into ``num_perm`` minimum hash values (one universal hash per row,
+modulo a Mersenne prime, so all arithmetic stays in uint64). ``LSHIndex`` splits
+signatures into bands and only compares texts that share a band bucket; a
+candidate counts as a duplicate when the estimated Jaccard similarity (fraction
+of agreeing signature rows) reaches the threshold. The first text seen is the
+canonical one; later near-duplicates point at it through ``dup_of``.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+SHINGLE_BASE = np.uint64(1_000_003)
+
+
+def shingle_hashes(text: str, size: int) -> np.ndarray:
+    """Unique hashes (below ``MERSENNE_PRIME``) of the character ``size``-grams of ``text``."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if codes.size == 0:
+        return np.zeros(1, dtype=np.uint64)
+    size = min(size, codes.size)
+    hashes = np.zeros(codes.size - size + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes = hashes * SHINGLE_BASE + codes[offset : offset + hashes.size]
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(32)
+    return np.unique(hashes % MERSENNE_PRIME)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """``(len(texts), num_perm)`` signatures, computed in one pass over all shingles."""
+        if not texts:
+            return np.zeros((0, self.num_perm), dtype=np.uint64)
+        shingles = [shingle_hashes(text, self.shingle_size) for text in texts]
+        flat = np.concatenate(shingles)
+        starts = np.concatenate([[0], np.cumsum([s.size for s in shingles])[:-1]])
+        # a, b, x < 2^31, so a * x + b fits in uint64 before the modulus.
+        hashed = (self.a[:, None] * flat[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return np.minimum.reduceat(hashed, starts, axis=1).T
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Bands and rows per band whose S-curve midpoint ``(1/b)^(1/r)`` is closest below ``threshold``.
+
+    Erring low favours recall; candidates are verified against the threshold anyway.
+    """
+    best = (num_perm, 1)
+    best_mid = -1.0
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        mid = (1.0 / bands) ** (1.0 / rows)
+        if best_mid < mid <= threshold:
+            best, best_mid = (bands, rows), mid
+    return best
+
+
+class LSHIndex:
+    def __init__(self, num_perm: int, threshold: float):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(num_perm, threshold)
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: List[np.ndarray] = []
+        self.keys: List[Any] = []
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def query(self, signature: np.ndarray) -> Tuple[Any, float] | None:
+        """Best indexed match at or above the threshold, as ``(key, estimated_jaccard)``."""
+        candidates = {pos for band_key in self._band_keys(signature) for pos in self.buckets.get(band_key, [])}
+        best = None
+        for pos in sorted(candidates):
+            similarity = float(np.mean(self.signatures[pos] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (self.keys[pos], similarity)
+        return best
+
+    def insert(self, key: Any, signature: np.ndarray) -> None:
+        pos = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band_key in self._band_keys(signature):
+            self.buckets.setdefault(band_key, []).append(pos)
+
+
+class Deduplicator:
+    """Streaming near-duplicate finder over texts offered in order.
+
+    ``add_many`` returns, per text, the ``(canonical_key, similarity)`` it
+    duplicates, or ``None`` when the text is new (it is then indexed).
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.index = LSHIndex(num_perm, threshold)
+
+    def add_many(self, items: List[Tuple[Any, str]]) -> List[Tuple[Any, float] | None]:
+        results = []
+        signatures = self.hasher.signatures([text for _, text in items])
+        for (key, _), signature in zip(items, signatures):
+            match = self.index.query(signature)
+            if match is None:
+                self.index.insert(key, signature)
+            results.append(match)
+        return results
+
+
+def dedup_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"enabled": True, "threshold": 0.8, "num_perm": 128, "shingle_size": 5, "min_chars": 20}
+    cfg.update(analysis_cfg.get("dedup") or {})
+    return cfg
+
+
+def is_duplicate(row: Dict[str, Any]) -> bool:
+    """Whether a scored row is a near-duplicate segment or belongs to a near-duplicate document."""
+    return bool(row.get("dup_of") or row.get("doc_dup_of"))
+
+
+def doc_order_key(doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Documents are deduplicated in date order, so the canonical copy is the earliest one."""
+    return doc.get("date") or "", doc["doc_id"]
+
+
+def mark_duplicates(docs: List[Dict[str, Any]], cfg: Dict[str, Any]) -> Dict[str, int]:
+    """Set ``dup_of`` on near-duplicate documents and non-heading segments, in place.
+
+    A duplicate document points at the earlier document it mirrors; a duplicate
+    segment points at the ``segment_id`` of the earlier segment it repeats, which
+    may belong to another document. "Earlier" follows ``doc_order_key``, so the
+    result does not depend on the order documents were collected in. Segments
+    shorter than ``min_chars`` only match exact repeats.
+    """
+    params = dict(threshold=cfg["threshold"], num_perm=cfg["num_perm"], shingle_size=cfg["shingle_size"])
+    doc_dedup = Deduplicator(**params)
+    seg_dedup = Deduplicator(**params)
+    exact: Dict[str, str] = {}
+    stats = {"docs": 0, "dup_docs": 0, "segments": 0, "dup_segments": 0}
+    for doc in sorted(docs, key=doc_order_key):
+        stats["docs"] += 1
+        match = doc_dedup.add_many([(doc["doc_id"], doc.get("clean_text", ""))])[0]
+        doc["dup_of"] = match[0] if match else None
+        stats["dup_docs"] += match is not None
+        near = []
+        for seg in doc["segments"]:
+            seg["dup_of"] = None
+            if seg["segment_type"] == "heading":
+                continue
+            stats["segments"] += 1
+            first = exact.setdefault(seg["text"], seg["segment_id"])
+            if first != seg["segment_id"]:
+                seg["dup_of"] = first
+            elif seg["char_len"] >= cfg["min_chars"]:
+                near.append(seg)
+        for seg, match in zip(near, seg_dedup.add_many([(seg["segment_id"], seg["text"]) for seg in near])):
+            if match:
+                seg["dup_of"] = match[0]
+        stats["dup_segments"] += sum(1 for seg in doc["segments"] if seg["dup_of"])
+    return stats
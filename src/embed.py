@@ -1,23 +1,115 @@
 from __future__ import annotations
 
+import json
+import re
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from src.utils import ensure_dir, sha1_text
+from src.metrics import METRICS
+from src.quantize import CODEC_NAME, EmbeddingCodec, load_codec
+from src.utils import atomic_open, ensure_dir, sha1_text
+
+
+class HashingEncoder:
+    """Tiny dependency-free encoder: signed hashing of character uni/bigrams.
+
+    Used for benchmarks and offline smoke runs (``backend: hashing`` in models.yaml);
+    it mirrors the subset of the SentenceTransformer.encode API the engine uses.
+    """
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **_: Any) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            grams = list(text) + [text[i : i + 2] for i in range(len(text) - 1)]
+            for gram in grams:
+                h = int(sha1_text(gram)[:8], 16)
+                out[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms > 0, norms, 1.0)
+        return out
+
+
+def load_model(model_cfg: Dict[str, Any]) -> Any:
+    """The model, or a client of the embedding server when one serves it (see src/embed_server.py)."""
+    if (model_cfg.get("server") or {}).get("socket"):
+        from src.embed_server import connect
+
+        remote = connect(model_cfg)
+        if remote is not None:
+            return remote
+    return load_local_model(model_cfg)
+
+
+def load_local_model(model_cfg: Dict[str, Any]) -> Any:
+    if model_cfg.get("backend") == "hashing":
+        return HashingEncoder(int(model_cfg.get("dim", 64)))
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_cfg["model_name"], device=model_cfg["device"])
+
+
+def load_token_counter(model_cfg: Dict[str, Any]) -> Callable[[List[str]], List[int]]:
+    """Token lengths (without special tokens) as the embedding model's tokenizer sees them.
+
+    Loads only the tokenizer, not the model. The hashing backend has no tokenizer;
+    it reads characters, so a text counts one token per character.
+    """
+    if model_cfg.get("backend") == "hashing":
+        return lambda texts: [len(text) for text in texts]
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_cfg["model_name"])
+    return lambda texts: [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+# Settings that change the stored vectors; anything else (batch size, device) may differ between runs.
+FINGERPRINT_KEYS = ("backend", "model_name", "dim", "max_length", "embedding_dtype")
+
+
+def cache_namespace(model_cfg: Dict[str, Any]) -> str:
+    """Cache subdirectory for a model: readable model/dtype prefix plus a fingerprint of its settings.
+
+    Quantization settings are not part of it; int8 caches record the codec that wrote them.
+    """
+    settings = {key: model_cfg.get(key) for key in FINGERPRINT_KEYS}
+    settings["embedding_dtype"] = settings["embedding_dtype"] or "float16"
+    name = f"hashing{model_cfg.get('dim', 64)}" if model_cfg.get("backend") == "hashing" else model_cfg["model_name"]
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+    fingerprint = sha1_text(json.dumps(settings, sort_keys=True))[:8]
+    return f"{slug}-{settings['embedding_dtype']}-{fingerprint}"
+
+
+def model_cache_dir(embeddings_root: Path, model_cfg: Dict[str, Any]) -> Path:
+    return Path(embeddings_root) / cache_namespace(model_cfg)
 
 
 class EmbeddingEngine:
-    def __init__(self, model_cfg: Dict[str, Any], cache_dir: Path):
+    """Encodes segments and caches them under ``<cache_root>/<cache_namespace(model_cfg)>/``."""
+
+    def __init__(self, model_cfg: Dict[str, Any], cache_root: Path, model: Any = None):
         self.model_cfg = model_cfg
-        self.cache_dir = ensure_dir(cache_dir)
-        self.model = SentenceTransformer(model_cfg["model_name"], device=model_cfg["device"])
+        self.namespace = cache_namespace(model_cfg)
+        self.cache_dir = ensure_dir(Path(cache_root) / self.namespace)
+        self._model = model
         self.batch_size = model_cfg["batch_size"]
         self.max_length = model_cfg["max_length"]
         self.cache_mode = model_cfg["cache_mode"]
         self.embedding_dtype = model_cfg.get("embedding_dtype", "float16")
+        self.codec = load_codec(self.cache_dir / CODEC_NAME) if self.embedding_dtype == "int8" else None
+
+    @property
+    def model(self) -> Any:
+        """Loaded on first encode, so cache-only users (scoring from cache, the ANN index) skip it."""
+        if self._model is None:
+            with METRICS.substep("load_model"):
+                self._model = load_model(self.model_cfg)
+        return self._model
 
     def _cache_path(self, doc_id: str) -> Path:
         return self.cache_dir / f"{doc_id}.npz"
@@ -30,13 +122,26 @@ class EmbeddingEngine:
         return {
             "segment_ids": data["segment_ids"].tolist(),
             "embeddings": data["embeddings"],
+            "codec_id": str(data["codec_id"]) if "codec_id" in data else None,
         }
 
     def save_cache(self, doc_id: str, segment_ids: List[str], embeddings: np.ndarray) -> None:
         path = self._cache_path(doc_id)
-        np.savez_compressed(path, segment_ids=np.array(segment_ids), embeddings=embeddings)
+        extra = {"codec_id": np.array(self.codec.codec_id)} if self.codec is not None else {}
+        with atomic_open(path, "wb") as f:
+            np.savez_compressed(f, segment_ids=np.array(segment_ids), embeddings=embeddings, **extra)
+
+    def calibrate(self, texts: List[str], pca_dim: int | None = None) -> EmbeddingCodec:
+        """Fit the int8 codec on ``texts`` and store it next to the cache."""
+        with METRICS.substep("calibrate_codec"):
+            self.codec = EmbeddingCodec.fit(self.embed_texts(texts), pca_dim)
+        self.codec.save(self.cache_dir / CODEC_NAME)
+        return self.codec
 
     def embed_texts(self, texts: List[str]) -> np.ndarray:
+        METRICS.count("embed.texts_encoded", len(texts))
+        METRICS.count("embed.batches", -(-len(texts) // self.batch_size))
+        METRICS.observe("embed.texts_per_call", len(texts))
         embeddings = self.model.encode(
             texts,
             batch_size=self.batch_size,
@@ -46,13 +151,51 @@ class EmbeddingEngine:
         )
         return embeddings
 
-    def embed_segments(self, doc_id: str, segments: List[Dict[str, Any]], force: bool = False) -> np.ndarray:
+    def embed_segments(
+        self,
+        doc_id: str,
+        segments: List[Dict[str, Any]],
+        force: bool = False,
+        shared: Dict[str, np.ndarray] | None = None,
+    ) -> np.ndarray:
+        """Embeddings for ``segments``; near-duplicates whose ``dup_of`` is in ``shared`` reuse that vector."""
         if self.cache_mode == "embeddings" and not force:
             cached = self.load_cache(doc_id)
-            if cached and cached["segment_ids"] == [s["segment_id"] for s in segments]:
+            codec_id = self.codec.codec_id if self.codec is not None else None
+            if (
+                cached
+                and cached["segment_ids"] == [s["segment_id"] for s in segments]
+                and cached["codec_id"] == codec_id
+            ):
+                METRICS.count("embed.cache.hit")
                 return cached["embeddings"]
-        texts = [s["text"] for s in segments]
-        embeddings = self.embed_texts(texts)
+            METRICS.count("embed.cache.miss")
+        shared = shared or {}
+        # A canonical segment never has dup_of itself, so it is either shared or encoded here.
+        local = {s["segment_id"]: pos for pos, s in enumerate(segments)}
+        reuse = [s.get("dup_of") in shared or s.get("dup_of") in local for s in segments]
+        to_encode = [s["text"] for s, reused in zip(segments, reuse) if not reused]
+        encoded = self.embed_texts(to_encode) if to_encode else None
+        if self.embedding_dtype == "int8":
+            if self.codec is None:
+                raise ValueError(f"embedding_dtype int8 needs {self.cache_dir / CODEC_NAME}; run 03_embed.py to fit it")
+            encoded = self.codec.encode(encoded) if encoded is not None else None
+        if len(to_encode) == len(segments):
+            embeddings = encoded
+        else:
+            METRICS.count("embed.dedup_reused", len(segments) - len(to_encode))
+            vectors: List[np.ndarray] = []
+            encoded_iter = iter(encoded if encoded is not None else [])
+            for s, reused in zip(segments, reuse):
+                if not reused:
+                    vectors.append(next(encoded_iter))
+                elif s["dup_of"] in shared:
+                    vectors.append(shared[s["dup_of"]])
+                else:
+                    vectors.append(vectors[local[s["dup_of"]]])
+            embeddings = np.stack(vectors)
+            if self.embedding_dtype != "int8":
+                embeddings = embeddings.astype(np.float32)
         if self.embedding_dtype == "float16":
             embeddings = embeddings.astype(np.float16)
         if self.cache_mode == "embeddings":
@@ -0,0 +1,302 @@
+"""Long-lived local embedding service on a Unix domain socket.
+
+The server loads the embedding model once. It queues encode requests from any
+number of clients, merges requests that arrive within ``max_wait_ms`` into one
+``encode`` call of up to ``max_batch_texts`` texts, and keeps recent vectors in
+an in-memory cache keyed by text hash, so identical texts from different
+clients are encoded once.
+
+    python -m src.embed_server serve      # socket at embedding.server.socket in models.yaml
+    python -m src.embed_server stats
+
+With ``embedding.server.socket`` set, ``src.embed.load_model`` returns a
+``RemoteEncoder`` when a server for the same model answers on that socket and
+loads the model in-process otherwise. The server returns normalized float32
+vectors. Each client still converts them to its own ``embedding_dtype`` and
+writes its own per-document caches.
+
+Messages are frames: a 4-byte big-endian length followed by a UTF-8 JSON header,
+then for encode replies a second frame with the raw float32 matrix.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.embed import load_local_model
+from src.metrics import METRICS
+from src.utils import ensure_dir, load_config_bundle, sha1_text
+
+# Settings that change what the model returns for a text; dtype is applied by each client.
+IDENTITY_KEYS = ("backend", "model_name", "dim", "max_length")
+FRAME = struct.Struct(">I")
+
+
+def server_config(model_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"socket": None, "max_batch_texts": 512, "max_wait_ms": 5, "cache_entries": 100000}
+    cfg.update(model_cfg.get("server") or {})
+    return cfg
+
+
+def model_identity(model_cfg: Dict[str, Any]) -> str:
+    return sha1_text(json.dumps({key: model_cfg.get(key) for key in IDENTITY_KEYS}, sort_keys=True))[:16]
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(FRAME.pack(len(payload)) + payload)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> bytes | None:
+    header = recv_exact(sock, FRAME.size)
+    if header is None:
+        return None
+    return recv_exact(sock, FRAME.unpack(header)[0])
+
+
+class Pending:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: np.ndarray | None = None
+        self.error: str | None = None
+
+
+class MicroBatcher:
+    """Single encoder thread: drains the queue into batches and answers each request."""
+
+    def __init__(self, model: Any, model_cfg: Dict[str, Any]):
+        cfg = server_config(model_cfg)
+        self.model = model
+        self.encode_batch_size = model_cfg["batch_size"]
+        self.max_batch_texts = int(cfg["max_batch_texts"])
+        self.max_wait_s = float(cfg["max_wait_ms"]) / 1000.0
+        self.cache_entries = int(cfg["cache_entries"])
+        self.cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.queue: queue.Queue[Pending] = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0, "encoded": 0, "cache_hits": 0}
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, texts: List[str]) -> Pending:
+        pending = Pending(texts)
+        self.queue.put(pending)
+        return pending
+
+    def _collect(self) -> List[Pending]:
+        batch = [self.queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait_s
+        while size < self.max_batch_texts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.texts)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                self._answer(batch)
+            except Exception as exc:  # reported to every waiting client; the server keeps running
+                for pending in batch:
+                    pending.error = f"{type(exc).__name__}: {exc}"
+            for pending in batch:
+                pending.done.set()
+
+    def _answer(self, batch: List[Pending]) -> None:
+        keys = [[sha1_text(text) for text in pending.texts] for pending in batch]
+        missing: Dict[str, str] = {}
+        for pending, pending_keys in zip(batch, keys):
+            for key, text in zip(pending_keys, pending.texts):
+                if key not in self.cache:
+                    missing.setdefault(key, text)
+        if missing:
+            vectors = self.model.encode(
+                list(missing.values()),
+                batch_size=self.encode_batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            ).astype(np.float32)
+            for key, vector in zip(missing, vectors):
+                self.cache[key] = vector
+        n_texts = sum(len(k) for k in keys)
+        for pending, pending_keys in zip(batch, keys):
+            # Vectors of this batch are still cached: eviction below drops only the oldest entries.
+            vectors = [self.cache[key] for key in pending_keys]
+            pending.result = np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            for key in pending_keys:
+                self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["texts"] += n_texts
+        self.stats["encoded"] += len(missing)
+        self.stats["cache_hits"] += n_texts - len(missing)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, model_cfg: Dict[str, Any], model: Any = None):
+        self.identity = model_identity(model_cfg)
+        self.batcher = MicroBatcher(model if model is not None else load_local_model(model_cfg), model_cfg)
+        if socket_path.exists():
+            socket_path.unlink()
+        ensure_dir(socket_path.parent)
+        super().__init__(str(socket_path), ConnectionHandler)
+        self.socket_path = socket_path
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+
+class ConnectionHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection until it closes; requests on it are answered in order."""
+
+    server: EmbeddingServer
+
+    def handle(self) -> None:
+        while True:
+            frame = recv_frame(self.request)
+            if frame is None:
+                return
+            request = json.loads(frame)
+            op = request.get("op")
+            if op == "hello":
+                send_frame(self.request, json.dumps({"identity": self.server.identity}).encode("utf-8"))
+            elif op == "stats":
+                stats = dict(self.server.batcher.stats, cached=len(self.server.batcher.cache))
+                send_frame(self.request, json.dumps(stats).encode("utf-8"))
+            elif op == "encode":
+                pending = self.server.batcher.submit(request["texts"])
+                pending.done.wait()
+                if pending.error is not None:
+                    send_frame(self.request, json.dumps({"error": pending.error}).encode("utf-8"))
+                    continue
+                result = np.ascontiguousarray(pending.result, dtype=np.float32)
+                send_frame(self.request, json.dumps({"shape": list(result.shape)}).encode("utf-8"))
+                send_frame(self.request, result.tobytes())
+            else:
+                send_frame(self.request, json.dumps({"error": f"unknown op {op!r}"}).encode("utf-8"))
+
+
+class RemoteEncoder:
+    """Client for ``EmbeddingServer`` with the ``encode`` subset of the SentenceTransformer API."""
+
+    def __init__(self, socket_path: str | Path, timeout: float | None = None):
+        self.socket_path = Path(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(str(self.socket_path))
+        self._lock = threading.Lock()
+
+    def request(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes | None]:
+        with self._lock:
+            send_frame(self._sock, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            header_frame = recv_frame(self._sock)
+            if header_frame is None:
+                raise ConnectionError(f"Embedding server at {self.socket_path} closed the connection")
+            header = json.loads(header_frame)
+            body = recv_frame(self._sock) if "shape" in header else None
+        if "error" in header:
+            raise RuntimeError(f"Embedding server: {header['error']}")
+        return header, body
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **_: Any) -> np.ndarray:
+        if not normalize_embeddings:
+            raise ValueError("The embedding server returns normalized embeddings only")
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        header, body = self.request({"op": "encode", "texts": list(texts)})
+        return np.frombuffer(body or b"", dtype=np.float32).reshape(header["shape"]).copy()
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+def connect(model_cfg: Dict[str, Any]) -> RemoteEncoder | None:
+    """A client for the configured server, or None when none is running for this model."""
+    socket_path = server_config(model_cfg)["socket"]
+    if not socket_path or not Path(socket_path).exists():
+        return None
+    try:
+        encoder = RemoteEncoder(socket_path)
+        identity = encoder.request({"op": "hello"})[0]["identity"]
+    except OSError:
+        print(f"[embed] no embedding server answering on {socket_path}; loading the model locally")
+        return None
+    if identity != model_identity(model_cfg):
+        encoder.close()
+        print(f"[embed] embedding server on {socket_path} serves another model; loading the model locally")
+        return None
+    METRICS.count("embed.server_clients")
+    return encoder
+
+
+def serve(model_cfg: Dict[str, Any]) -> None:
+    socket_path = server_config(model_cfg)["socket"]
+    if not socket_path:
+        raise ValueError("Set embedding.server.socket in models.yaml to run the embedding server")
+    with EmbeddingServer(Path(socket_path), model_cfg) as server:
+        print(f"[embed] serving {model_cfg['model_name']} on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        print("[embed] " + ", ".join(f"{k}={v}" for k, v in server.batcher.stats.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.embed_server")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="Load the embedding model and serve it on embedding.server.socket")
+    sub.add_parser("stats", help="Print request, batch and cache counters of a running server")
+    args = parser.parse_args()
+    model_cfg = load_config_bundle(args.config_dir)["models"]["embedding"]
+    if args.command == "serve":
+        with METRICS.stage("embed_server"):
+            serve(model_cfg)
+        METRICS.write()
+        return
+    encoder = connect(model_cfg)
+    if encoder is None:
+        raise SystemExit(f"No embedding server for this model on {server_config(model_cfg)['socket']}")
+    stats, _ = encoder.request({"op": "stats"})
+    print("[embed] " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,290 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
-
-import pandas as pd
-
-from src.tests.trend import quarterly_bin
-
-
-def build_excerpt_bank(rows: List[Dict[str, Any]], top_n: int = 5) -> List[Dict[str, Any]]:
-    records = []
-    for row in rows:
-        if not row["scores"].get("is_outward"):
-            continue
-        bin_id = quarterly_bin(row["date"]) if row["source_type"] == "mfa_presser" else row["date"]
-        records.append({"bin": bin_id, **row})
-    df = pd.DataFrame(records)
-    if df.empty:
-        return []
-    df["security_axis"] = df["scores"].apply(lambda x: x.get("security_axis", 0.0))
-    df["outward_axis"] = df["scores"].apply(lambda x: x.get("outward_axis", 0.0))
-    output = []
-    for bin_id, group in df.groupby("bin"):
-        top_sec = group.sort_values("security_axis", ascending=False).head(top_n)
-        bottom_sec = group.sort_values("security_axis", ascending=True).head(top_n)
-        top_slogan = group.sort_values("outward_axis", ascending=False).head(top_n)
-        for label, subset in [("top_security", top_sec), ("bottom_security", bottom_sec), ("top_slogan", top_slogan)]:
-            for _, row in subset.iterrows():
-                output.append(
-                    {
-                        "bin": bin_id,
-                        "label": label,
-                        "doc_id": row["doc_id"],
-                        "date": row["date"],
-                        "source_type": row["source_type"],
-                        "title": row["title"],
-                        "url": row["url"],
-                        "text": row["text"],
-                        "scores": row["scores"],
-                    }
-                )
-    return output
+import heapq
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from src.binning import bin_label
+from src.metrics import METRICS
+
+VectorLoader = Callable[[List[Dict[str, Any]]], np.ndarray]
+
+DEFAULT_LABELS = [
+    {"name": "top_security", "axis": "security_axis", "order": "top", "filters": {"is_outward": True}},
+    {"name": "bottom_security", "axis": "security_axis", "order": "bottom", "filters": {"is_outward": True}},
+    {"name": "top_slogan", "axis": "outward_axis", "order": "top", "filters": {"is_outward": True}},
+]
+
+
+def row_field(row: Dict[str, Any], name: str) -> Any:
+    """Look a field up in the segment scores first, then on the row itself."""
+    scores = row.get("scores", {})
+    return scores[name] if name in scores else row.get(name)
+
+
+@dataclass
+class ExcerptLabel:
+    """One excerpt list per bin: the ``top`` or ``bottom`` rows on ``axis`` among rows passing ``filters``.
+
+    A filter value is matched by equality, a list by membership, and a ``{min, max}``
+    mapping as an inclusive range.
+    """
+
+    name: str
+    axis: str
+    order: str = "top"
+    filters: Dict[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.order not in ("top", "bottom"):
+            raise ValueError(f"Excerpt label {self.name!r}: order must be 'top' or 'bottom', got {self.order!r}")
+
+    def matches(self, row: Dict[str, Any]) -> bool:
+        for name, expected in self.filters.items():
+            value = row_field(row, name)
+            if isinstance(expected, dict):
+                if value is None:
+                    return False
+                if "min" in expected and value < expected["min"]:
+                    return False
+                if "max" in expected and value > expected["max"]:
+                    return False
+            elif isinstance(expected, list):
+                if value not in expected:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    def score(self, row: Dict[str, Any]) -> float:
+        value = float(row_field(row, self.axis) or 0.0)
+        return value if self.order == "top" else -value
+
+
+def excerpt_labels(export_cfg: Dict[str, Any] | None) -> List[ExcerptLabel]:
+    return [ExcerptLabel(**spec) for spec in (export_cfg or {}).get("labels") or DEFAULT_LABELS]
+
+
+class ExcerptEngine:
+    """Keep the best ``top_n`` row references per (bin, label) in bounded heaps.
+
+    Rows are offered once, in stream order; ties keep the earlier row. Only the
+    reference passed to ``add`` is retained, so callers decide what to keep
+    (a list index, a file offset) and materialise text for the winners only.
+    """
+
+    def __init__(
+        self,
+        labels: List[ExcerptLabel],
+        top_n: int = 5,
+        binning: str = "quarterly",
+        periods: List[Dict[str, str]] | None = None,
+    ):
+        self.labels = labels
+        self.top_n = top_n
+        self.binning = binning
+        self.periods = periods
+        self.rows_seen = 0
+        self._bins: Dict[str, str | None] = {}
+        self._heaps: Dict[Tuple[str, int], List[Tuple[float, int, Any]]] = {}
+
+    def bin_for(self, date: str) -> str | None:
+        if date not in self._bins:
+            self._bins[date] = bin_label(date, self.binning, self.periods)
+        return self._bins[date]
+
+    def add(self, row: Dict[str, Any], ref: Any) -> None:
+        seq = self.rows_seen
+        self.rows_seen += 1
+        bin_id = self.bin_for(row["date"])
+        if bin_id is None:
+            return
+        for pos, label in enumerate(self.labels):
+            if not label.matches(row):
+                continue
+            heap = self._heaps.setdefault((bin_id, pos), [])
+            entry = (label.score(row), -seq, ref)
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    def winners(self) -> List[Tuple[str, str, Any]]:
+        """``(bin, label, ref)`` ordered by bin, label order, then rank."""
+        output = []
+        for (bin_id, pos), heap in sorted(self._heaps.items()):
+            for _, _, ref in sorted(heap, key=lambda entry: entry[:2], reverse=True):
+                output.append((bin_id, self.labels[pos].name, ref))
+        return output
+
+
+def mmr_select(
+    groups: List[List[int]],
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    top_n: int,
+    diversity: float,
+    block: int = 256,
+) -> List[List[int]]:
+    """Maximal marginal relevance picks within each group of candidate indices, in pick order.
+
+    Each step takes the candidate maximising ``(1 - diversity) * relevance - diversity *
+    (highest cosine similarity to a candidate already picked)``, with relevance rescaled
+    to [0, 1] within the group. Groups are padded to the largest one and processed a
+    ``block`` at a time, so each block is one batched similarity product followed by
+    ``top_n`` vectorized steps.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = np.asarray(vectors / np.where(norms > 0, norms, 1.0), dtype=np.float32)
+    width = max((len(g) for g in groups), default=0)
+    picks: List[List[int]] = []
+    for start in range(0, len(groups), block):
+        chunk = groups[start : start + block]
+        idx = np.full((len(chunk), width), -1, dtype=np.int64)
+        for row, members in enumerate(chunk):
+            idx[row, : len(members)] = members
+        valid = idx >= 0
+        rel = np.where(valid, relevance[np.maximum(idx, 0)], np.nan)
+        lo, hi = np.nanmin(rel, axis=1, keepdims=True), np.nanmax(rel, axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rel = np.where(hi > lo, (rel - lo) / (hi - lo), 1.0)
+        block_vectors = unit[np.maximum(idx, 0)] * valid[:, :, None]
+        sims = block_vectors @ block_vectors.transpose(0, 2, 1)
+        max_sim = np.zeros(idx.shape, dtype=np.float64)
+        open_ = valid.copy()
+        chosen = np.full((len(chunk), top_n), -1, dtype=np.int64)
+        rows = np.arange(len(chunk))
+        for step in range(min(top_n, width)):
+            objective = np.where(open_, (1.0 - diversity) * rel - diversity * max_sim, -np.inf)
+            pick = objective.argmax(axis=1)
+            live = open_[rows, pick]
+            chosen[live, step] = idx[rows[live], pick[live]]
+            open_[rows[live], pick[live]] = False
+            max_sim = np.maximum(max_sim, sims[rows, :, pick])
+        picks.extend([int(c) for c in row if c >= 0] for row in chosen)
+    return picks
+
+
+def diversify(
+    winners: List[Tuple[str, str, Any]],
+    candidates: Dict[Any, Dict[str, Any]],
+    labels: List[ExcerptLabel],
+    top_n: int,
+    diversity: float,
+    load_vectors: VectorLoader,
+) -> List[Tuple[str, str, Any]]:
+    """Re-rank the candidate pool of every (bin, label) by MMR and keep ``top_n`` of each.
+
+    ``load_vectors`` returns NaN rows for candidates without an embedding. A list with
+    any such candidate keeps its plain top ``top_n``: similarity to them is unknown,
+    and treating them as dissimilar would favour them over cached near-duplicates.
+    """
+    refs = list(dict.fromkeys(ref for _, _, ref in winners))
+    position = {ref: i for i, ref in enumerate(refs)}
+    vectors = load_vectors([candidates[ref] for ref in refs])
+    uncached = np.isnan(vectors).any(axis=1)
+    by_name = {label.name: label for label in labels}
+    group_keys: List[Tuple[str, str]] = []
+    groups: List[List[int]] = []
+    relevance = np.empty(len(winners))
+    for i, (bin_id, label, ref) in enumerate(winners):
+        if not group_keys or group_keys[-1] != (bin_id, label):
+            group_keys.append((bin_id, label))
+            groups.append([])
+        groups[-1].append(i)
+        relevance[i] = by_name[label].score(candidates[ref])
+    rows = np.array([position[ref] for _, _, ref in winners], dtype=np.int64)
+    picks: List[List[int]] = [members[:top_n] for members in groups]
+    ranked = [g for g, members in enumerate(groups) if not uncached[rows[members]].any()]
+    METRICS.count("excerpts.plain_lists", len(groups) - len(ranked))
+    if ranked:
+        winner_vectors = np.nan_to_num(vectors[rows])
+        mmr = mmr_select([groups[g] for g in ranked], relevance, winner_vectors, top_n, diversity)
+        for g, picked in zip(ranked, mmr):
+            picks[g] = picked
+    return [(bin_id, label, winners[i][2]) for (bin_id, label), picked in zip(group_keys, picks) for i in picked]
+
+
+def excerpt_record(bin_id: str, label: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "bin": bin_id,
+        "label": label,
+        "doc_id": row["doc_id"],
+        "date": row["date"],
+        "source_type": row["source_type"],
+        "title": row["title"],
+        "url": row["url"],
+        "text": row["text"],
+        "scores": row["scores"],
+    }
+
+
+def build_excerpt_bank(
+    rows: Iterable[Dict[str, Any]],
+    top_n: int = 5,
+    binning: str = "quarterly",
+    periods: List[Dict[str, str]] | None = None,
+    labels: List[ExcerptLabel] | None = None,
+    diversity: float = 0.0,
+    candidate_pool: int = 50,
+    load_vectors: VectorLoader | None = None,
+) -> List[Dict[str, Any]]:
+    rows = list(rows)
+    labels = labels or excerpt_labels(None)
+    engine = ExcerptEngine(labels, pool_size(top_n, diversity, candidate_pool, load_vectors), binning, periods)
+    for idx, row in enumerate(rows):
+        engine.add(row, idx)
+    winners = engine.winners()
+    if diversity > 0:
+        winners = diversify(winners, {idx: rows[idx] for _, _, idx in winners}, labels, top_n, diversity, load_vectors)
+    return [excerpt_record(bin_id, label, rows[idx]) for bin_id, label, idx in winners]
+
+
+def pool_size(top_n: int, diversity: float, candidate_pool: int, load_vectors: VectorLoader | None) -> int:
+    """Heap size per (bin, label): ``top_n``, or the MMR candidate pool when diversifying."""
+    if diversity <= 0:
+        return top_n
+    if not 0 < diversity <= 1:
+        raise ValueError(f"excerpts.diversity must be between 0 and 1, got {diversity}")
+    if load_vectors is None:
+        raise ValueError("Diversified excerpt selection needs segment embeddings")
+    return max(top_n, candidate_pool)
+
+
+def stream_excerpt_bank(
+    path: str | Path,
+    top_n: int = 5,
+    binning: str = "quarterly",
+    periods: List[Dict[str, str]] | None = None,
+    labels: List[ExcerptLabel] | None = None,
+    diversity: float = 0.0,
+    candidate_pool: int = 50,
+    load_vectors: VectorLoader | None = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Select excerpts from a scored-segments JSONL in one pass.
+
+    Heaps hold byte offsets; the winning lines are re-read by seeking, so memory
+    is bounded by ``bins x labels x top_n`` (``candidate_pool`` when diversifying)
+    regardless of file size. Returns the excerpts and the number of rows scanned.
+    """
+    labels = labels or excerpt_labels(None)
+    engine = ExcerptEngine(labels, pool_size(top_n, diversity, candidate_pool, load_vectors), binning, periods)
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            engine.add(json.loads(line), offset)
+            offset += len(line)
+        winners = engine.winners()
+        rows: Dict[int, Dict[str, Any]] = {}
+        for _, _, ref in winners:
+            if ref not in rows:
+                f.seek(ref)
+                rows[ref] = json.loads(f.readline())
+    if diversity > 0:
+        winners = diversify(winners, rows, labels, top_n, diversity, load_vectors)
+    output = [excerpt_record(bin_id, label, rows[ref]) for bin_id, label, ref in winners]
+    return output, engine.rows_seen
@@ -0,0 +1,95 @@
+"""Main-content extraction for article pages.
+
+``extract_main_content`` picks the DOM block holding the article body: a known
+container selector when one matches with enough text, otherwise the block that
+collects the most link-free paragraph text (each paragraph credits its parent
+fully and its grandparent by half, as in Readability). Inside that block,
+link-dense lists, navigation-like blocks and copyright lines are dropped. Line
+breaks between paragraphs are kept, so Q&A turns still start their own lines.
+"""
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+from src.utils import normalize_ws
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, Tag
+
+DROP_TAGS = ["script", "style", "noscript", "iframe", "form", "nav", "header", "footer", "aside"]
+PARAGRAPH_TAGS = ["p", "pre", "td", "li", "h1", "h2", "h3", "h4", "blockquote"]
+BOILERPLATE_RE = re.compile(r"nav|menu|foot|copyright|breadcrumb|crumb|related|share|sidebar|banner|toolbar", re.I)
+COPYRIGHT_RE = re.compile(r"版权所有|Copyright|©|ICP备|网站标识码|主办单位|联系我们|网站地图")
+MIN_PARAGRAPH_CHARS = 10
+
+
+def page_lines(text: str) -> List[str]:
+    return [line for line in (normalize_ws(raw) for raw in text.split("\n")) if line]
+
+
+def text_len(el: "Tag") -> int:
+    return len("".join(el.get_text().split()))
+
+
+def link_density(el: "Tag") -> float:
+    total = text_len(el)
+    if not total:
+        return 0.0
+    return sum(text_len(a) for a in el.find_all("a")) / total
+
+
+def is_boilerplate(el: "Tag") -> bool:
+    marker = " ".join([el.get("id") or "", *(el.get("class") or [])])
+    return bool(marker.strip()) and bool(BOILERPLATE_RE.search(marker))
+
+
+def best_block(root: "Tag") -> "Tag":
+    scores: Dict[int, Tuple["Tag", float]] = {}
+    for para in root.find_all(PARAGRAPH_TAGS):
+        length = text_len(para)
+        if length < MIN_PARAGRAPH_CHARS:
+            continue
+        score = length * (1.0 - link_density(para))
+        for el, weight in [(para.parent, 1.0), (para.parent.parent if para.parent else None, 0.5)]:
+            if el is None or el.name in (None, "[document]"):
+                continue
+            prev = scores.get(id(el), (el, 0.0))[1]
+            scores[id(el)] = (el, prev + score * weight)
+    if not scores:
+        return root
+    el, _ = max(scores.values(), key=lambda item: item[1] * (1.0 - link_density(item[0])))
+    return el
+
+
+def clean_block(block: "Tag", max_link_density: float) -> List[str]:
+    for el in block.find_all(True):
+        if el.decomposed:
+            continue
+        if is_boilerplate(el) or (el.find("a") is not None and link_density(el) > max_link_density):
+            el.decompose()
+    return [line for line in page_lines(block.get_text("\n")) if not COPYRIGHT_RE.search(line)]
+
+
+def extract_main_content(
+    soup: "BeautifulSoup",
+    selectors: List[str] | None = None,
+    min_chars: int = 50,
+    max_link_density: float = 0.5,
+) -> Tuple[str, Dict[str, Any]]:
+    """Return the article text and how it was found (``selector``, ``density`` or ``fallback``)."""
+    for tag in soup(DROP_TAGS):
+        tag.decompose()
+    root = soup.body or soup
+    block, method = None, "density"
+    for selector in selectors or []:
+        node = root.select_one(selector)
+        if node is not None and text_len(node) >= min_chars:
+            block, method = node, "selector"
+            break
+    if block is None:
+        block = best_block(root)
+    lines = clean_block(block, max_link_density)
+    if sum(len(line) for line in lines) < min_chars and block is not root:
+        lines, method = clean_block(root, max_link_density), "fallback"
+    return "\n".join(lines), {"method": method, "block": block.name}
@@ -0,0 +1,99 @@
+"""Append-only per-stage journals for resumable runs.
+
+A stage appends one line per finished document to
+``<data_dir>/journal/<stage>.jsonl`` holding the document's output, and
+checkpoints (flush + fsync) every ``checkpoint_every`` documents and when it
+finishes. ``--resume`` reopens the journal and the stage skips the documents
+recorded in it, reusing their journaled output; a torn last line left by a
+crash is dropped. Without ``--resume`` the journal starts empty. Stages whose
+output fully replaces the journal delete it with ``discard`` when they finish.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+from src.metrics import METRICS
+from src.utils import ensure_dir
+
+
+def journal_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"checkpoint_every": 50}
+    cfg.update(analysis_cfg.get("journal") or {})
+    return cfg
+
+
+class StageJournal:
+    def __init__(self, data_dir: Path, stage: str, resume: bool = False, checkpoint_every: int = 50):
+        self.path = ensure_dir(Path(data_dir) / "journal") / f"{stage}.jsonl"
+        self.stage = stage
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.done: set[str] = set()
+        if resume and self.path.exists():
+            self._recover()
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self._pending = 0
+        if self.done:
+            print(f"[{stage}] resuming: {len(self.done)} documents already done in {self.path}")
+            METRICS.count("journal.resumed", len(self.done))
+
+    def _recover(self) -> None:
+        """Load completed keys and truncate a partially written trailing line."""
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    self.done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    break
+                good += len(line)
+        os.truncate(self.path, good)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def entries(self) -> Iterator[Tuple[str, Any]]:
+        """``(key, data)`` for every completed document, in the order they finished."""
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                yield entry["key"], entry["data"]
+
+    def load(self) -> Dict[str, Any]:
+        return dict(self.entries()) if self.done else {}
+
+    def record(self, key: str, data: Any) -> None:
+        self._file.write(json.dumps({"key": key, "data": data}, ensure_ascii=False) + "\n")
+        self.done.add(key)
+        self._pending += 1
+        if self._pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        METRICS.count("journal.checkpoints")
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+    def discard(self) -> None:
+        """Close and delete the journal once the stage's output is complete."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.done.clear()
+
+    def __enter__(self) -> "StageJournal":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,152 @@
+"""Lightweight run instrumentation shared by all stages.
+
+Stages wrap their work in ``METRICS.stage(name)``; code inside may open nested
+``METRICS.substep(name)`` blocks, bump counters with ``METRICS.count(key, n)``
+and record distributions with ``METRICS.observe(key, value)``. ``METRICS.write``
+merges the collected stages into ``outputs/run_metrics.json``.
+"""
+from __future__ import annotations
+
+import cProfile
+import fcntl
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from src.utils import atomic_write_text, ensure_dir
+
+RUN_METRICS_PATH = Path("outputs/run_metrics.json")
+PROFILE_DIR = Path("outputs/profiles")
+# ru_maxrss is KiB on Linux and bytes on macOS.
+RSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """RSS high-water mark of this process (since the last reset), or of its largest waited-for child."""
+    return resource.getrusage(who).ru_maxrss * RSS_SCALE / 2**20
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's RSS high-water mark, and with it ``ru_maxrss`` (Linux only).
+
+    Returns False where that is not possible; ``ru_maxrss`` then stays the process-lifetime peak.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def children_cpu_s() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RunMetrics:
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._active: List[Dict[str, Any]] = []
+
+    def _current(self) -> Dict[str, Any] | None:
+        return self._active[-1] if self._active else None
+
+    @contextmanager
+    def stage(self, name: str, profile: bool = False) -> Iterator[Dict[str, Any]]:
+        record: Dict[str, Any] = {"substeps": {}, "counters": {}, "observations": {}}
+        self.stages[name] = record
+        self._active.append(record)
+        profiler = cProfile.Profile() if profile else None
+        # Nested stages share the process high-water mark, so only the outermost one resets it.
+        stage_peak = not self._active[:-1] and reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        children_start = children_cpu_s()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                path = ensure_dir(PROFILE_DIR) / f"{name}.prof"
+                profiler.dump_stats(path)
+                record["profile"] = str(path)
+            record["wall_s"] = time.perf_counter() - wall_start
+            record["cpu_s"] = time.process_time() - cpu_start
+            # Without a reset the high-water mark may come from an earlier stage in the same process.
+            record["peak_rss_mb" if stage_peak else "process_peak_rss_mb"] = peak_rss_mb()
+            # Worker processes (05's analysis tasks) count once they have exited and been waited for.
+            record["children_cpu_s"] = children_cpu_s() - children_start
+            record["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+            self._active.pop()
+
+    @contextmanager
+    def substep(self, name: str) -> Iterator[None]:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.record_substep(name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    def record_substep(self, name: str, wall_s: float, cpu_s: float) -> None:
+        record = self._current()
+        if record is None:
+            return
+        step = record["substeps"].setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        step["calls"] += 1
+        step["wall_s"] += wall_s
+        step["cpu_s"] += cpu_s
+
+    def count(self, key: str, n: int | float = 1) -> None:
+        record = self._current()
+        if record is None:
+            return
+        record["counters"][key] = record["counters"].get(key, 0) + n
+
+    def observe(self, key: str, value: float) -> None:
+        record = self._current()
+        if record is None:
+            return
+        obs = record["observations"].setdefault(key, {"n": 0, "sum": 0.0, "min": value, "max": value})
+        obs["n"] += 1
+        obs["sum"] += value
+        obs["min"] = min(obs["min"], value)
+        obs["max"] = max(obs["max"], value)
+
+    def summary(self, name: str) -> Dict[str, Any]:
+        record = dict(self.stages[name])
+        counters = record["counters"]
+        rates = {}
+        for prefix in {key.rsplit(".", 1)[0] for key in counters if key.endswith((".hit", ".miss"))}:
+            hits, misses = counters.get(f"{prefix}.hit", 0), counters.get(f"{prefix}.miss", 0)
+            rates[f"{prefix}.hit_rate"] = hits / (hits + misses) if hits + misses else 0.0
+        record["rates"] = rates
+        for obs in record["observations"].values():
+            obs["mean"] = obs["sum"] / obs["n"] if obs["n"] else 0.0
+        return record
+
+    def write(self, path: Path = RUN_METRICS_PATH) -> None:
+        """Merge finished stages into ``path``, replacing earlier entries for the same stage.
+
+        The read-merge-write holds an exclusive lock on ``<path>.lock``, so stages
+        finishing at the same time in parallel shard processes all keep their entries.
+        """
+        ensure_dir(path.parent)
+        with open(path.with_name(f"{path.name}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data: Dict[str, Any] = {"stages": {}}
+            if path.exists():
+                data = json.loads(path.read_text(encoding="utf-8"))
+            for name in self.stages:
+                if "wall_s" in self.stages[name]:
+                    data["stages"][name] = self.summary(name)
+            data["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+METRICS = RunMetrics()
@@ -0,0 +1,237 @@
+"""Embed and score the corpus under several embedding models in one run.
+
+``compare`` in models.yaml lists extra models, each a set of overrides of
+``embedding`` (``model_name``, ``backend``, ``embedding_dtype``...) under a
+``name``; the ``embedding`` model itself runs as ``primary``. One pass over
+``segments.jsonl`` feeds every model the same segment lists and near-duplicate
+reuse, and each model keeps its own namespaced cache, so models already embedded
+by 03_embed.py (or an earlier comparison) are read back, not re-encoded.
+Configurations that differ only in storage dtype share one loaded model and
+encode each document once.
+
+Per model, outward thresholds are computed as in 04_score_axes.py and the rows
+go to ``data/segments/models/<name>/segments_scored.jsonl``.
+``outputs/tables/model_agreement.csv`` compares every pair of models on the
+segment-level axis scores and the outward flag.
+
+    python -m src.multimodel
+    python -m src.multimodel --models primary bge
+"""
+from __future__ import annotations
+
+import argparse
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.axes import build_axis_vectors, score_segments
+from src.dedup import doc_order_key
+from src.embed import FINGERPRINT_KEYS, EmbeddingEngine, load_model
+from src.metrics import METRICS
+from src.outward_filter import compute_year_thresholds, mark_outward
+from src.quantize import calibration_texts, quantize_config
+from src.utils import ensure_dir, jsonl_read, jsonl_write, load_config_bundle
+
+PRIMARY = "primary"
+AXIS_NAMES = ["security_axis", "growth_axis", "outward_axis"]
+
+
+def model_variants(models_cfg: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """``{name: embedding config}``: the primary model plus each ``compare`` entry over it."""
+    base = models_cfg["embedding"]
+    variants = {PRIMARY: base}
+    for entry in models_cfg.get("compare") or []:
+        overrides = dict(entry)
+        name = overrides.pop("name")
+        if name in variants:
+            raise ValueError(f"Duplicate model name {name!r} in models.yaml compare")
+        variants[name] = {**base, **overrides}
+    return variants
+
+
+class SharedEncoder:
+    """One loaded model for several configurations; repeated calls with the same texts encode once."""
+
+    def __init__(self, model_cfg: Dict[str, Any]):
+        self.model_cfg = model_cfg
+        self._model = None
+        self._last: Tuple[Tuple[str, ...] | None, np.ndarray | None] = (None, None)
+
+    def encode(self, texts: List[str], **kwargs: Any) -> np.ndarray:
+        key = tuple(texts)
+        if self._last[0] != key:
+            if self._model is None:
+                with METRICS.substep("load_model"):
+                    self._model = load_model(self.model_cfg)
+            self._last = (key, self._model.encode(texts, **kwargs))
+        else:
+            METRICS.count("multimodel.shared_encodes")
+        return self._last[1]
+
+
+def build_engines(variants: Dict[str, Dict[str, Any]], cache_root: Path) -> Dict[str, EmbeddingEngine]:
+    encoders: Dict[Tuple[Any, ...], SharedEncoder] = {}
+    engines = {}
+    for name, model_cfg in variants.items():
+        key = tuple(model_cfg.get(k) for k in FINGERPRINT_KEYS if k != "embedding_dtype") + (model_cfg.get("device"),)
+        encoder = encoders.setdefault(key, SharedEncoder(model_cfg))
+        engines[name] = EmbeddingEngine(model_cfg, cache_root, model=encoder)
+    return engines
+
+
+def score_rows(doc: Dict[str, Any], scores: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    rows = []
+    idx = 0
+    for seg in doc["segments"]:
+        if seg["segment_type"] == "heading":
+            seg_scores = {name: 0.0 for name in AXIS_NAMES}
+        else:
+            seg_scores = {name: float(scores[name][idx]) for name in AXIS_NAMES}
+            idx += 1
+        rows.append(
+            {
+                "segment_id": seg["segment_id"],
+                "doc_id": doc["doc_id"],
+                "date": doc["date"],
+                "source_type": doc["source_type"],
+                "segment_type": seg["segment_type"],
+                "char_len": seg["char_len"],
+                "scores": seg_scores,
+                "dup_of": seg.get("dup_of"),
+                "doc_dup_of": doc.get("dup_of"),
+            }
+        )
+    return rows
+
+
+def cohens_kappa(a: np.ndarray, b: np.ndarray) -> float:
+    observed = float(np.mean(a == b))
+    pa, pb = float(np.mean(a)), float(np.mean(b))
+    expected = pa * pb + (1 - pa) * (1 - pb)
+    return (observed - expected) / (1 - expected) if expected < 1 else float("nan")
+
+
+def top_jaccard(a: np.ndarray, b: np.ndarray, fraction: float = 0.1) -> float:
+    k = max(1, int(round(len(a) * fraction)))
+    top_a, top_b = set(np.argsort(-a)[:k]), set(np.argsort(-b)[:k])
+    return len(top_a & top_b) / len(top_a | top_b)
+
+
+def agreement_table(rows: Dict[str, List[Dict[str, Any]]]) -> pd.DataFrame:
+    """Pairwise agreement of segment-level scores (non-heading segments)."""
+    frames = {}
+    for name, model_rows in rows.items():
+        body = [r for r in model_rows if r["segment_type"] != "heading"]
+        frame = pd.DataFrame([r["scores"] for r in body], index=[r["segment_id"] for r in body])
+        frames[name] = frame
+    report = []
+    nan = float("nan")
+    for a, b in combinations(frames, 2):
+        joined = frames[a].join(frames[b], how="inner", lsuffix="_a", rsuffix="_b")
+        enough = len(joined) > 1
+        for axis in AXIS_NAMES:
+            x, y = joined[f"{axis}_a"].to_numpy(), joined[f"{axis}_b"].to_numpy()
+            report.append(
+                {
+                    "model_a": a,
+                    "model_b": b,
+                    "measure": axis,
+                    "n_segments": len(joined),
+                    "pearson": float(np.corrcoef(x, y)[0, 1]) if enough else nan,
+                    "spearman": float(pd.Series(x).corr(pd.Series(y), method="spearman")) if enough else nan,
+                    "top_decile_jaccard": top_jaccard(x, y) if enough else nan,
+                    "agreement": nan,
+                    "kappa": nan,
+                }
+            )
+        x, y = joined["is_outward_a"].to_numpy(bool), joined["is_outward_b"].to_numpy(bool)
+        report.append(
+            {
+                "model_a": a,
+                "model_b": b,
+                "measure": "is_outward",
+                "n_segments": len(joined),
+                "pearson": nan,
+                "spearman": nan,
+                "top_decile_jaccard": nan,
+                "agreement": float(np.mean(x == y)) if enough else nan,
+                "kappa": cohens_kappa(x, y) if enough else nan,
+            }
+        )
+    return pd.DataFrame(report)
+
+
+def run_models(
+    config_dir: str, names: List[str] | None = None, force: bool = False, data_dir: Path = Path("data")
+) -> Dict[str, int]:
+    cfg = load_config_bundle(config_dir)
+    variants = model_variants(cfg["models"])
+    if names:
+        unknown = set(names) - set(variants)
+        if unknown:
+            raise ValueError(f"Unknown models: {sorted(unknown)}; choose from {sorted(variants)}")
+        variants = {name: variants[name] for name in names}
+    engines = build_engines(variants, data_dir / "embeddings")
+    segments_dir = data_dir / "segments"
+    docs = jsonl_read(segments_dir / "segments.jsonl")
+
+    axes = {}
+    for name, engine in engines.items():
+        if engine.embedding_dtype == "int8" and (engine.codec is None or force):
+            quant_cfg = quantize_config(variants[name])
+            texts = calibration_texts(docs, quant_cfg["sample_size"], quant_cfg["seed"])
+            codec = engine.calibrate(texts, quant_cfg["pca_dim"])
+            print(f"[multimodel] {name}: fitted int8 codec {codec.codec_id} ({codec.dim} dims)")
+        with METRICS.substep("axes"):
+            axes[name] = build_axis_vectors(cfg["axes"], engine)
+
+    canonical_ids = {seg["dup_of"] for doc in docs for seg in doc["segments"] if seg.get("dup_of")}
+    shared: Dict[str, Dict[str, np.ndarray]] = {name: {} for name in engines}
+    doc_rows: Dict[str, Dict[str, List[Dict[str, Any]]]] = {name: {} for name in engines}
+    # Visit documents in dedup order so every canonical segment is embedded before its duplicates.
+    for doc in sorted(docs, key=doc_order_key):
+        targets = [seg for seg in doc["segments"] if seg["segment_type"] != "heading"]
+        for name, engine in engines.items():
+            scores: Dict[str, np.ndarray] = {}
+            if targets:
+                with METRICS.substep("embed"):
+                    embeddings = engine.embed_segments(doc["doc_id"], targets, force=force, shared=shared[name])
+                with METRICS.substep("score"):
+                    scores = score_segments(embeddings, axes[name], engine.codec)
+                for idx, seg in enumerate(targets):
+                    if seg["segment_id"] in canonical_ids:
+                        shared[name][seg["segment_id"]] = embeddings[idx]
+            doc_rows[name][doc["doc_id"]] = score_rows(doc, scores)
+        METRICS.count("docs")
+    rows = {name: [row for doc in docs for row in by_doc[doc["doc_id"]]] for name, by_doc in doc_rows.items()}
+
+    percentile = cfg["analysis"]["outward_percentile"]
+    for name, model_rows in rows.items():
+        mark_outward(model_rows, compute_year_thresholds(model_rows, percentile))
+        jsonl_write(ensure_dir(segments_dir / "models" / name) / "segments_scored.jsonl", model_rows)
+        print(f"[multimodel] {name} ({engines[name].namespace}): {len(model_rows)} segments scored")
+    report = agreement_table(rows)
+    out = ensure_dir(Path("outputs/tables")) / "model_agreement.csv"
+    report.to_csv(out, index=False, encoding="utf-8")
+    print(f"[multimodel] wrote {out}")
+    METRICS.count("segments", sum(len(r) for r in rows.values()))
+    return {"models": len(engines), "docs": len(docs)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.multimodel")
+    parser.add_argument("--config-dir", default="config")
+    parser.add_argument("--models", nargs="+", default=None, help="Models to run (default: primary and every compare entry)")
+    parser.add_argument("--force", action="store_true", help="Re-encode instead of reading the per-model caches")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
+    args = parser.parse_args()
+    with METRICS.stage("multimodel", profile=args.profile):
+        run_models(args.config_dir, args.models, args.force)
+    METRICS.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Inverted index from CJK character bigrams to the segments containing them.
+
+The index lives in ``data/ngram_index/``. A bigram is stored as one integer
+(``first << 21 | second`` code points), and the vocabulary is a sorted uint64
+array. Each posting list holds the sorted segment positions of one bigram, as
+varint-encoded gaps, in a single byte buffer addressed by per-bigram offsets.
+Segment texts are appended to ``texts-<generation>.bin`` so that a query can
+check its candidates without reading the corpus.
+
+02_segment.py updates the index after segmenting. Segments of new documents are
+appended, and only the posting lists of their bigrams grow. Documents that were
+re-segmented or dropped are tombstoned. Once more than ``compact_ratio`` of the
+positions are dead, the index is rebuilt from its own live texts.
+
+A phrase query intersects the posting lists of the phrase's bigrams. Only the
+surviving segments are checked with a substring test. Phrases without a CJK
+bigram (a single character, Latin text) fall back to checking every segment.
+
+    python -m src.ngram_index query 人类命运共同体 --source-type mfa_presser --segment-type a_turn
+    python -m src.ngram_index build     # from data/segments/segments.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.binning import binning_config, day_codes, labels_for_days
+from src.metrics import METRICS
+from src.utils import atomic_open, ensure_dir, jsonl_iter, load_config_bundle, sha1_text
+
+INDEX_DIR = Path("ngram_index")
+CJK_LO, CJK_HI = 0x4E00, 0x9FFF
+META_FIELDS = ("segment_id", "doc_id", "date", "source_type", "segment_type")
+
+
+def ngram_index_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"enabled": True, "compact_ratio": 0.5}
+    cfg.update(analysis_cfg.get("ngram_index") or {})
+    return cfg
+
+
+def text_crc(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def phrase_bigrams(phrase: str) -> np.ndarray:
+    return bigram_postings([phrase])[0]
+
+
+def bigram_postings(texts: List[str], base: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct (bigram code, segment position) pairs of ``texts``, sorted by code then position."""
+    if not texts:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    # Joined with a non-CJK separator, so no bigram spans two segments.
+    cp = np.frombuffer("\n".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+    seg = np.repeat(np.arange(base, base + len(texts), dtype=np.int64), lengths)[: len(cp)]
+    cjk = (cp >= CJK_LO) & (cp <= CJK_HI)
+    pair = cjk[:-1] & cjk[1:]
+    codes = (cp[:-1][pair].astype(np.uint64) << np.uint64(21)) | cp[1:][pair].astype(np.uint64)
+    segs = seg[:-1][pair]
+    order = np.lexsort((segs, codes))
+    codes, segs = codes[order], segs[order]
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (codes[1:] != codes[:-1]) | (segs[1:] != segs[:-1])
+    return codes[keep], segs[keep]
+
+
+def varint_encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """LEB128 bytes of ``values`` (non-negative) and the byte count of each value."""
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += v >= np.uint64(1 << (7 * k))
+    if not len(v):
+        return np.zeros(0, dtype=np.uint8), nbytes
+    width = np.arange(int(nbytes.max()))
+    chunks = ((v[:, None] >> (width * 7).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    chunks[width[None, :] < nbytes[:, None] - 1] |= 0x80
+    return chunks[width[None, :] < nbytes[:, None]], nbytes
+
+
+def varint_decode(data: np.ndarray) -> np.ndarray:
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.r_[0, ends[:-1] + 1]
+    value_of = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = ((np.arange(len(data)) - starts[value_of]) * 7).astype(np.uint64)
+    return np.add.reduceat((data & 0x7F).astype(np.uint64) << shifts, starts)
+
+
+def doc_digest(segments: List[Dict[str, Any]]) -> str:
+    return sha1_text("\n".join(f"{s['segment_id']}\t{s['text']}" for s in segments))[:16]
+
+
+class NgramIndex:
+    def __init__(self, root: Path):
+        self.root = root
+        self.grams = np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.uint8)
+        # Last position + 1 of each posting list; the next appended gap is taken from it.
+        self.last = np.zeros(0, dtype=np.uint64)
+        self.meta: Dict[str, np.ndarray] = {field: np.zeros(0, dtype=str) for field in META_FIELDS}
+        self.crc = np.zeros(0, dtype=np.uint32)
+        self.live = np.zeros(0, dtype=bool)
+        self.text_offsets = np.zeros(1, dtype=np.int64)
+        self.docs: Dict[str, str] = {}
+        self.generation = 0
+        self._texts: np.ndarray | None = None
+
+    @classmethod
+    def load(cls, data_dir: Path = Path("data")) -> "NgramIndex":
+        index = cls(data_dir / INDEX_DIR)
+        path = index.root / "index.npz"
+        if not path.exists():
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            index.grams, index.offsets, index.postings = data["grams"], data["offsets"], data["postings"]
+            index.last, index.crc, index.live = data["last"], data["crc"], data["live"]
+            index.text_offsets = data["text_offsets"]
+            index.meta = {field: data[field] for field in META_FIELDS}
+            index.docs = dict(zip(data["doc_keys"].tolist(), data["doc_digests"].tolist()))
+            index.generation = int(data["generation"])
+        return index
+
+    @property
+    def exists(self) -> bool:
+        return (self.root / "index.npz").exists()
+
+    @property
+    def size(self) -> int:
+        return len(self.live)
+
+    @property
+    def texts_path(self) -> Path:
+        return self.root / f"texts-{self.generation}.bin"
+
+    def text(self, position: int) -> str:
+        if self._texts is None and self.text_offsets[-1]:
+            self._texts = np.memmap(self.texts_path, dtype=np.uint8, mode="r")
+        start, end = self.text_offsets[position], self.text_offsets[position + 1]
+        if start == end:
+            return ""
+        return self._texts[start:end].tobytes().decode("utf-8")
+
+    def posting(self, code: int) -> np.ndarray:
+        g = int(np.searchsorted(self.grams, np.uint64(code)))
+        if g >= len(self.grams) or self.grams[g] != code:
+            return np.zeros(0, dtype=np.int64)
+        gaps = varint_decode(self.postings[self.offsets[g] : self.offsets[g + 1]])
+        return np.cumsum(gaps).astype(np.int64) - 1
+
+    def candidates(self, phrase: str) -> np.ndarray:
+        """Live positions holding every bigram of ``phrase`` (all live positions if it has none)."""
+        lists = sorted((self.posting(int(c)) for c in phrase_bigrams(phrase)), key=len)
+        if not lists:
+            return np.flatnonzero(self.live)
+        found = lists[0]
+        for other in lists[1:]:
+            if not len(found):
+                break
+            found = np.intersect1d(found, other, assume_unique=True)
+        return found[self.live[found]]
+
+    def search(self, phrase: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions whose text contains ``phrase`` and the number of (non-overlapping) occurrences."""
+        positions, counts = [], []
+        for position in self.candidates(phrase):
+            count = self.text(int(position)).count(phrase)
+            if count:
+                positions.append(int(position))
+                counts.append(count)
+        METRICS.count("ngram_index.queries")
+        return np.array(positions, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+    def covers(self, rows: List[Dict[str, Any]]) -> bool:
+        """Whether every row's segment is live here with the same text."""
+        live = {sid: crc for sid, crc, alive in zip(self.meta["segment_id"].tolist(), self.crc.tolist(), self.live) if alive}
+        return all(live.get(row["segment_id"]) == text_crc(row["text"]) for row in rows)
+
+    def segment_positions(self) -> Dict[str, int]:
+        return {sid: pos for pos, (sid, alive) in enumerate(zip(self.meta["segment_id"].tolist(), self.live)) if alive}
+
+    def append(self, segments: List[Dict[str, Any]], texts_file: Any) -> None:
+        """Add ``segments`` (with their document's date and source_type) as new positions."""
+        if not segments:
+            return
+        texts = [s["text"] for s in segments]
+        self._texts = None
+        codes, positions = bigram_postings(texts, base=self.size)
+        self._merge_postings(codes, positions)
+        encoded = [t.encode("utf-8") for t in texts]
+        for blob in encoded:
+            texts_file.write(blob)
+        sizes = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        self.text_offsets = np.r_[self.text_offsets, self.text_offsets[-1] + np.cumsum(sizes)]
+        for field in META_FIELDS:
+            self.meta[field] = np.concatenate([self.meta[field], np.array([s[field] for s in segments], dtype=str)])
+        self.crc = np.r_[self.crc, np.array([text_crc(t) for t in texts], dtype=np.uint32)]
+        self.live = np.r_[self.live, np.ones(len(segments), dtype=bool)]
+
+    def _merge_postings(self, codes: np.ndarray, positions: np.ndarray) -> None:
+        if not len(codes):
+            return
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        new_grams = codes[starts]
+        stored = positions.astype(np.uint64) + np.uint64(1)
+        # Gaps within each list; a list's first gap continues from the stored list of that bigram.
+        at = np.searchsorted(self.grams, new_grams)
+        known = at < len(self.grams)
+        known[known] = self.grams[at[known]] == new_grams[known]
+        previous = np.zeros(len(new_grams), dtype=np.uint64)
+        previous[known] = self.last[at[known]]
+        gaps = np.diff(stored, prepend=np.uint64(0))
+        gaps[starts] = stored[starts] - previous
+        added, nbytes = varint_encode(gaps)
+        added_len = np.add.reduceat(nbytes, starts)
+        ends = np.r_[starts[1:], len(codes)] - 1
+
+        grams = np.union1d(self.grams, new_grams)
+        old_at = np.searchsorted(grams, self.grams)
+        new_at = np.searchsorted(grams, new_grams)
+        old_len = np.zeros(len(grams), dtype=np.int64)
+        old_len[old_at] = np.diff(self.offsets)
+        lengths = old_len.copy()
+        lengths[new_at] += added_len
+        offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+        out = np.empty(int(offsets[-1]), dtype=np.uint8)
+        out[np.repeat(offsets[old_at] - self.offsets[:-1], np.diff(self.offsets)) + np.arange(len(self.postings))] = (
+            self.postings
+        )
+        added_offsets = np.r_[0, np.cumsum(added_len)]
+        shift = offsets[new_at] + old_len[new_at] - added_offsets[:-1]
+        out[np.repeat(shift, added_len) + np.arange(len(added))] = added
+        last = np.zeros(len(grams), dtype=np.uint64)
+        last[old_at] = self.last
+        last[new_at] = stored[ends]
+        self.grams, self.offsets, self.postings, self.last = grams, offsets, out, last
+
+    def save(self) -> None:
+        arrays: Dict[str, Any] = {
+            "grams": self.grams,
+            "offsets": self.offsets,
+            "postings": self.postings,
+            "last": self.last,
+            "crc": self.crc,
+            "live": self.live,
+            "text_offsets": self.text_offsets,
+            "doc_keys": np.array(list(self.docs), dtype=str),
+            "doc_digests": np.array(list(self.docs.values()), dtype=str),
+            "generation": np.array(self.generation),
+        }
+        arrays.update(self.meta)
+        with atomic_open(self.root / "index.npz", "wb", durable=True) as f:
+            np.savez(f, **arrays)
+
+
+def doc_segments(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "segment_id": s["segment_id"],
+            "doc_id": doc["doc_id"],
+            "date": doc.get("date") or "",
+            "source_type": doc.get("source_type") or "",
+            "segment_type": s.get("segment_type") or "",
+            "text": s["text"],
+        }
+        for s in doc["segments"]
+    ]
+
+
+def write_fresh(root: Path, docs: Iterable[Tuple[str, str, List[Dict[str, Any]]]], generation: int) -> NgramIndex:
+    """A new index of ``docs`` ((doc_id, digest, segments) triples) as ``generation``."""
+    index = NgramIndex(root)
+    index.generation = generation
+    ensure_dir(root)
+    with open(index.texts_path, "wb") as texts_file:
+        for doc_id, digest, segments in docs:
+            index.append(segments, texts_file)
+            index.docs[doc_id] = digest
+    index.save()
+    for stale in root.glob("texts-*.bin"):
+        if stale != index.texts_path:
+            stale.unlink()
+    return index
+
+
+def update_index(docs: List[Dict[str, Any]], analysis_cfg: Dict[str, Any], data_dir: Path = Path("data")) -> Dict[str, int]:
+    """Bring the index in line with ``docs`` (the complete segmented corpus of ``data_dir``)."""
+    cfg = ngram_index_config(analysis_cfg)
+    with METRICS.substep("ngram_index"):
+        index = NgramIndex.load(data_dir)
+        digests = {doc["doc_id"]: doc_digest(doc["segments"]) for doc in docs}
+        changed = [doc for doc in docs if index.docs.get(doc["doc_id"]) != digests[doc["doc_id"]]]
+        gone = {doc_id for doc_id, digest in index.docs.items() if digests.get(doc_id) != digest}
+        stats = {"docs_added": len(changed), "docs_removed": len(set(index.docs) - set(digests))}
+        if not changed and not gone and index.exists:
+            return {**stats, "segments": int(index.live.sum()), "compacted": 0}
+        dead = int((~index.live | np.isin(index.meta["doc_id"], list(gone))).sum())
+        total = index.size + sum(len(doc["segments"]) for doc in changed)
+        if not index.exists or dead > cfg["compact_ratio"] * total:
+            by_id = {doc["doc_id"]: doc for doc in docs}
+            index = write_fresh(
+                index.root,
+                ((doc_id, digests[doc_id], doc_segments(by_id[doc_id])) for doc_id in digests),
+                index.generation + 1,
+            )
+            stats["compacted"] = 1
+        else:
+            if gone:
+                index.live &= ~np.isin(index.meta["doc_id"], list(gone))
+            with open(index.texts_path, "r+b") as texts_file:
+                # Bytes past the last recorded offset belong to an interrupted update.
+                texts_file.truncate(int(index.text_offsets[-1]))
+                texts_file.seek(0, 2)
+                for doc in changed:
+                    index.append(doc_segments(doc), texts_file)
+            for doc_id in set(index.docs) - set(digests):
+                del index.docs[doc_id]
+            index.docs.update({doc["doc_id"]: digests[doc["doc_id"]] for doc in changed})
+            index.save()
+            stats["compacted"] = 0
+    stats["segments"] = int(index.live.sum())
+    METRICS.count("ngram_index.segments_added", sum(len(doc["segments"]) for doc in changed))
+    return stats
+
+
+def rebuild_index(data_dir: Path = Path("data")) -> Dict[str, int]:
+    """Index ``data_dir/segments/segments.jsonl`` from scratch."""
+    root = data_dir / INDEX_DIR
+    generation = NgramIndex.load(data_dir).generation + 1
+    docs = (
+        (doc["doc_id"], doc_digest(doc["segments"]), doc_segments(doc))
+        for doc in jsonl_iter(data_dir / "segments" / "segments.jsonl")
+    )
+    index = write_fresh(root, docs, generation)
+    return {"docs": len(index.docs), "segments": index.size, "bigrams": len(index.grams)}
+
+
+def filtered_search(
+    index: NgramIndex, phrase: str, source_type: str | None = None, segment_type: str | None = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    positions, counts = index.search(phrase)
+    keep = np.ones(len(positions), dtype=bool)
+    if source_type:
+        keep &= index.meta["source_type"][positions] == source_type
+    if segment_type:
+        keep &= index.meta["segment_type"][positions] == segment_type
+    return positions[keep], counts[keep]
+
+
+def query_table(
+    index: NgramIndex,
+    phrase: str,
+    analysis_cfg: Dict[str, Any],
+    source_type: str | None = None,
+    segment_type: str | None = None,
+) -> pd.DataFrame:
+    """Occurrences, segments and documents per time bin for one phrase."""
+    positions, counts = filtered_search(index, phrase, source_type, segment_type)
+    binning, periods = binning_config(analysis_cfg)
+    frame = pd.DataFrame(
+        {
+            "bin": labels_for_days(day_codes(index.meta["date"][positions].tolist()), binning, periods),
+            "occurrences": counts,
+            "doc_id": index.meta["doc_id"][positions],
+        }
+    ).dropna(subset=["bin"])
+    columns = ["bin", "occurrences", "segments", "docs"]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+    grouped = frame.groupby("bin", sort=True)
+    out = grouped.agg(occurrences=("occurrences", "sum"), segments=("doc_id", "size"), docs=("doc_id", "nunique"))
+    return out.reset_index()[columns]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.ngram_index")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Rebuild the index from data/segments/segments.jsonl")
+    query = sub.add_parser("query", help="Count a phrase per time bin")
+    query.add_argument("phrase")
+    query.add_argument("--source-type", default=None)
+    query.add_argument("--segment-type", default=None, help="e.g. a_turn, q_turn, body")
+    query.add_argument("--show", type=int, default=0, help="Also print the first N matching segments")
+    query.add_argument("--json", action="store_true", help="Print the table as JSON lines")
+    args = parser.parse_args()
+    cfg = load_config_bundle(args.config_dir)
+    with METRICS.stage(f"ngram_{args.command}"):
+        if args.command == "build":
+            stats = rebuild_index()
+            print("[ngram] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+        else:
+            index = NgramIndex.load()
+            if not index.exists:
+                raise SystemExit(f"No n-gram index in {index.root}; run 02_segment.py or `python -m src.ngram_index build`")
+            table = query_table(index, args.phrase, cfg["analysis"], args.source_type, args.segment_type)
+            if args.json:
+                for record in table.to_dict(orient="records"):
+                    print(json.dumps(record, ensure_ascii=False))
+            else:
+                print(table.to_string(index=False) if not table.empty else f"[ngram] no segment contains {args.phrase!r}")
+            if args.show:
+                positions, _ = filtered_search(index, args.phrase, args.source_type, args.segment_type)
+                for position in positions[: args.show]:
+                    meta = {field: str(index.meta[field][position]) for field in META_FIELDS}
+                    print(f"{meta['date']} {meta['source_type']} {meta['segment_id']}: {index.text(int(position))}")
+    METRICS.write()
+
+
+if __name__ == "__main__":
+    main()
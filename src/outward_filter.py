@@ -5,20 +5,45 @@ from typing import Any, Dict, List, Tuple
 
 import numpy as np
 
+from src.sketch import KLLSketch
+
+
+def outward_group(row: Dict[str, Any]) -> Tuple[str, str]:
+    return row["date"][:4], row["source_type"]
+
 
 def compute_year_thresholds(rows: List[Dict[str, Any]], percentile: float) -> Dict[Tuple[str, str], float]:
     by_group: Dict[Tuple[str, str], List[float]] = defaultdict(list)
     for row in rows:
-        year = row["date"][:4]
-        by_group[(year, row["source_type"])] .append(row["scores"]["outward_axis"])
+        by_group[outward_group(row)].append(row["scores"]["outward_axis"])
     thresholds = {}
     for key, values in by_group.items():
         thresholds[key] = float(np.percentile(values, percentile * 100)) if values else 0.0
     return thresholds
 
 
+def sketch_year_thresholds(
+    sketches: Dict[Tuple[str, str], KLLSketch], percentile: float, delta: float = 0.01
+) -> List[Dict[str, Any]]:
+    """Per-group thresholds from streaming sketches, with their rank-error bounds."""
+    report = []
+    for (year, source_type), sketch in sorted(sketches.items()):
+        error = sketch.rank_error(delta)
+        report.append(
+            {
+                "year": year,
+                "source_type": source_type,
+                "n": sketch.n,
+                "threshold": sketch.quantile(percentile),
+                "retained": sketch.size(),
+                "rank_error_worst": error["worst"],
+                f"rank_error_p{int(round((1 - delta) * 100))}": error["bound"],
+            }
+        )
+    return report
+
+
 def mark_outward(rows: List[Dict[str, Any]], thresholds: Dict[Tuple[str, str], float]) -> None:
     for row in rows:
-        key = (row["date"][:4], row["source_type"])
-        row["scores"]["is_outward"] = row["scores"]["outward_axis"] >= thresholds.get(key, 0.0)
+        row["scores"]["is_outward"] = row["scores"]["outward_axis"] >= thresholds.get(outward_group(row), 0.0)
 
@@ -0,0 +1,187 @@
+"""Run a range of pipeline stages in one process.
+
+Documents, embedding arrays and the embedding model are handed from stage to
+stage in memory; only the last stage of the range writes its aggregate JSONL
+unless ``--write-all`` is given. Usage::
+
+    python -m src.pipeline --from segment --to score
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, List
+
+from src.metrics import METRICS
+from src.shards import SHARDABLE_STAGES, shard_data_dir
+
+STAGES = [
+    ("collect", "01_collect.py"),
+    ("segment", "02_segment.py"),
+    ("dedup", "02b_dedup.py"),
+    ("embed", "03_embed.py"),
+    ("score", "04_score_axes.py"),
+    ("analyze", "05_run_tests.py"),
+    ("export", "06_export_excerpt_bank.py"),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+STAGE_NUMBERS = [filename.split("_", 1)[0] for _, filename in STAGES]
+
+
+def stage_index(value: str) -> int:
+    """Resolve a stage name or script number (``3``, ``03``, ``02b``) to its position."""
+    if value in STAGE_NAMES:
+        return STAGE_NAMES.index(value)
+    number = value.zfill(2) if value.isdigit() else value
+    if number in STAGE_NUMBERS:
+        return STAGE_NUMBERS.index(number)
+    raise ValueError(f"Unknown stage {value!r}; choose from {STAGE_NAMES} or {STAGE_NUMBERS}")
+
+
+def load_stage(name: str) -> ModuleType:
+    """Import a numbered stage script by path; only the stages that run are imported."""
+    filename = dict(STAGES)[name]
+    spec = importlib.util.spec_from_file_location(f"stage_{name}", REPO_ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class PipelineRunner:
+    def __init__(self, config_dir: str, write_all: bool = False, shard: str | None = None):
+        self.config_dir = config_dir
+        # A shard directory must be self-contained for merging, so shards write every stage's output.
+        self.write_all = write_all or shard is not None
+        self.shard = shard
+        self.data_dir = shard_data_dir(shard)
+        self.state: Dict[str, Any] = {}
+        self._embedder = None
+
+    def embedder(self):
+        if self._embedder is None:
+            from src.embed import EmbeddingEngine
+            from src.utils import load_config_bundle
+
+            cfg = load_config_bundle(self.config_dir)
+            self._embedder = EmbeddingEngine(cfg["models"]["embedding"], self.data_dir / "embeddings")
+        return self._embedder
+
+    def run(self, stages: List[str], args: argparse.Namespace) -> None:
+        for pos, name in enumerate(stages):
+            write = self.write_all or pos == len(stages) - 1
+            module = load_stage(name)
+            started = time.perf_counter()
+            with METRICS.stage(name, profile=args.profile):
+                getattr(self, f"_run_{name}")(module, args, write)
+            METRICS.write()
+            print(f"[pipeline] {name}: {time.perf_counter() - started:.2f}s")
+
+    def _run_collect(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        self.state["docs"] = module.collect_docs(
+            self.config_dir,
+            args.analysis_start,
+            args.analysis_end,
+            args.force,
+            write=write,
+            data_dir=self.data_dir,
+            shard=self.shard,
+            resume=args.resume,
+        )
+
+    def _run_segment(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        self.state["docs"] = module.segment_docs(
+            self.config_dir, docs=self.state.get("docs"), write=write, data_dir=self.data_dir, resume=args.resume
+        )
+
+    def _run_dedup(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        self.state["docs"] = module.dedup_docs(
+            self.config_dir, docs=self.state.get("docs"), write=write, data_dir=self.data_dir
+        )
+
+    def _run_embed(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        self.state["docs"], self.state["arrays"] = module.embed_segments(
+            self.config_dir,
+            args.force,
+            docs=self.state.get("docs"),
+            embedder=self.embedder(),
+            write=write,
+            data_dir=self.data_dir,
+            resume=args.resume,
+        )
+
+    def _run_score(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        if args.stream:
+            # Streaming scoring always writes segments_scored.jsonl; later stages read it back.
+            module.score_axes_streaming(
+                self.config_dir,
+                args.force,
+                docs=self.state.pop("docs", None),
+                embedder=self.embedder(),
+                arrays=self.state.get("arrays"),
+                data_dir=self.data_dir,
+                resume=args.resume,
+            )
+            self.state["rows"] = None
+            return
+        self.state["rows"] = module.score_axes(
+            self.config_dir,
+            args.force,
+            docs=self.state.get("docs"),
+            embedder=self.embedder(),
+            arrays=self.state.get("arrays"),
+            write=write,
+            data_dir=self.data_dir,
+            resume=args.resume,
+        )
+
+    def _run_analyze(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        module.run_tests(
+            self.config_dir,
+            rows=self.state.get("rows"),
+            arrays=self.state.get("arrays"),
+            only=args.only,
+            skip=args.skip,
+            workers=args.workers,
+        )
+
+    def _run_export(self, module: ModuleType, args: argparse.Namespace, write: bool) -> None:
+        module.export_excerpt_bank(self.config_dir, rows=self.state.get("rows"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.pipeline")
+    parser.add_argument("--config-dir", default="config")
+    parser.add_argument("--from", dest="start", default="collect", help="First stage (name or script number, e.g. 02b)")
+    parser.add_argument("--to", dest="end", default="export", help="Last stage (name or script number)")
+    parser.add_argument("--analysis-start", default=None)
+    parser.add_argument("--analysis-end", default=None)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--resume", action="store_true", help="Skip documents already finished in each stage's journal (data/journal/)"
+    )
+    parser.add_argument("--write-all", action="store_true", help="Also write intermediate aggregate JSONL files")
+    parser.add_argument("--shard", default=None, help="Run stages up to score for one year shard (see src.shards)")
+    parser.add_argument("--stream", action="store_true", help="Score with bounded memory (see 04_score_axes.py)")
+    parser.add_argument("--only", nargs="+", default=None, help="Analyses to run in the analyze stage")
+    parser.add_argument("--skip", nargs="+", default=None, help="Analyses to skip in the analyze stage")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile per stage to outputs/profiles/")
+    args = parser.parse_args()
+    first, last = stage_index(args.start), stage_index(args.end)
+    if first > last:
+        parser.error("--from must not come after --to")
+    stages = STAGE_NAMES[first : last + 1]
+    if args.shard and not set(stages) <= set(SHARDABLE_STAGES):
+        parser.error(f"--shard only applies to {SHARDABLE_STAGES}; merge shards before later stages")
+    PipelineRunner(args.config_dir, args.write_all, args.shard).run(stages, args)
+
+
+if __name__ == "__main__":
+    main()
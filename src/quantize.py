@@ -0,0 +1,223 @@
+"""Compressed embedding storage: int8 scalar quantization with optional PCA.
+
+With ``embedding_dtype: int8`` in models.yaml, ``03_embed.py`` fits an
+``EmbeddingCodec`` on a sample of segments and stores it as ``codec.npz`` next
+to the embedding cache. The codec optionally projects vectors onto the top
+``pca_dim`` principal components of the sample, then maps each dimension to
+int8 with its own offset and scale. Cached embeddings are the int8 codes.
+
+Consumers never rebuild full vectors: an axis score is linear in the codes
+(``codes @ weights + bias``, see ``project_axis``), and clustering runs on
+``decode``, the float32 coordinates in the (possibly reduced) codec space,
+where distances match those between reconstructed vectors.
+
+``python -m src.quantize validate`` re-encodes a sample at full precision and
+reports axis-score error and cluster agreement for float16 and for the codec.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.utils import atomic_open, ensure_dir, jsonl_iter, load_config_bundle
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+CODEC_NAME = "codec.npz"
+LEVELS = 255
+
+
+def quantize_config(model_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"pca_dim": None, "sample_size": 5000, "seed": 42}
+    cfg.update(model_cfg.get("quantize") or {})
+    return cfg
+
+
+class EmbeddingCodec:
+    def __init__(
+        self,
+        lo: np.ndarray,
+        scale: np.ndarray,
+        mean: np.ndarray | None = None,
+        components: np.ndarray | None = None,
+    ):
+        self.lo = lo.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+        self.mean = None if mean is None else mean.astype(np.float32)
+        self.components = None if components is None else components.astype(np.float32)
+
+    @classmethod
+    def fit(cls, sample: np.ndarray, pca_dim: int | None = None) -> "EmbeddingCodec":
+        sample = np.asarray(sample, dtype=np.float32)
+        mean = components = None
+        if pca_dim:
+            mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            components = vt[: min(pca_dim, vt.shape[0])]
+        coords = sample if components is None else (sample - mean) @ components.T
+        lo, hi = coords.min(axis=0), coords.max(axis=0)
+        scale = np.where(hi > lo, (hi - lo) / LEVELS, 1.0)
+        return cls(lo, scale, mean, components)
+
+    @property
+    def dim(self) -> int:
+        return int(self.lo.shape[0])
+
+    @property
+    def codec_id(self) -> str:
+        digest = hashlib.sha1()
+        for part in [self.lo, self.scale] + ([self.mean, self.components] if self.components is not None else []):
+            digest.update(part.tobytes())
+        return digest.hexdigest()[:16]
+
+    def _coords(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors if self.components is None else (vectors - self.mean) @ self.components.T
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """int8 codes; values outside the fitted range are clipped."""
+        levels = np.rint((self._coords(vectors) - self.lo) / self.scale)
+        return (np.clip(levels, 0, LEVELS) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """float32 coordinates in codec space (``pca_dim`` columns when PCA is on)."""
+        return self.lo + self.scale * (codes.astype(np.float32) + 128.0)
+
+    def reconstruct(self, codes: np.ndarray) -> np.ndarray:
+        coords = self.decode(codes)
+        return coords if self.components is None else coords @ self.components + self.mean
+
+    def project_axis(self, axis: np.ndarray) -> Tuple[np.ndarray, Any]:
+        """``(weights, bias)`` with ``codes @ weights + bias == reconstruct(codes) @ axis``.
+
+        ``axis`` may also be a ``(dim, k)`` matrix of axes; the bias is then one per column.
+        """
+        axis = np.asarray(axis, dtype=np.float32)
+        bias = np.zeros(axis.shape[1:], dtype=np.float32)
+        if self.components is not None:
+            bias = self.mean @ axis
+            axis = self.components @ axis
+        scale = self.scale if axis.ndim == 1 else self.scale[:, None]
+        return scale * axis, bias + (self.lo + 128.0 * self.scale) @ axis
+
+    def scores(self, codes: np.ndarray, axis: np.ndarray) -> np.ndarray:
+        weights, bias = self.project_axis(axis)
+        return codes @ weights + np.float32(bias)
+
+    def save(self, path: Path) -> None:
+        arrays = {"lo": self.lo, "scale": self.scale}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        with atomic_open(path, "wb", durable=True) as f:
+            np.savez(f, **arrays)
+
+
+def load_codec(path: Path) -> EmbeddingCodec | None:
+    if not path.exists():
+        return None
+    data = np.load(path)
+    pca = "components" in data
+    return EmbeddingCodec(
+        data["lo"], data["scale"], data["mean"] if pca else None, data["components"] if pca else None
+    )
+
+
+def as_matrix(embeddings: np.ndarray, codec: EmbeddingCodec | None) -> np.ndarray:
+    """float32 matrix for distance-based analyses: codec coordinates for int8 codes."""
+    if embeddings.dtype == np.int8:
+        if codec is None:
+            raise ValueError(f"int8 embeddings found but no {CODEC_NAME}; re-run 03_embed.py")
+        return codec.decode(embeddings)
+    return embeddings.astype(np.float32)
+
+
+def transcode(codes: np.ndarray, source: EmbeddingCodec, target: EmbeddingCodec) -> np.ndarray:
+    return target.encode(source.reconstruct(codes))
+
+
+def calibration_texts(docs: List[Dict[str, Any]], sample_size: int, seed: int) -> List[str]:
+    """Distinct non-heading segment texts, sampled reproducibly."""
+    texts = sorted(
+        {seg["text"] for doc in docs for seg in doc["segments"] if seg["segment_type"] != "heading" and not seg.get("dup_of")}
+    )
+    if len(texts) <= sample_size:
+        return texts
+    picks = np.random.default_rng(seed).choice(len(texts), size=sample_size, replace=False)
+    return [texts[i] for i in sorted(picks)]
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    import pandas as pd
+
+    return float(pd.Series(a).corr(pd.Series(b), method="spearman"))
+
+
+def validate(config_dir: str, sample_size: int, k: int, data_dir: Path = Path("data")) -> pd.DataFrame:
+    import pandas as pd
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+
+    from src.axes import build_axis_vectors
+    from src.embed import EmbeddingEngine
+
+    cfg = load_config_bundle(config_dir)
+    model_cfg = cfg["models"]["embedding"]
+    engine = EmbeddingEngine(model_cfg, data_dir / "embeddings")
+    codec = engine.codec or load_codec(engine.cache_dir / CODEC_NAME)
+    if codec is None:
+        raise ValueError(f"No {CODEC_NAME} in {engine.cache_dir}; run 03_embed.py with embedding_dtype: int8")
+    docs = list(jsonl_iter(data_dir / "segments" / "segments_embedded.jsonl"))
+    texts = calibration_texts(docs, sample_size, quantize_config(model_cfg)["seed"] + 1)
+    full = engine.embed_texts(texts).astype(np.float32)
+    axes = build_axis_vectors(cfg["axes"], engine)
+    k = min(k, len(texts))
+    seed = cfg["analysis"]["cluster"]["random_state"]
+    reference = KMeans(n_clusters=k, random_state=seed, n_init=10).fit_predict(full)
+
+    half, codes = full.astype(np.float16), codec.encode(full)
+    codec_name = "int8" if codec.components is None else f"int8_pca{codec.dim}"
+    variants = {
+        "float16": (half, lambda axis: half.astype(np.float32) @ axis),
+        codec_name: (codes, lambda axis: codec.scores(codes, axis)),
+    }
+    report = []
+    for name, (stored, score) in variants.items():
+        labels = KMeans(n_clusters=k, random_state=seed, n_init=10).fit_predict(as_matrix(stored, codec))
+        row: Dict[str, Any] = {
+            "variant": name,
+            "segments": len(texts),
+            "bytes_per_vector": stored.shape[1] * stored.itemsize,
+            "cluster_ari": float(adjusted_rand_score(reference, labels)),
+        }
+        for axis_name, axis in axes.items():
+            exact, approx = full @ axis, score(axis)
+            row[f"{axis_name}_max_abs_err"] = float(np.max(np.abs(approx - exact)))
+            row[f"{axis_name}_mean_abs_err"] = float(np.mean(np.abs(approx - exact)))
+            row[f"{axis_name}_spearman"] = spearman(exact, approx)
+        report.append(row)
+    return pd.DataFrame(report)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.quantize")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("validate", help="Compare compressed embeddings against full-precision vectors")
+    check.add_argument("--sample", type=int, default=2000, help="Segments to re-encode at full precision")
+    check.add_argument("--k", type=int, default=None, help="Clusters for the agreement check (default: cluster.k)")
+    args = parser.parse_args()
+    k = args.k or load_config_bundle(args.config_dir)["analysis"]["cluster"]["k"]
+    report = validate(args.config_dir, args.sample, k)
+    out = ensure_dir(Path("outputs/tables")) / "quantization_validation.csv"
+    report.to_csv(out, index=False, encoding="utf-8")
+    print(report.to_string(index=False))
+    print(f"[quantize] wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
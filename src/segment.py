@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import math
+import re
+from typing import Any, Callable, Dict, List, Tuple
 
 from src.utils import normalize_ws, text_hash
 
+TokenCounter = Callable[[List[str]], List[int]]
+SENTENCE_RE = re.compile(r"[^。！？；]*[。！？；]+[”’」』）)]*|[^。！？；]+")
+PACKED_TYPES = ("body",)
+
 
 def build_segments(doc_id: str, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     out = []
@@ -31,3 +37,80 @@ def merge_document(doc: Dict[str, Any], segments: List[Dict[str, Any]]) -> Dict[
     doc_out["clean_text"] = "\n".join(seg["text"] for seg in segments)
     return doc_out
 
+
+def segmentation_config(analysis_cfg: Dict[str, Any], model_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """``mode`` is ``lines`` (one segment per line or turn) or ``sentences``; the token
+    budget never exceeds what the encoder sees (``max_length`` minus two special tokens)."""
+    cfg = {"mode": "lines", "max_tokens": 256}
+    cfg.update(analysis_cfg.get("segmentation") or {})
+    if cfg["mode"] not in ("lines", "sentences"):
+        raise ValueError(f"segmentation.mode must be 'lines' or 'sentences', got {cfg['mode']!r}")
+    cfg["max_tokens"] = max(1, min(int(cfg["max_tokens"]), int(model_cfg["max_length"]) - 2))
+    return cfg
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split after 。！？； (and any closing quotes or brackets that follow)."""
+    return [s.strip() for s in SENTENCE_RE.findall(text) if s.strip()]
+
+
+def _split_long(sentence: str, tokens: int, budget: int, count_tokens: TokenCounter) -> List[Tuple[str, int]]:
+    """Cut a sentence longer than the budget into near-equal character spans that fit."""
+    pieces = math.ceil(tokens / budget)
+    while True:
+        step = math.ceil(len(sentence) / pieces)
+        parts = [sentence[i : i + step] for i in range(0, len(sentence), step)]
+        counts = count_tokens(parts)
+        if max(counts) <= budget or step == 1:
+            return list(zip(parts, counts))
+        pieces += 1
+
+
+def pack_segments(segments: List[Dict[str, Any]], budget: int, count_tokens: TokenCounter) -> List[Dict[str, Any]]:
+    """Re-cut adapter segments into runs of whole sentences of at most ``budget`` tokens.
+
+    Headings pass through unchanged and q_turn/a_turn segments are packed on their
+    own, so turn boundaries survive; consecutive body paragraphs are packed together.
+    Paragraphs packed into one segment are joined by a newline, which
+    ``build_segments`` folds into a space.
+    """
+    units: List[Tuple[int, str]] = []
+    for pos, seg in enumerate(segments):
+        if seg["segment_type"] != "heading":
+            units.extend((pos, sentence) for sentence in split_sentences(seg["text"]))
+    counts = count_tokens([sentence for _, sentence in units]) if units else []
+    sentences: Dict[int, List[Tuple[str, int]]] = {}
+    for (pos, sentence), tokens in zip(units, counts):
+        pieces = _split_long(sentence, tokens, budget, count_tokens) if tokens > budget else [(sentence, tokens)]
+        sentences.setdefault(pos, []).extend(pieces)
+
+    out: List[Dict[str, Any]] = []
+    current: Dict[str, Any] | None = None
+    last_pos = -1
+
+    def flush() -> None:
+        nonlocal current
+        if current is not None:
+            out.append({"segment_index": len(out), "segment_type": current["type"], "text": current["text"]})
+            current = None
+
+    for pos, seg in enumerate(segments):
+        seg_type = seg["segment_type"]
+        if seg_type == "heading":
+            flush()
+            out.append({**seg, "segment_index": len(out)})
+            continue
+        if current is not None and (current["type"] != seg_type or seg_type not in PACKED_TYPES):
+            flush()
+        for sentence, tokens in sentences.get(pos, []):
+            if current is not None and current["tokens"] + tokens > budget:
+                flush()
+            if current is None:
+                current = {"type": seg_type, "text": sentence, "tokens": tokens}
+            else:
+                joiner = "\n" if pos != last_pos else ""
+                current["text"] += joiner + sentence
+                current["tokens"] += tokens
+            last_pos = pos
+    flush()
+    return out
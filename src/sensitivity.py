@@ -0,0 +1,353 @@
+"""Seed sensitivity of the axis scores, trends and coupling statistics.
+
+Every axis is the normalised mean of its seed embeddings. ``axis_variants``
+builds, per axis, the baseline plus one leave-one-seed-out variant per seed and
+``n_bootstrap`` variants from seeds resampled with replacement. All variants of
+all axes form one ``(dim, V)`` matrix, and a single blocked pass over the
+embedding store scores every segment against all of them (``codes @ weights +
+bias`` for int8 caches). The ``(segments, V)`` score matrix is spilled to a
+memmap.
+
+An analysis variant changes one axis and keeps the baseline for the others.
+Outward thresholds are recomputed per variant, exactly as in 04_score_axes.py.
+Per-bin sufficient statistics for all variants then come from indicator-matrix
+products, block by block, so the trend and coupling tables for hundreds of
+variants cost about the same as one.
+
+    python -m src.sensitivity --bootstrap 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.binning import binning_config, day_codes, labels_for_days
+from src.dedup import is_duplicate
+from src.metrics import METRICS
+from src.tests.bootstrap import cohens_d_from_sums, pearson_from_sums, ratio
+from src.utils import ensure_dir, load_config_bundle
+
+AXIS_KEYS = {"security": "security_axis", "growth": "growth_axis", "outward": "outward_axis"}
+TREND_STATS = ["security_mean", "growth_mean"]
+COUPLING_STATS = ["corr_outward_security", "corr_outward_growth", "d_security", "d_growth"]
+
+
+def sensitivity_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"n_bootstrap": 100, "seed": 42, "block_rows": 8192, "ci": 0.95}
+    cfg.update(analysis_cfg.get("sensitivity") or {})
+    return cfg
+
+
+def normalize_columns(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=0, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def axis_variants(seeds: np.ndarray, n_bootstrap: int, rng: np.random.Generator) -> Tuple[List[str], np.ndarray]:
+    """Labels and ``(dim, V)`` unit axes: ``base``, ``loo:<i>`` per seed, ``boot:<j>``."""
+    seeds = np.asarray(seeds, dtype=np.float64)
+    m = seeds.shape[0]
+    columns = [seeds.mean(axis=0, keepdims=True)]
+    labels = ["base"]
+    if m > 1:
+        columns.append((seeds.sum(axis=0) - seeds) / (m - 1))
+        labels += [f"loo:{i}" for i in range(m)]
+    if n_bootstrap:
+        columns.append(seeds[rng.integers(0, m, size=(n_bootstrap, m))].mean(axis=1))
+        labels += [f"boot:{j}" for j in range(n_bootstrap)]
+    return labels, normalize_columns(np.concatenate(columns).T).astype(np.float32)
+
+
+def _scored_rows(path: Path) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    doc_id, rows = None, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if row["doc_id"] != doc_id and rows:
+                yield doc_id, rows
+                rows = []
+            doc_id = row["doc_id"]
+            rows.append(row)
+    if rows:
+        yield doc_id, rows
+
+
+def score_store(
+    scored_path: Path, embedder: Any, axes: np.ndarray, out: np.ndarray, block_rows: int
+) -> Dict[str, Any]:
+    """Fill ``out`` (rows of ``scored_path`` x variants) with one GEMM per block of embeddings.
+
+    Headings score 0 against every variant, as in 04_score_axes.py. Returns the
+    row metadata the statistics need.
+    """
+    codec = getattr(embedder, "codec", None)
+    projected = codec.project_axis(axes) if codec is not None else None
+    codec_id = codec.codec_id if codec is not None else None
+    meta: Dict[str, List[Any]] = {"date": [], "source_type": [], "char_len": [], "dup": []}
+    block: List[np.ndarray] = []
+    targets: List[int] = []
+
+    def flush() -> None:
+        if not block:
+            return
+        x = np.concatenate(block)
+        if x.dtype == np.int8:
+            scores = x @ projected[0] + projected[1]
+        else:
+            scores = x.astype(np.float32) @ axes
+        out[np.array(targets)] = scores
+        METRICS.count("sensitivity.blocks")
+        block.clear()
+        targets.clear()
+
+    pos = 0
+    for doc_id, rows in _scored_rows(scored_path):
+        body = [i for i, r in enumerate(rows) if r["segment_type"] != "heading"]
+        cached = embedder.load_cache(doc_id) if body else None
+        if body and (
+            cached is None
+            or cached["segment_ids"] != [rows[i]["segment_id"] for i in body]
+            or cached["codec_id"] != codec_id
+        ):
+            raise ValueError(f"Embedding cache for {doc_id} is missing or stale; re-run 03_embed.py")
+        for row in rows:
+            meta["date"].append(row["date"])
+            meta["source_type"].append(row["source_type"])
+            meta["char_len"].append(row["char_len"])
+            meta["dup"].append(is_duplicate(row))
+        out[pos : pos + len(rows)] = 0.0
+        if body:
+            block.append(cached["embeddings"])
+            targets.extend(pos + i for i in body)
+            if len(targets) >= block_rows:
+                flush()
+        pos += len(rows)
+    flush()
+    return meta
+
+
+class VariantPlan:
+    """Which score column each analysis variant uses for the three axes."""
+
+    def __init__(self, labels: Dict[str, List[str]]):
+        self.offsets: Dict[str, int] = {}
+        start = 0
+        for axis, names in labels.items():
+            self.offsets[axis] = start
+            start += len(names)
+        self.n_columns = start
+        base = {axis: self.offsets[axis] for axis in labels}
+        self.rows: List[Dict[str, Any]] = [{"axis": "baseline", "variant": "base", **base}]
+        for axis, names in labels.items():
+            for pos, name in enumerate(names):
+                if name != "base":
+                    self.rows.append({"axis": axis, "variant": name, **{**base, axis: self.offsets[axis] + pos}})
+        self.columns = {axis: np.array([r[axis] for r in self.rows]) for axis in labels}
+        # Variants differing only in a non-outward axis share the baseline outward column.
+        self.outward_columns, self.outward_of = np.unique(self.columns["outward"], return_inverse=True)
+
+
+def group_index(keys: List[Any]) -> Tuple[List[Any], np.ndarray]:
+    """Sorted unique keys and each row's position in them (``-1`` for ``None``)."""
+    valid = sorted({k for k in keys if k is not None})
+    lookup = {k: i for i, k in enumerate(valid)}
+    return valid, np.array([lookup.get(k, -1) if k is not None else -1 for k in keys], dtype=np.int64)
+
+
+def indicator(index: np.ndarray, n_groups: int) -> np.ndarray:
+    g = np.zeros((n_groups, index.size), dtype=np.float64)
+    hit = index >= 0
+    g[index[hit], np.flatnonzero(hit)] = 1.0
+    return g
+
+
+def variant_statistics(
+    scores: np.ndarray,
+    meta: Dict[str, List[Any]],
+    plan: VariantPlan,
+    analysis_cfg: Dict[str, Any],
+    block_rows: int,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Trend and coupling statistics per bin for every analysis variant (long format)."""
+    binning, periods = binning_config(analysis_cfg)
+    n = len(meta["date"])
+    days = day_codes(meta["date"])
+    bins = labels_for_days(days, binning, periods)
+    years = [d[:4] for d in meta["date"]]
+    source = np.array(meta["source_type"], dtype=object)
+    weight = np.array(meta["char_len"], dtype=np.float64)
+    keep = np.ones(n, dtype=bool)
+    if (analysis_cfg.get("dedup") or {}).get("exclude_from_analyses"):
+        keep &= ~np.array(meta["dup"], dtype=bool)
+
+    # Outward thresholds per (year, source_type) and outward column, over all rows as in 04.
+    groups, group_of = group_index(list(zip(years, meta["source_type"])))
+    pct = analysis_cfg["outward_percentile"] * 100
+    thresholds = np.zeros((len(groups), plan.outward_columns.size))
+    for g in range(len(groups)):
+        rows = np.flatnonzero(group_of == g)
+        thresholds[g] = np.percentile(scores[rows][:, plan.outward_columns], pct, axis=0)
+
+    trend_keys, trend_of = group_index(
+        [(b, s) if b is not None and k else None for b, s, k in zip(bins, meta["source_type"], keep)]
+    )
+    coupling_keys, coupling_of = group_index(
+        [b if b is not None and k and s == "mfa_presser" else None for b, s, k in zip(bins, source, keep)]
+    )
+    n_variants = len(plan.rows)
+    trend = {name: np.zeros((len(trend_keys), n_variants)) for name in ["w", "ws", "wg"]}
+    coupling_names = ["n", "o", "s", "g", "oo", "ss", "gg", "os", "og", "m", "ms", "mss", "mg", "mgg"]
+    coupling = {name: np.zeros((len(coupling_keys), n_variants)) for name in coupling_names}
+    for start in range(0, n, block_rows):
+        stop = min(n, start + block_rows)
+        block = np.asarray(scores[start:stop], dtype=np.float64)
+        s = block[:, plan.columns["security"]]
+        g = block[:, plan.columns["growth"]]
+        o = block[:, plan.columns["outward"]]
+        m = (o >= thresholds[group_of[start:stop]][:, plan.outward_of]).astype(np.float64)
+        w = weight[start:stop, None]
+        t_ind = indicator(trend_of[start:stop], len(trend_keys))
+        for name, values in [("w", w * m), ("ws", w * m * s), ("wg", w * m * g)]:
+            trend[name] += t_ind @ values
+        c_ind = indicator(coupling_of[start:stop], len(coupling_keys))
+        ones = np.ones_like(o)
+        values = {
+            "n": ones, "o": o, "s": s, "g": g, "oo": o * o, "ss": s * s, "gg": g * g, "os": o * s, "og": o * g,
+            "m": m, "ms": m * s, "mss": m * s * s, "mg": m * g, "mgg": m * g * g,
+        }
+        for name in coupling_names:
+            coupling[name] += c_ind @ values[name]
+
+    trend_stats = {
+        "security_mean": np.nan_to_num(ratio(trend["ws"], trend["w"])),
+        "growth_mean": np.nan_to_num(ratio(trend["wg"], trend["w"])),
+    }
+    n_all, n_in = coupling["n"], coupling["m"]
+    coupling_stats = {
+        "corr_outward_security": pearson_from_sums(n_all, coupling["o"], coupling["s"], coupling["oo"], coupling["ss"], coupling["os"]),
+        "corr_outward_growth": pearson_from_sums(n_all, coupling["o"], coupling["g"], coupling["oo"], coupling["gg"], coupling["og"]),
+        "d_security": cohens_d_from_sums(
+            n_in, coupling["ms"], coupling["mss"], n_all - n_in, coupling["s"] - coupling["ms"], coupling["ss"] - coupling["mss"]
+        ),
+        "d_growth": cohens_d_from_sums(
+            n_in, coupling["mg"], coupling["mgg"], n_all - n_in, coupling["g"] - coupling["mg"], coupling["gg"] - coupling["mgg"]
+        ),
+    }
+    trend_keys_frame = pd.DataFrame(trend_keys, columns=["bin", "source_type"])
+    coupling_keys_frame = pd.DataFrame({"bin": coupling_keys})
+    return (
+        _long_frame(trend_keys_frame, trend_stats, plan),
+        _long_frame(coupling_keys_frame, {k: np.nan_to_num(v) for k, v in coupling_stats.items()}, plan),
+    )
+
+
+def _long_frame(keys: pd.DataFrame, stats: Dict[str, np.ndarray], plan: VariantPlan) -> pd.DataFrame:
+    frames = []
+    for name, values in stats.items():
+        for pos, variant in enumerate(plan.rows):
+            frame = keys.copy()
+            frame["statistic"] = name
+            frame["axis"] = variant["axis"]
+            frame["variant"] = variant["variant"]
+            frame["value"] = values[:, pos]
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def robustness_table(long: pd.DataFrame, keys: List[str], ci: float) -> pd.DataFrame:
+    """Per key, statistic and varied axis: baseline, spread over leave-one-out and bootstrap variants."""
+    if long.empty:
+        return long
+    base = long[long["axis"] == "baseline"].set_index(keys + ["statistic"])["value"]
+    varied = long[long["axis"] != "baseline"].copy()
+    varied["method"] = np.where(varied["variant"].str.startswith("loo:"), "leave_one_out", "bootstrap")
+    tail = (1.0 - ci) / 2.0
+    grouped = varied.groupby(keys + ["statistic", "axis", "method"], sort=True)["value"]
+    out = grouped.agg(["mean", "std", "min", "max"]).reset_index()
+    out["lo"] = grouped.quantile(tail).to_numpy()
+    out["hi"] = grouped.quantile(1.0 - tail).to_numpy()
+    out.insert(len(keys) + 3, "baseline", base.reindex(pd.MultiIndex.from_frame(out[keys + ["statistic"]])).to_numpy())
+    out["max_abs_change"] = np.maximum(np.abs(out["max"] - out["baseline"]), np.abs(out["min"] - out["baseline"]))
+    out["sign_stable"] = (np.sign(out["min"]) == np.sign(out["baseline"])) & (np.sign(out["max"]) == np.sign(out["baseline"]))
+    return out
+
+
+def seed_influence(long: pd.DataFrame, seeds: Dict[str, List[str]], keys: List[str]) -> pd.DataFrame:
+    """Mean and largest absolute change across bins when each seed is left out."""
+    if long.empty:
+        return long
+    base = long[long["axis"] == "baseline"].set_index(keys + ["statistic"])["value"]
+    loo = long[long["variant"].str.startswith("loo:")].copy()
+    loo["change"] = np.abs(loo["value"].to_numpy() - base.reindex(pd.MultiIndex.from_frame(loo[keys + ["statistic"]])).to_numpy())
+    out = loo.groupby(["axis", "variant", "statistic"], sort=True)["change"].agg(mean_abs_change="mean", max_abs_change="max")
+    out = out.reset_index()
+    out["seed"] = [seeds[a][int(v.split(":")[1])] for a, v in zip(out["axis"], out["variant"])]
+    return out[["axis", "seed", "statistic", "mean_abs_change", "max_abs_change"]]
+
+
+def run_sensitivity(config_dir: str, n_bootstrap: int | None = None, data_dir: Path = Path("data")) -> Dict[str, int]:
+    from src.embed import EmbeddingEngine
+
+    cfg = load_config_bundle(config_dir)
+    analysis_cfg = cfg["analysis"]
+    sens_cfg = sensitivity_config(analysis_cfg)
+    if n_bootstrap is not None:
+        sens_cfg["n_bootstrap"] = n_bootstrap
+    embedder = EmbeddingEngine(cfg["models"]["embedding"], data_dir / "embeddings")
+    rng = np.random.default_rng(sens_cfg["seed"])
+    labels: Dict[str, List[str]] = {}
+    seeds: Dict[str, List[str]] = {}
+    matrices = []
+    with METRICS.substep("axis_variants"):
+        for axis, key in AXIS_KEYS.items():
+            seeds[axis] = cfg["axes"][key]["seeds"]
+            labels[axis], matrix = axis_variants(embedder.embed_texts(seeds[axis]), sens_cfg["n_bootstrap"], rng)
+            matrices.append(matrix)
+    axes = np.concatenate(matrices, axis=1)
+    plan = VariantPlan(labels)
+    scored_path = data_dir / "segments" / "segments_scored.jsonl"
+    with open(scored_path, "rb") as f:
+        n_rows = sum(1 for _ in f)
+    binning, _ = binning_config(analysis_cfg)
+    tables = ensure_dir(Path("outputs/tables"))
+    with tempfile.TemporaryDirectory(dir=ensure_dir(data_dir)) as tmp:
+        scores = np.lib.format.open_memmap(Path(tmp) / "scores.npy", mode="w+", dtype=np.float32, shape=(n_rows, axes.shape[1]))
+        with METRICS.substep("score_variants"):
+            meta = score_store(scored_path, embedder, axes, scores, sens_cfg["block_rows"])
+        with METRICS.substep("variant_statistics"):
+            trend_long, coupling_long = variant_statistics(scores, meta, plan, analysis_cfg, sens_cfg["block_rows"])
+        del scores
+    trend = robustness_table(trend_long, ["bin", "source_type"], sens_cfg["ci"])
+    coupling = robustness_table(coupling_long, ["bin"], sens_cfg["ci"])
+    influence = pd.concat(
+        [seed_influence(trend_long, seeds, ["bin", "source_type"]), seed_influence(coupling_long, seeds, ["bin"])],
+        ignore_index=True,
+    )
+    trend.to_csv(tables / f"sensitivity_trend_{binning}.csv", index=False, encoding="utf-8")
+    coupling.to_csv(tables / f"sensitivity_coupling_{binning}.csv", index=False, encoding="utf-8")
+    influence.to_csv(tables / "sensitivity_seeds.csv", index=False, encoding="utf-8")
+    METRICS.count("sensitivity.variants", len(plan.rows))
+    METRICS.count("rows", n_rows)
+    return {"axis_vectors": axes.shape[1], "variants": len(plan.rows), "rows": n_rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.sensitivity")
+    parser.add_argument("--config-dir", default="config")
+    parser.add_argument("--bootstrap", type=int, default=None, help="Bootstrap variants per axis (default: sensitivity.n_bootstrap)")
+    parser.add_argument("--profile", action="store_true", help="Write a cProfile profile to outputs/profiles/")
+    args = parser.parse_args()
+    with METRICS.stage("sensitivity", profile=args.profile):
+        stats = run_sensitivity(args.config_dir, args.bootstrap)
+    METRICS.write()
+    print("[sensitivity] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
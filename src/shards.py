@@ -0,0 +1,279 @@
+"""Year-sharded execution of stages 01-04 and merging of shard outputs.
+
+A shard is named after a year. ``--shard YEAR`` makes a stage read and write
+under ``data/shards/YEAR/`` instead of ``data/``; the collect stage keeps only
+that year's documents, except for sources listed in ``sharding.hash_sources``
+(party reports by default), which are few and spread across shards by a hash of
+their URL. The HTTP cache in ``data/cache`` is shared by all shards.
+
+``python -m src.shards merge`` combines finished shard directories into the
+artifacts a single-node run writes under ``data/``: concatenated JSONL files,
+per-document JSON, raw HTML and embedding caches, with near-duplicate flags and
+outward thresholds recomputed over the whole corpus. Each shard fits its own
+int8 codec; the merge fits one codec covering every shard's vectors and re-codes
+the caches to it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.dedup import dedup_config, mark_duplicates
+from src.outward_filter import outward_group
+from src.quantize import CODEC_NAME, LEVELS, EmbeddingCodec, load_codec, quantize_config, transcode
+from src.utils import atomic_open, ensure_dir, jsonl_iter, load_config_bundle, save_json, sha1_text
+
+DATA_DIR = Path("data")
+SHARD_ROOT = DATA_DIR / "shards"
+SHARDABLE_STAGES = ["collect", "segment", "dedup", "embed", "score"]
+
+
+def shard_years(analysis_cfg: Dict[str, Any]) -> List[str]:
+    start, end = int(analysis_cfg["analysis_start"][:4]), int(analysis_cfg["analysis_end"][:4])
+    return [str(year) for year in range(start, end + 1)]
+
+
+def shard_data_dir(shard: str | None) -> Path:
+    return DATA_DIR if shard is None else SHARD_ROOT / shard
+
+
+def report_path(data_dir: Path, name: str) -> Path:
+    """Diagnostic tables go to outputs/tables, or next to the data for shard runs."""
+    return Path("outputs/tables") / name if data_dir == DATA_DIR else data_dir / name
+
+
+def shard_range(shard: str, start: str, end: str) -> Tuple[str, str]:
+    """Clip an analysis date range to the shard's year."""
+    return max(start, f"{shard}-01-01"), min(end, f"{shard}-12-31")
+
+
+def hash_sharded(source_type: str, analysis_cfg: Dict[str, Any]) -> bool:
+    return source_type in (analysis_cfg.get("sharding") or {}).get("hash_sources", ["party_report"])
+
+
+def hash_shard(url: str, analysis_cfg: Dict[str, Any]) -> str:
+    years = shard_years(analysis_cfg)
+    return years[int(sha1_text(url)[:8], 16) % len(years)]
+
+
+def list_shards() -> List[str]:
+    if not SHARD_ROOT.exists():
+        return []
+    return sorted(p.name for p in SHARD_ROOT.iterdir() if p.is_dir())
+
+
+def _copy_dir_files(src: Path, dst: Path, pattern: str) -> int:
+    if not src.exists():
+        return 0
+    ensure_dir(dst)
+    copied = 0
+    for path in src.glob(pattern):
+        shutil.copy2(path, dst / path.name)
+        copied += 1
+    return copied
+
+
+def _iter_shard_jsonl(shards: List[str], relative: str) -> Iterator[Dict[str, Any]]:
+    for shard in shards:
+        path = shard_data_dir(shard) / relative
+        if path.exists():
+            yield from jsonl_iter(path)
+
+
+def _write_jsonl(path: Path, rows: Iterator[Dict[str, Any]]) -> int:
+    count = 0
+    with atomic_open(path, durable=True) as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def _rebase_raw_path(doc: Dict[str, Any], raw_dir: Path) -> Dict[str, Any]:
+    if doc.get("raw_path"):
+        doc["raw_path"] = str(raw_dir / Path(doc["raw_path"]).name)
+    return doc
+
+
+def _load_codes(path: Path) -> np.ndarray:
+    with np.load(path, allow_pickle=True) as data:
+        return data["embeddings"]
+
+
+def _union_codec(sources: List[Tuple[EmbeddingCodec | None, List[Path]]], quant_cfg: Dict[str, Any]) -> EmbeddingCodec:
+    """One codec for the reconstructed vectors of every shard.
+
+    PCA components (if the shard codecs use them) are fitted on a sample drawn across shards;
+    the per-dimension range then covers every cached vector, so re-coding never clips.
+    """
+    pca_dims = [codec.dim for codec, _ in sources if codec.components is not None]
+    mean = components = None
+    if pca_dims:
+        total = sum(len(_load_codes(path)) for _, paths in sources for path in paths)
+        keep = min(1.0, quant_cfg["sample_size"] / max(total, 1))
+        rng = np.random.default_rng(quant_cfg["seed"])
+        sample = [
+            source.reconstruct(codes[rng.random(len(codes)) < keep])
+            for source, paths in sources
+            for codes in map(_load_codes, paths)
+        ]
+        fitted = EmbeddingCodec.fit(np.concatenate(sample), max(pca_dims))
+        mean, components = fitted.mean, fitted.components
+    lo = hi = None
+    for source, paths in sources:
+        for path in paths:
+            vectors = source.reconstruct(_load_codes(path))
+            coords = vectors if components is None else (vectors - mean) @ components.T
+            if len(coords):
+                lo = coords.min(axis=0) if lo is None else np.minimum(lo, coords.min(axis=0))
+                hi = coords.max(axis=0) if hi is None else np.maximum(hi, coords.max(axis=0))
+    if lo is None:
+        return sources[0][0]
+    scale = np.where(hi > lo, (hi - lo) / LEVELS, 1.0)
+    return EmbeddingCodec(lo, scale, mean, components)
+
+
+def merge_embeddings(shards: List[str], embeddings_dir: Path, quant_cfg: Dict[str, Any] | None = None) -> int:
+    """Copy embedding caches per model namespace.
+
+    When the shards of a namespace were coded with different int8 codecs, a codec is fitted on
+    all of them and every shard's codes are re-coded to it.
+    """
+    quant_cfg = quant_cfg or quantize_config({})
+    namespaces: Dict[str, List[Tuple[EmbeddingCodec | None, List[Path]]]] = defaultdict(list)
+    for shard in shards:
+        root = shard_data_dir(shard) / "embeddings"
+        if not root.exists():
+            continue
+        for src in sorted(p for p in root.iterdir() if p.is_dir()):
+            paths = sorted(p for p in src.glob("*.npz") if p.name != CODEC_NAME)
+            namespaces[src.name].append((load_codec(src / CODEC_NAME), paths))
+    copied = 0
+    for namespace, sources in namespaces.items():
+        dest = ensure_dir(embeddings_dir / namespace)
+        codecs = [codec for codec, _ in sources if codec is not None]
+        target = None
+        if codecs:
+            same = len({codec.codec_id for codec in codecs}) == 1
+            target = codecs[0] if same else _union_codec([s for s in sources if s[0] is not None], quant_cfg)
+        for codec, paths in sources:
+            for path in paths:
+                if codec is not None and codec.codec_id != target.codec_id:
+                    data = dict(np.load(path, allow_pickle=True))
+                    data["embeddings"] = transcode(data["embeddings"], codec, target)
+                    data["codec_id"] = np.array(target.codec_id)
+                    with atomic_open(dest / path.name, "wb") as f:
+                        np.savez_compressed(f, **data)
+                else:
+                    shutil.copy2(path, dest / path.name)
+                copied += 1
+        if target is not None:
+            target.save(dest / CODEC_NAME)
+    return copied
+
+
+def merge_shards(config_dir: str, shards: List[str] | None = None, out_dir: Path = DATA_DIR) -> Dict[str, int]:
+    """Merge shard outputs into ``out_dir``; shards are concatenated in name (year) order."""
+    # Imported here: both pull in pandas, which stages importing this module don't need.
+    from src.ngram_index import ngram_index_config, rebuild_index
+    from src.stats_store import rebuild_store
+
+    cfg = load_config_bundle(config_dir)
+    analysis_cfg = cfg["analysis"]
+    shards = sorted(shards or list_shards())
+    if not shards:
+        raise ValueError(f"No shards found under {SHARD_ROOT}")
+    raw_dir, parsed_dir = out_dir / "raw", out_dir / "parsed"
+    segments_dir, embeddings_dir = out_dir / "segments", out_dir / "embeddings"
+    stats: Dict[str, int] = {"shards": len(shards)}
+    for shard in shards:
+        src = shard_data_dir(shard)
+        stats["raw"] = stats.get("raw", 0) + _copy_dir_files(src / "raw", raw_dir, "*.html")
+        _copy_dir_files(src / "parsed", parsed_dir, "*.json")
+
+    stats["embeddings"] = merge_embeddings(shards, embeddings_dir, quantize_config(cfg["models"]["embedding"]))
+    stats["docs"] = _write_jsonl(
+        parsed_dir / "docs.jsonl", (_rebase_raw_path(d, raw_dir) for d in _iter_shard_jsonl(shards, "parsed/docs.jsonl"))
+    )
+
+    # Near-duplicates are only detected within a shard; flag them again across the whole corpus.
+    segment_dups: Dict[str, str | None] = {}
+    doc_dups: Dict[str, str | None] = {}
+    dedup_cfg = dedup_config(analysis_cfg)
+    for name in ["segments.jsonl", "segments_embedded.jsonl"]:
+        docs = [_rebase_raw_path(d, raw_dir) for d in _iter_shard_jsonl(shards, f"segments/{name}")]
+        if not docs:
+            continue
+        if dedup_cfg["enabled"]:
+            mark_duplicates(docs, dedup_cfg)
+            doc_dups = {d["doc_id"]: d["dup_of"] for d in docs}
+            segment_dups = {seg["segment_id"]: seg["dup_of"] for d in docs for seg in d["segments"]}
+        stats[name] = _write_jsonl(segments_dir / name, iter(docs))
+        # As in a single-node run, per-document JSON reflects the last stage each document reached.
+        for doc in docs:
+            save_json(segments_dir / f"{doc['doc_id']}.json", doc)
+
+    if (segments_dir / "segments.jsonl").exists() and ngram_index_config(analysis_cfg)["enabled"]:
+        stats["ngram_segments"] = rebuild_index(out_dir)["segments"]
+    stats["segments_scored"] = merge_scored(shards, analysis_cfg, segments_dir, segment_dups, doc_dups)
+    if stats["segments_scored"]:
+        stats["stats_groups"] = rebuild_store(cfg, out_dir)["groups"]
+    return stats
+
+
+def merge_scored(
+    shards: List[str],
+    analysis_cfg: Dict[str, Any],
+    segments_dir: Path,
+    segment_dups: Dict[str, str | None],
+    doc_dups: Dict[str, str | None],
+) -> int:
+    """Concatenate scored rows, recomputing outward thresholds exactly over all shards.
+
+    Shard-local thresholds are wrong for hash-sharded sources, whose years span
+    shards, so the first pass collects outward scores per (year, source_type) and
+    the second pass re-applies ``is_outward``.
+    """
+    relative = "segments/segments_scored.jsonl"
+    values: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    for row in _iter_shard_jsonl(shards, relative):
+        values[outward_group(row)].append(row["scores"]["outward_axis"])
+    if not values:
+        return 0
+    pct = analysis_cfg["outward_percentile"] * 100
+    thresholds = {key: float(np.percentile(vals, pct)) for key, vals in values.items()}
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for row in _iter_shard_jsonl(shards, relative):
+            row["scores"]["is_outward"] = row["scores"]["outward_axis"] >= thresholds[outward_group(row)]
+            if segment_dups:
+                row["dup_of"] = segment_dups.get(row["segment_id"])
+                row["doc_dup_of"] = doc_dups.get(row["doc_id"])
+            yield row
+
+    return _write_jsonl(segments_dir / "segments_scored.jsonl", rows())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.shards")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Print the shard names for the configured analysis range")
+    merge = sub.add_parser("merge", help="Merge shard directories into data/")
+    merge.add_argument("--shards", nargs="+", default=None, help="Shards to merge (default: all under data/shards)")
+    args = parser.parse_args()
+    if args.command == "list":
+        print("\n".join(shard_years(load_config_bundle(args.config_dir)["analysis"])))
+        return
+    stats = merge_shards(args.config_dir, args.shards)
+    print("[merge] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
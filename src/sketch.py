@@ -0,0 +1,89 @@
+"""Mergeable streaming quantile sketch (KLL).
+
+``KLLSketch`` keeps a stack of compactors whose capacities shrink geometrically
+towards the bottom level, so memory stays around ``3 * k`` values however many
+are fed in. Each compaction of a level with item weight ``w`` shifts the rank of
+any query by at most ``w``; the sketch tracks those weights so it can report a
+worst-case rank error and a Hoeffding bound (compaction errors are zero-mean
+because the kept half is chosen at random). While nothing has been compacted the
+sketch is exact and ``quantile`` matches ``np.percentile``.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+class KLLSketch:
+    def __init__(self, k: int = 200, c: float = 2.0 / 3.0, seed: int = 0):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self.max_error = 0.0
+        self.sq_error = 0.0
+        self._rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * self.c**depth)))
+
+    def update(self, values: Iterable[float] | np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += values.size
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.max_error += other.max_error
+        self.sq_error += other.sq_error
+        self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                keep = items[-1:] if items.size % 2 else items[:0]
+                pairs = items[: items.size - keep.size]
+                promoted = pairs[int(self._rng.integers(2)) :: 2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                weight = float(2**level)
+                self.max_error += weight
+                self.sq_error += weight * weight
+            level += 1
+
+    def size(self) -> int:
+        return sum(items.size for items in self.levels)
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile ``q`` in [0, 1], interpolated like ``np.percentile``."""
+        if not self.n:
+            return 0.0
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(lvl.size, 2.0**h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, weights = items[order], weights[order]
+        # Centre of the rank span each retained item stands for; unit weights give 0..n-1.
+        centres = np.cumsum(weights) - 1.0 - (weights - 1.0) / 2.0
+        return float(np.interp(q * (self.n - 1), centres, items))
+
+    def rank_error(self, delta: float = 0.01) -> Dict[str, float]:
+        """Normalised rank error: worst case, and a bound holding with probability ``1 - delta``."""
+        if not self.n:
+            return {"worst": 0.0, "bound": 0.0}
+        bound = math.sqrt(2.0 * self.sq_error * math.log(2.0 / delta))
+        return {"worst": self.max_error / self.n, "bound": min(bound, self.max_error) / self.n}
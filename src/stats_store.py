@@ -0,0 +1,233 @@
+"""Persisted sufficient statistics for the trend and coupling tables.
+
+``data/stats/cube.npz`` holds the per-(day, source_type, is_outward) cube of
+``src.binning.build_cube``. Weighted means, Pearson correlations and Cohen's d
+per bin all derive from it, so it rolls up to any binning. It also holds, per
+outward group (year, source_type), a digest of the documents it covers and the
+threshold that split it.
+
+04_score_axes.py updates the store after marking outward rows. A group is
+rebuilt from its rows only when its documents or its threshold changed. Adding
+a week of pressers therefore touches the current year's groups and leaves the
+rest of the cube alone. Changing the axes, the embedding model or
+``dedup.exclude_from_analyses`` rebuilds every group.
+
+    python -m src.stats_store report     # q1_trend_<binning>.csv, q2_coupling_<binning>.csv from the store
+    python -m src.stats_store rebuild    # from data/segments/segments_scored.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.binning import CUBE_KEYS, binning_config, build_cube, stat_columns
+from src.dedup import is_duplicate
+from src.embed import cache_namespace
+from src.metrics import METRICS
+from src.outward_filter import outward_group
+from src.utils import atomic_open, ensure_dir, jsonl_iter, load_config_bundle, sha1_text
+
+STORE_NAME = Path("stats") / "cube.npz"
+ADD_CHUNK_ROWS = 50000
+Group = Tuple[str, str]
+
+
+def store_signature(cfg: Dict[str, Any]) -> str:
+    """Settings that change every row's statistics."""
+    payload = {
+        "axes": cfg["axes"],
+        "embedding": cache_namespace(cfg["models"]["embedding"]),
+        "exclude_duplicates": excludes_duplicates(cfg["analysis"]),
+    }
+    return sha1_text(json.dumps(payload, sort_keys=True, ensure_ascii=False))[:16]
+
+
+def excludes_duplicates(analysis_cfg: Dict[str, Any]) -> bool:
+    return bool((analysis_cfg.get("dedup") or {}).get("exclude_from_analyses"))
+
+
+def docs_digest(doc_ids: Iterable[str]) -> str:
+    return sha1_text("\n".join(sorted(doc_ids)))[:16]
+
+
+def group_digests(rows: Iterable[Dict[str, Any]]) -> Dict[Group, str]:
+    docs: Dict[Group, Set[str]] = defaultdict(set)
+    for row in rows:
+        docs[outward_group(row)].add(row["doc_id"])
+    return {group: docs_digest(ids) for group, ids in docs.items()}
+
+
+def day_years(days: np.ndarray) -> np.ndarray:
+    return (np.asarray(days, dtype=np.int64).astype("datetime64[D]").astype("datetime64[Y]").astype(int) + 1970).astype(str)
+
+
+class StatsStore:
+    def __init__(self, cfg: Dict[str, Any], data_dir: Path = Path("data")):
+        self.path = data_dir / STORE_NAME
+        self.signature = store_signature(cfg)
+        self.exclude_duplicates = excludes_duplicates(cfg["analysis"])
+        self.stored_signature: str | None = None
+        self.cube = pd.DataFrame(columns=CUBE_KEYS + stat_columns())
+        self.groups: Dict[Group, Tuple[str, float | None]] = {}
+        self._stale: Set[Group] = set()
+        self._next: Dict[Group, Tuple[str, float | None]] = {}
+        self._parts: List[pd.DataFrame] = []
+        if self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        with np.load(self.path, allow_pickle=False) as data:
+            self.stored_signature = str(data["signature"])
+            frame: Dict[str, Any] = {
+                "day": data["day"],
+                "source_type": data["source_type"].astype(object),
+                "is_outward": data["is_outward"],
+            }
+            frame.update({col: data[col] for col in stat_columns()})
+            self.cube = pd.DataFrame(frame)
+            thresholds = [None if math.isnan(t) else float(t) for t in data["group_threshold"]]
+            self.groups = {
+                (str(y), str(s)): (str(d), t)
+                for y, s, d, t in zip(data["group_year"], data["group_source"], data["group_digest"], thresholds)
+            }
+
+    @property
+    def current(self) -> bool:
+        return self.stored_signature == self.signature
+
+    def begin(self, digests: Dict[Group, str], thresholds: Dict[Group, float], full: bool = False) -> Set[Group]:
+        """Start an update; returns the groups whose rows ``add`` must see."""
+        self._next = {group: (digest, thresholds.get(group)) for group, digest in digests.items()}
+        if full or not self.current:
+            self._stale = set(digests)
+        else:
+            self._stale = {group for group, entry in self._next.items() if self.groups.get(group) != entry}
+        self._parts = []
+        return self._stale
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        picked = [
+            r for r in rows if outward_group(r) in self._stale and not (self.exclude_duplicates and is_duplicate(r))
+        ]
+        if picked:
+            self._parts.append(build_cube(picked))
+
+    def commit(self) -> Dict[str, int]:
+        cube = self.cube
+        if not cube.empty:
+            keys = pd.Series(list(zip(day_years(cube["day"].to_numpy()), cube["source_type"])))
+            dropped = keys.isin(self._stale | (set(self.groups) - set(self._next))).to_numpy()
+            cube = cube[~dropped]
+        parts = [p for p in [cube] + self._parts if not p.empty]
+        if parts:
+            merged = pd.concat(parts, ignore_index=True)
+            cube = merged.groupby(CUBE_KEYS, as_index=False, sort=True)[stat_columns()].sum()
+        self.cube = cube.reset_index(drop=True)
+        self.groups, self.stored_signature = self._next, self.signature
+        self.save()
+        stats = {"groups": len(self.groups), "groups_rebuilt": len(self._stale), "cube_rows": len(self.cube)}
+        self._stale, self._parts = set(), []
+        return stats
+
+    def save(self) -> None:
+        groups = sorted(self.groups.items())
+        arrays: Dict[str, Any] = {
+            "signature": np.array(self.stored_signature or ""),
+            "day": self.cube["day"].to_numpy(dtype=np.int64),
+            "source_type": self.cube["source_type"].to_numpy(dtype=str),
+            "is_outward": self.cube["is_outward"].to_numpy(dtype=bool),
+            "group_year": np.array([g[0] for g, _ in groups], dtype=str),
+            "group_source": np.array([g[1] for g, _ in groups], dtype=str),
+            "group_digest": np.array([d for _, (d, _) in groups], dtype=str),
+            "group_threshold": np.array([np.nan if t is None else t for _, (_, t) in groups], dtype=np.float64),
+        }
+        arrays.update({col: self.cube[col].to_numpy(dtype=np.float64) for col in stat_columns()})
+        ensure_dir(self.path.parent)
+        with atomic_open(self.path, "wb", durable=True) as f:
+            np.savez(f, **arrays)
+
+
+def update_store(
+    cfg: Dict[str, Any], rows: List[Dict[str, Any]], thresholds: Dict[Group, float], data_dir: Path = Path("data")
+) -> Dict[str, int]:
+    """Bring the store in line with ``rows`` (outward already marked with ``thresholds``)."""
+    with METRICS.substep("stats_store"):
+        store = StatsStore(cfg, data_dir)
+        store.begin(group_digests(rows), thresholds)
+        store.add(rows)
+        stats = store.commit()
+    METRICS.count("stats_store.groups_rebuilt", stats["groups_rebuilt"])
+    return stats
+
+
+def rebuild_store(cfg: Dict[str, Any], data_dir: Path = Path("data")) -> Dict[str, int]:
+    """Rebuild every group from ``segments_scored.jsonl``, streaming it twice.
+
+    Thresholds are not in the scored rows, so groups are stored without one and the
+    next 04_score_axes.py run rebuilds each group once more.
+    """
+    scored_path = data_dir / "segments" / "segments_scored.jsonl"
+    store = StatsStore(cfg, data_dir)
+    store.begin(group_digests(jsonl_iter(scored_path)), {}, full=True)
+    chunk: List[Dict[str, Any]] = []
+    for row in jsonl_iter(scored_path):
+        chunk.append(row)
+        if len(chunk) >= ADD_CHUNK_ROWS:
+            store.add(chunk)
+            chunk = []
+    store.add(chunk)
+    return store.commit()
+
+
+def report(cfg: Dict[str, Any], data_dir: Path = Path("data")) -> List[Path]:
+    """Trend and coupling tables (point estimates) for ``binning`` and each of ``binning_views``."""
+    from src.tests.coupling import run_coupling
+    from src.tests.trend import run_trend
+
+    store = StatsStore(cfg, data_dir)
+    if not store.path.exists():
+        raise ValueError(f"No statistics store at {store.path}; run 04_score_axes.py or `python -m src.stats_store rebuild`")
+    if not store.current:
+        print(f"[stats] warning: {store.path} was built with other axes, model or dedup settings; rebuild it")
+    analysis_cfg = cfg["analysis"]
+    binning, periods = binning_config(analysis_cfg)
+    cube = store.cube
+    tables = ensure_dir(Path("outputs/tables"))
+    written = []
+    no_bootstrap = {"n_resamples": 0}
+    for view in [binning] + list(analysis_cfg.get("binning_views") or []):
+        trend = run_trend([], no_bootstrap, view, periods, cube=cube)
+        coupling = run_coupling([], no_bootstrap, view, periods, cube=cube)
+        for name, frame in [(f"q1_trend_{view}.csv", trend), (f"q2_coupling_{view}.csv", coupling)]:
+            frame.to_csv(tables / name, index=False, encoding="utf-8")
+            written.append(tables / name)
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.stats_store")
+    parser.add_argument("--config-dir", default="config")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("report", help="Write trend and coupling tables from the store (no bootstrap intervals)")
+    sub.add_parser("rebuild", help="Rebuild the store from segments_scored.jsonl")
+    args = parser.parse_args()
+    cfg = load_config_bundle(args.config_dir)
+    with METRICS.stage(f"stats_{args.command}"):
+        if args.command == "rebuild":
+            stats = rebuild_store(cfg)
+            print("[stats] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+        else:
+            for path in report(cfg):
+                print(f"[stats] wrote {path}")
+    METRICS.write()
+
+
+if __name__ == "__main__":
+    main()
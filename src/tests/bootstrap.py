@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import warnings
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Upper bound on resample-index elements materialised at once (resamples x rows).
+MAX_BLOCK_ELEMENTS = 4_000_000
+
+
+def bootstrap_settings(cfg: Dict[str, Any] | None) -> Tuple[int, float, int]:
+    cfg = cfg or {}
+    return int(cfg.get("n_resamples", 0) or 0), float(cfg.get("ci", 0.95)), int(cfg.get("seed", 0))
+
+
+def resample_group_sums(
+    columns: Dict[str, np.ndarray],
+    sizes: np.ndarray,
+    n_resamples: int,
+    seed: int,
+) -> Dict[str, np.ndarray]:
+    """Sum each column over within-group bootstrap resamples.
+
+    Rows must be sorted so every group is contiguous; ``sizes`` gives the group
+    lengths in that order. Each block of resamples draws one index matrix for all
+    groups and turns it into per-row draw counts. A single sparse product with a
+    (rows x groups*columns) design then reduces every group and column at once.
+    Returns ``{name: (n_resamples, n_groups)}``.
+    """
+    names = list(columns)
+    matrix = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in names])
+    sizes = np.asarray(sizes, dtype=np.int64)
+    n_rows = int(sizes.sum())
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    row_start = np.repeat(starts, sizes)
+    row_size = np.repeat(sizes, sizes)
+    n_groups, n_cols = len(sizes), len(names)
+    # Row r holds its column values in the n_cols slots of its group.
+    slots = np.repeat(np.arange(n_groups, dtype=np.int64), sizes)[:, None] * n_cols + np.arange(n_cols)
+    design = sparse.csc_matrix(
+        (matrix.ravel(), (np.repeat(np.arange(n_rows), n_cols), slots.ravel())), shape=(n_rows, n_groups * n_cols)
+    )
+    rng = np.random.default_rng(seed)
+    block = max(1, min(n_resamples, MAX_BLOCK_ELEMENTS // max(n_rows, 1)))
+    out = np.empty((n_resamples, n_groups, n_cols), dtype=np.float64)
+    for lo in range(0, n_resamples, block):
+        b = min(block, n_resamples - lo)
+        idx = row_start + (rng.random((b, n_rows), dtype=np.float32) * row_size).astype(np.int64)
+        np.minimum(idx, row_start + row_size - 1, out=idx)
+        idx += (np.arange(b, dtype=np.int64) * n_rows)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=b * n_rows).reshape(b, n_rows).astype(np.float64)
+        out[lo : lo + b] = (design.T @ counts.T).T.reshape(b, n_groups, n_cols)
+    return {name: out[:, :, pos] for pos, name in enumerate(names)}
+
+
+def percentile_ci(stats: np.ndarray, ci: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile interval over axis 0, ignoring resamples where the statistic is undefined."""
+    tail = (1.0 - ci) / 2.0 * 100.0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lo, hi = np.nanpercentile(stats, [tail, 100.0 - tail], axis=0)
+    return lo, hi
+
+
+def ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / np.where(den > 0, den, 1.0), np.nan)
+
+
+def pearson_from_sums(n, sx, sy, sxx, syy, sxy) -> np.ndarray:
+    cov = sxy - sx * sy / np.maximum(n, 1)
+    vx = sxx - sx * sx / np.maximum(n, 1)
+    vy = syy - sy * sy / np.maximum(n, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = cov / np.sqrt(vx * vy)
+    return np.where((n >= 2) & (vx > 0) & (vy > 0), r, np.nan)
+
+
+def cohens_d_from_sums(n1, s1, ss1, n0, s0, ss0) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m1, m0 = s1 / n1, s0 / n0
+        v1 = (ss1 - n1 * m1 * m1) / (n1 - 1)
+        v0 = (ss0 - n0 * m0 * m0) / (n0 - 1)
+        pooled = ((n1 - 1) * v1 + (n0 - 1) * v0) / (n1 + n0 - 2)
+        d = (m1 - m0) / np.sqrt(pooled)
+    return np.where((n1 >= 2) & (n0 >= 2) & (pooled > 0), d, np.nan)
@@ -0,0 +1,157 @@
+"""Mean-shift change points in the binned trend, coupling and slogan series.
+
+Every series of a table becomes one row of a (series x bins) matrix. PELT then
+runs on all rows at once: each step scores every remaining candidate start for
+every series with a single array expression, and pruned candidates drop out of
+the columns it touches.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+CHANGEPOINT_COLUMNS = ["table", "source_type", "series", "bin", "position", "mean_before", "mean_after", "shift"]
+
+
+def changepoint_config(analysis_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"penalty": "bic", "min_size": 2}
+    cfg.update(analysis_cfg.get("changepoints") or {})
+    return cfg
+
+
+def penalty_value(penalty: Any, n_bins: int) -> float:
+    if penalty == "bic":
+        return 2.0 * math.log(max(n_bins, 2))
+    return float(penalty)
+
+
+def noise_scale(values: np.ndarray) -> np.ndarray:
+    """Per-row noise standard deviation from first differences (MAD, falling back to the SD)."""
+    diffs = np.diff(values, axis=1)
+    if diffs.shape[1] == 0:
+        return np.ones(values.shape[0])
+    mad = np.median(np.abs(diffs - np.median(diffs, axis=1, keepdims=True)), axis=1) * 1.4826 / math.sqrt(2)
+    sd = diffs.std(axis=1) / math.sqrt(2)
+    scale = np.where(mad > 0, mad, sd)
+    return np.where(scale > 0, scale, 1.0)
+
+
+def pelt(values: np.ndarray, penalty: float, min_size: int = 2) -> List[List[int]]:
+    """Change points (first bin of each new segment) of every row of ``values``.
+
+    Minimizes the within-segment sum of squares plus ``penalty`` per change, with every
+    segment at least ``min_size`` bins long. Rows are scaled to unit noise first, so
+    ``penalty`` is in units of noise variance. The result is the exact optimum.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    m, n = x.shape
+    if n < 2 * min_size:
+        return [[] for _ in range(m)]
+    z = x / noise_scale(x)[:, None]
+    s1 = np.zeros((m, n + 1))
+    s2 = np.zeros((m, n + 1))
+    np.cumsum(z, axis=1, out=s1[:, 1:])
+    np.cumsum(z * z, axis=1, out=s2[:, 1:])
+    best = np.full((m, n + 1), np.inf)
+    best[:, 0] = -penalty
+    last = np.zeros((m, n + 1), dtype=np.int64)
+    alive = np.zeros((m, n + 1), dtype=bool)
+    rows = np.arange(m)
+    # Pruning decisions taken at t, applied from t + min_size on (see below).
+    deferred: Dict[int, tuple] = {}
+    for t in range(min_size, n + 1):
+        if t - min_size in deferred:
+            cols, keep = deferred.pop(t - min_size)
+            alive[:, cols] &= keep
+        # Start s becomes a candidate once a segment of min_size fits between s and t.
+        alive[:, t - min_size] = np.isfinite(best[:, t - min_size])
+        cols = np.flatnonzero(alive[:, : t - min_size + 1].any(axis=0))
+        seg1 = s1[:, t, None] - s1[:, cols]
+        cost = (s2[:, t, None] - s2[:, cols]) - seg1 * seg1 / (t - cols)
+        total = np.where(alive[:, cols], best[:, cols] + cost, np.inf)
+        arg = total.argmin(axis=1)
+        best[:, t] = total[rows, arg] + penalty
+        last[:, t] = cols[arg]
+        # PELT pruning: a start already worse than the optimum at t never wins at an end T that
+        # could instead split at t. That split needs T >= t + min_size, so the start stays a
+        # candidate for the ends in between.
+        deferred[t] = (cols, total <= best[:, t, None])
+    changes = []
+    for r in range(m):
+        points, t = [], n
+        while t > 0:
+            t = int(last[r, t])
+            if t > 0:
+                points.append(t)
+        changes.append(points[::-1])
+    return changes
+
+
+def detect_changepoints(wide: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame:
+    """Change points of each row of ``wide`` (index: series labels, columns: bins in order)."""
+    values = wide.to_numpy(dtype=np.float64)
+    if values.size == 0:
+        return pd.DataFrame(columns=list(wide.index.names) + CHANGEPOINT_COLUMNS[3:])
+    bins = list(wide.columns)
+    changes = pelt(values, penalty_value(cfg["penalty"], len(bins)), int(cfg["min_size"]))
+    records = []
+    for key, row, points in zip(wide.index, values, changes):
+        bounds = [0] + points + [len(bins)]
+        labels = dict(zip(wide.index.names, key if isinstance(key, tuple) else (key,)))
+        for i, point in enumerate(points):
+            before = float(row[bounds[i] : point].mean())
+            after = float(row[point : bounds[i + 2]].mean())
+            records.append(
+                {
+                    **labels,
+                    "bin": bins[point],
+                    "position": point,
+                    "mean_before": before,
+                    "mean_after": after,
+                    "shift": after - before,
+                }
+            )
+    return pd.DataFrame(records, columns=list(wide.index.names) + CHANGEPOINT_COLUMNS[3:])
+
+
+def wide_series(df: pd.DataFrame, id_cols: List[str], value_cols: List[str], fill_zero: bool = False) -> pd.DataFrame:
+    """(source_type, series) x bin matrix of a long table.
+
+    Missing bins are zero for slogan frequencies (no occurrence) and carried over
+    from the neighbouring bin for means and correlations.
+    """
+    if df.empty:
+        return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=["source_type", "series"]))
+    frame = df.copy()
+    if "source_type" not in frame.columns:
+        frame["source_type"] = "all"
+    long = frame.melt(id_vars=["bin", "source_type"] + id_cols, value_vars=value_cols, var_name="measure")
+    long["series"] = long[id_cols[0]] if id_cols else long["measure"]
+    wide = long.set_index(["source_type", "series", "bin"])["value"].unstack("bin").sort_index(axis=1)
+    if fill_zero:
+        return wide.fillna(0.0)
+    return wide.ffill(axis=1).bfill(axis=1).dropna(how="any")
+
+
+def changepoint_table(
+    trend: pd.DataFrame, coupling: pd.DataFrame, slogans: pd.DataFrame, cfg: Dict[str, Any]
+) -> pd.DataFrame:
+    """Change points of the trend means, the coupling measures and every slogan frequency series."""
+    coupling_cols = [c for c in coupling.columns if c.startswith(("corr_", "d_")) and not c.endswith(("_lo", "_hi"))]
+    wides = {
+        "trend": wide_series(trend, [], ["security_mean", "growth_mean"]),
+        "coupling": wide_series(coupling, [], coupling_cols),
+        "slogans": wide_series(slogans, ["slogan"], ["freq_per_10k"], fill_zero=True),
+    }
+    parts = []
+    for table, wide in wides.items():
+        found = detect_changepoints(wide, cfg)
+        found.insert(0, "table", table)
+        if not found.empty:
+            parts.append(found)
+    if not parts:
+        return pd.DataFrame(columns=CHANGEPOINT_COLUMNS)
+    return pd.concat(parts, ignore_index=True)[CHANGEPOINT_COLUMNS]
@@ -5,7 +5,14 @@ from typing import Any, Dict, List
 import numpy as np
 import pandas as pd
 
-from src.tests.trend import quarterly_bin
+from src.binning import build_cube, rollup, row_bins, stat_columns
+from src.tests.bootstrap import (
+    bootstrap_settings,
+    cohens_d_from_sums,
+    pearson_from_sums,
+    percentile_ci,
+    resample_group_sums,
+)
 
 
 def pearson_corr(x: List[float], y: List[float]) -> float:
@@ -25,40 +32,214 @@ def cohens_d(x: List[float], y: List[float]) -> float:
     return float((np.mean(x) - np.mean(y)) / np.sqrt(pooled))
 
 
-def run_coupling(rows: List[Dict[str, Any]]) -> pd.DataFrame:
-    records = []
-    for row in rows:
-        if row["source_type"] != "mfa_presser":
-            continue
-        bin_id = quarterly_bin(row["date"])
-        records.append(
-            {
-                "bin": bin_id,
-                "outward": row["scores"]["outward_axis"],
-                "security": row["scores"]["security_axis"],
-                "growth": row["scores"]["growth_axis"],
-                "is_outward": row["scores"].get("is_outward", False),
-            }
+def coupling_ci(df: pd.DataFrame, bootstrap_cfg: Dict[str, Any] | None) -> pd.DataFrame | None:
+    n_resamples, ci, seed = bootstrap_settings(bootstrap_cfg)
+    if n_resamples <= 0:
+        return None
+    df = df.sort_values("bin", kind="stable")
+    sizes = df.groupby("bin", sort=True).size()
+    o, s, g = (df[c].to_numpy(dtype=float) for c in ["outward", "security", "growth"])
+    m = df["is_outward"].to_numpy(dtype=float)
+    sums = resample_group_sums(
+        {
+            "n": np.ones_like(o),
+            "o": o,
+            "s": s,
+            "g": g,
+            "oo": o * o,
+            "ss": s * s,
+            "gg": g * g,
+            "os": o * s,
+            "og": o * g,
+            "m": m,
+            "ms": m * s,
+            "mss": m * s * s,
+            "mg": m * g,
+            "mgg": m * g * g,
+        },
+        sizes.to_numpy(),
+        n_resamples,
+        seed,
+    )
+    n, n1 = sums["n"], sums["m"]
+    stats = {
+        "corr_outward_security": pearson_from_sums(n, sums["o"], sums["s"], sums["oo"], sums["ss"], sums["os"]),
+        "corr_outward_growth": pearson_from_sums(n, sums["o"], sums["g"], sums["oo"], sums["gg"], sums["og"]),
+        "d_security": cohens_d_from_sums(
+            n1, sums["ms"], sums["mss"], n - n1, sums["s"] - sums["ms"], sums["ss"] - sums["mss"]
+        ),
+        "d_growth": cohens_d_from_sums(
+            n1, sums["mg"], sums["mgg"], n - n1, sums["g"] - sums["mg"], sums["gg"] - sums["mgg"]
+        ),
+    }
+    out = pd.DataFrame({"bin": sizes.index})
+    for col, values in stats.items():
+        out[f"{col}_lo"], out[f"{col}_hi"] = percentile_ci(values, ci)
+    return out
+
+
+def coupling_from_cube(cube: pd.DataFrame, binning: str, periods: List[Dict[str, str]] | None = None) -> pd.DataFrame:
+    stats = rollup(cube[cube["source_type"] == "mfa_presser"], binning, periods, by=("is_outward",))
+    stats["is_outward"] = stats["is_outward"].astype(bool)
+    cols = stat_columns()
+    total = stats.groupby("bin", sort=True)[cols].sum()
+    inside = stats[stats["is_outward"]].set_index("bin")[cols].reindex(total.index, fill_value=0.0)
+    outside = total - inside
+
+    def col(frame: pd.DataFrame, name: str) -> np.ndarray:
+        return frame[name].to_numpy(dtype=float)
+
+    out = pd.DataFrame({"bin": total.index})
+    for axis in ["security", "growth"]:
+        out[f"corr_outward_{axis}"] = pearson_from_sums(
+            col(total, "n"),
+            col(total, "sum_outward"),
+            col(total, f"sum_{axis}"),
+            col(total, "sq_outward"),
+            col(total, f"sq_{axis}"),
+            col(total, f"cross_outward_{axis}"),
+        )
+    for axis in ["security", "growth"]:
+        out[f"d_{axis}"] = cohens_d_from_sums(
+            col(inside, "n"),
+            col(inside, f"sum_{axis}"),
+            col(inside, f"sq_{axis}"),
+            col(outside, "n"),
+            col(outside, f"sum_{axis}"),
+            col(outside, f"sq_{axis}"),
         )
-    if not records:
+    return out.fillna(0.0)
+
+
+def run_coupling(
+    rows: List[Dict[str, Any]],
+    bootstrap_cfg: Dict[str, Any] | None = None,
+    binning: str = "quarterly",
+    periods: List[Dict[str, str]] | None = None,
+    cube: pd.DataFrame | None = None,
+    bins: np.ndarray | None = None,
+) -> pd.DataFrame:
+    if cube is None:
+        cube = build_cube(rows)
+    result = coupling_from_cube(cube, binning, periods)
+    if result.empty:
         return pd.DataFrame(columns=["bin", "corr_outward_security", "corr_outward_growth", "d_security", "d_growth"])
-    df = pd.DataFrame(records)
-    out = []
-    for bin_id, group in df.groupby("bin"):
-        out.append(
-            {
-                "bin": bin_id,
-                "corr_outward_security": pearson_corr(group["outward"].tolist(), group["security"].tolist()),
-                "corr_outward_growth": pearson_corr(group["outward"].tolist(), group["growth"].tolist()),
-                "d_security": cohens_d(
-                    group.loc[group["is_outward"], "security"].tolist(),
-                    group.loc[~group["is_outward"], "security"].tolist(),
-                ),
-                "d_growth": cohens_d(
-                    group.loc[group["is_outward"], "growth"].tolist(),
-                    group.loc[~group["is_outward"], "growth"].tolist(),
-                ),
-            }
+    if bootstrap_settings(bootstrap_cfg)[0] > 0:
+        if bins is None:
+            bins = row_bins(rows, binning, periods)
+        df = pd.DataFrame(
+            [
+                {
+                    "bin": bin_id,
+                    "outward": row["scores"]["outward_axis"],
+                    "security": row["scores"]["security_axis"],
+                    "growth": row["scores"]["growth_axis"],
+                    "is_outward": row["scores"].get("is_outward", False),
+                }
+                for row, bin_id in zip(rows, bins)
+                if bin_id is not None and row["source_type"] == "mfa_presser"
+            ]
         )
-    return pd.DataFrame(out).sort_values("bin")
+        cis = coupling_ci(df, bootstrap_cfg)
+        result = result.merge(cis, on="bin", how="left")
+    return result.sort_values("bin")
+
+
+REGRESSION_TERMS = ["intercept", "security", "growth", "log_char_len"]
+
+
+def regression_design(rows: List[Dict[str, Any]]) -> tuple[np.ndarray, np.ndarray, List[str]]:
+    """Outward score and design matrix: intercept, axis scores, log length and one indicator per segment type.
+
+    Every type gets an indicator; ``batched_ols`` drops the reference level of each group.
+    """
+    types = sorted({row.get("segment_type") or "" for row in rows})
+    seg_type = np.array([row.get("segment_type") or "" for row in rows], dtype=object)
+    y = np.array([row["scores"]["outward_axis"] for row in rows], dtype=np.float64)
+    columns = [
+        np.ones(len(rows)),
+        np.array([row["scores"]["security_axis"] for row in rows], dtype=np.float64),
+        np.array([row["scores"]["growth_axis"] for row in rows], dtype=np.float64),
+        np.log(np.maximum(np.array([row["char_len"] for row in rows], dtype=np.float64), 1.0)),
+    ]
+    columns += [(seg_type == t).astype(np.float64) for t in types]
+    return y, np.column_stack(columns), types
+
+
+def batched_ols(
+    X: np.ndarray, y: np.ndarray, groups: np.ndarray, n_groups: int, indicators: int = 0
+) -> Dict[str, np.ndarray]:
+    """Least squares of ``y`` on ``X`` within every group at once.
+
+    Per-group cross-products come from one weighted ``bincount`` per pair of columns,
+    and all normal equations are solved by a single stacked inverse. The last
+    ``indicators`` columns are 0/1 indicators of one categorical variable, one per
+    level. Within each group the first level present is the reference and is dropped
+    with the levels absent from the group; their coefficients are NaN, and
+    ``reference`` gives the reference column (-1 when no level is present). A group
+    whose remaining design is rank-deficient gets NaN coefficients and standard errors.
+    """
+    p = X.shape[1]
+    n = np.bincount(groups, minlength=n_groups).astype(np.float64)
+    xtx = np.empty((n_groups, p, p))
+    for i in range(p):
+        for j in range(i, p):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(groups, weights=X[:, i] * X[:, j], minlength=n_groups)
+    xty = np.stack([np.bincount(groups, weights=X[:, i] * y, minlength=n_groups) for i in range(p)], axis=1)
+    yty = np.bincount(groups, weights=y * y, minlength=n_groups)
+    ysum = np.bincount(groups, weights=y, minlength=n_groups)
+
+    # Indicator counts sit on the intercept row (X[:, 0]).
+    active = np.ones((n_groups, p), dtype=bool)
+    reference = np.full(n_groups, -1, dtype=np.int64)
+    if indicators:
+        present = xtx[:, 0, p - indicators :] > 0
+        has_level = present.any(axis=1)
+        reference[has_level] = p - indicators + present[has_level].argmax(axis=1)
+        active[:, p - indicators :] = present
+        active[np.flatnonzero(has_level), reference[has_level]] = False
+    mask = active[:, :, None] & active[:, None, :]
+    # Dropped columns become identity rows, so a group is solvable iff its active block is full rank.
+    padded = np.where(mask, xtx, 0.0) + np.eye(p) * ~active[:, None, :]
+    full_rank = np.linalg.matrix_rank(padded, hermitian=True) == p
+    inverse = np.linalg.inv(np.where(full_rank[:, None, None], padded, np.eye(p)))
+    xty = np.where(active, xty, 0.0)
+    coef = np.einsum("gij,gj->gi", inverse, xty)
+    rss = np.maximum(yty - np.einsum("gi,gi->g", coef, xty), 0.0)
+    dof = n - active.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = np.where(dof > 0, rss / dof, np.nan)
+        se = np.sqrt(sigma2[:, None] * np.diagonal(inverse, axis1=1, axis2=2))
+        tss = yty - ysum * ysum / n
+        r2 = np.where((tss > 0) & full_rank, 1.0 - rss / tss, np.nan)
+    keep = active & full_rank[:, None]
+    coef = np.where(keep, coef, np.nan)
+    se = np.where(keep, se, np.nan)
+    return {"n": n, "coef": coef, "se": se, "r2": r2, "reference": reference, "full_rank": full_rank}
+
+
+def coupling_regression(rows: List[Dict[str, Any]], bins: np.ndarray) -> pd.DataFrame:
+    """Per (bin, source_type): outward ~ security + growth + log(char_len) + segment_type.
 
+    Headings are left out (their axis scores are fixed at 0). ``reference_type`` is the
+    segment type the group's type coefficients are relative to.
+    """
+    keep = [i for i, bin_id in enumerate(bins) if bin_id is not None and rows[i].get("segment_type") != "heading"]
+    rows = [rows[i] for i in keep]
+    if not rows:
+        return pd.DataFrame(columns=["bin", "source_type", "n", "r2", "reference_type"])
+    y, X, types = regression_design(rows)
+    keys = pd.MultiIndex.from_arrays(
+        [np.asarray(bins, dtype=object)[keep], [row["source_type"] for row in rows]], names=["bin", "source_type"]
+    )
+    groups, labels = pd.factorize(keys, sort=True)
+    fit = batched_ols(X, y, groups, len(labels), indicators=len(types))
+    out = pd.DataFrame(labels.tolist(), columns=["bin", "source_type"])
+    out["n"] = fit["n"].astype(int)
+    out["r2"] = fit["r2"]
+    level = fit["reference"] - len(REGRESSION_TERMS)
+    out["reference_type"] = [types[k] if k >= 0 else None for k in level]
+    for k, term in enumerate(REGRESSION_TERMS + [f"segment_type_{t}" for t in types]):
+        out[f"coef_{term}"] = fit["coef"][:, k]
+        out[f"se_{term}"] = fit["se"][:, k]
+    return out
@@ -1,19 +1,55 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
 
 from src.tests.slogans import entropy_from_counts
 
 
 def cluster_embeddings(embeddings: np.ndarray, k: int, random_state: int) -> np.ndarray:
+    from sklearn.cluster import KMeans
+
     model = KMeans(n_clusters=k, random_state=random_state, n_init=10)
     return model.fit_predict(embeddings)
 
 
+def sweep_config(cluster_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"k_values": [], "batch_size": 4096, "n_init": 3, "silhouette_sample": 5000}
+    cfg.update(cluster_cfg.get("sweep") or {})
+    return cfg
+
+
+def fit_minibatch(
+    embeddings: np.ndarray, k: int, random_state: int, batch_size: int, n_init: int
+) -> Tuple[np.ndarray, float]:
+    """Mini-batch k-means labels and inertia over all rows; reads ``embeddings`` batch by batch."""
+    from sklearn.cluster import MiniBatchKMeans
+
+    model = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=batch_size, n_init=n_init)
+    model.fit(embeddings)
+    return model.labels_, float(model.inertia_)
+
+
+def sampled_silhouette(embeddings: np.ndarray, labels: np.ndarray, sample_size: int, random_state: int) -> float:
+    from sklearn.metrics import silhouette_score
+
+    if len(np.unique(labels)) < 2:
+        return float("nan")
+    sample = min(sample_size, len(labels))
+    return float(silhouette_score(embeddings, labels, sample_size=sample, random_state=random_state))
+
+
+def select_k(metrics: pd.DataFrame) -> pd.DataFrame:
+    """Sweep results sorted by k, with the highest-silhouette k marked ``selected``."""
+    out = metrics.sort_values("k").reset_index(drop=True)
+    out["selected"] = False
+    if out["silhouette"].notna().any():
+        out.loc[out["silhouette"].idxmax(), "selected"] = True
+    return out
+
+
 def slogan_entropy(
     slogan_to_segments: Dict[str, List[int]],
     cluster_labels: np.ndarray,
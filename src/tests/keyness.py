@@ -5,6 +5,7 @@ from typing import Dict, Iterable, List, Tuple
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 
 def char_ngrams(text: str, n_min: int, n_max: int) -> Iterable[str]:
@@ -14,36 +15,80 @@ def char_ngrams(text: str, n_min: int, n_max: int) -> Iterable[str]:
             yield clean[i : i + n]
 
 
-def log_odds(counter_a: Counter, counter_b: Counter, alpha: float) -> Dict[str, float]:
-    vocab = set(counter_a.keys()) | set(counter_b.keys())
-    a_total = sum(counter_a.values())
-    b_total = sum(counter_b.values())
-    scores = {}
-    for term in vocab:
-        a = counter_a.get(term, 0) + alpha
-        b = counter_b.get(term, 0) + alpha
-        score = np.log(a / (a_total + alpha)) - np.log(b / (b_total + alpha))
-        scores[term] = float(score)
-    return scores
-
-
-def chi_square(counter_a: Counter, counter_b: Counter) -> Dict[str, float]:
-    vocab = set(counter_a.keys()) | set(counter_b.keys())
-    a_total = sum(counter_a.values())
-    b_total = sum(counter_b.values())
-    scores = {}
-    for term in vocab:
-        a = counter_a.get(term, 0)
-        b = counter_b.get(term, 0)
-        expected_a = (a_total * (a + b)) / (a_total + b_total)
-        expected_b = (b_total * (a + b)) / (a_total + b_total)
-        score = 0.0
-        if expected_a > 0:
-            score += (a - expected_a) ** 2 / expected_a
-        if expected_b > 0:
-            score += (b - expected_b) ** 2 / expected_b
-        scores[term] = float(score)
-    return scores
+def ngram_matrix(texts: List[str], n_min: int, n_max: int) -> Tuple[sparse.csr_matrix, List[str]]:
+    """Segment x n-gram count matrix and its vocabulary."""
+    vocab: Dict[str, int] = {}
+    indptr, indices, data = [0], [], []
+    for text in texts:
+        counts = Counter(char_ngrams(text, n_min, n_max))
+        indices.extend(vocab.setdefault(term, len(vocab)) for term in counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(texts), len(vocab)),
+    )
+    return matrix, list(vocab)
+
+
+def keyness_scores(a: np.ndarray, b: np.ndarray, a_total, b_total, method: str, alpha: float) -> np.ndarray:
+    """``log_odds`` / ``chi_square`` on count arrays; columns of ``a``/``b`` may be permutations."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "chi_square":
+            total = a_total + b_total
+            expected_a = a_total * (a + b) / total
+            expected_b = b_total * (a + b) / total
+            score = np.where(expected_a > 0, (a - expected_a) ** 2 / expected_a, 0.0)
+            return score + np.where(expected_b > 0, (b - expected_b) ** 2 / expected_b, 0.0)
+        return np.log((a + alpha) / (a_total + alpha)) - np.log((b + alpha) / (b_total + alpha))
+
+
+def bh_qvalues(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg FDR-adjusted p-values."""
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * m / np.arange(1, m + 1)
+    q = np.minimum.accumulate(ranked[::-1])[::-1]
+    out = np.empty(m)
+    out[order] = np.minimum(q, 1.0)
+    return out
+
+
+def permutation_pvalues(
+    matrix: sparse.csr_matrix,
+    n_high: int,
+    observed: np.ndarray,
+    method: str,
+    alpha: float,
+    n_permutations: int,
+    seed: int,
+    block: int = 100,
+) -> np.ndarray:
+    """One-sided p-values for every n-gram from shuffled group labels.
+
+    Each block of permutations is one sparse product: ``X.T @ L`` gives the
+    high-group counts of every n-gram under each of the ``block`` label vectors.
+    """
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    columns = matrix.T.tocsr()
+    totals = np.asarray(matrix.sum(axis=0)).ravel()[:, None]
+    lengths = np.asarray(matrix.sum(axis=1)).ravel()
+    exceed = np.zeros(matrix.shape[1])
+    # Keep the (n-grams x block) intermediates to a few tens of MB for large vocabularies.
+    block = max(1, min(block, 4_000_000 // max(1, matrix.shape[1])))
+    for start in range(0, n_permutations, block):
+        size = min(block, n_permutations - start)
+        labels = np.zeros((n, size))
+        picks = np.argsort(rng.random((size, n)), axis=1)[:, :n_high]
+        labels[picks, np.arange(size)[:, None]] = 1.0
+        a = columns @ labels
+        a_total = lengths @ labels
+        stats = keyness_scores(a, totals - a, a_total, lengths.sum() - a_total, method, alpha)
+        exceed += (stats >= observed[:, None]).sum(axis=1)
+    return (exceed + 1.0) / (n_permutations + 1.0)
 
 
 def compute_keyness(
@@ -54,17 +99,28 @@ def compute_keyness(
     method: str,
     alpha: float,
     top_n: int,
+    n_permutations: int = 0,
+    seed: int = 42,
 ) -> pd.DataFrame:
-    high = Counter()
-    low = Counter()
-    for text in high_texts:
-        high.update(char_ngrams(text, n_min, n_max))
-    for text in low_texts:
-        low.update(char_ngrams(text, n_min, n_max))
-    if method == "chi_square":
-        scores = chi_square(high, low)
-    else:
-        scores = log_odds(high, low, alpha)
-    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
-    return pd.DataFrame([{"ngram": term, "score": score} for term, score in ranked])
+    """Top ``top_n`` n-grams of the high group by ``method``.
 
+    With ``n_permutations``, segments are reassigned to the two groups at random
+    (group sizes fixed) and ``p_value`` is the share of permutations scoring at
+    least the observed value; ``q_value`` applies Benjamini-Hochberg over every
+    n-gram tested, not just the listed ones.
+    """
+    columns = ["ngram", "score", "count_high", "count_low"]
+    if n_permutations:
+        columns += ["p_value", "q_value"]
+    matrix, vocab = ngram_matrix(high_texts + low_texts, n_min, n_max)
+    if not vocab:
+        return pd.DataFrame(columns=columns)
+    n_high = len(high_texts)
+    a = np.asarray(matrix[:n_high].sum(axis=0)).ravel()
+    b = np.asarray(matrix[n_high:].sum(axis=0)).ravel()
+    scores = keyness_scores(a, b, a.sum(), b.sum(), method, alpha)
+    out = pd.DataFrame({"ngram": vocab, "score": scores, "count_high": a.astype(int), "count_low": b.astype(int)})
+    if n_permutations:
+        out["p_value"] = permutation_pvalues(matrix, n_high, scores, method, alpha, n_permutations, seed)
+        out["q_value"] = bh_qvalues(out["p_value"].to_numpy())
+    return out.sort_values(["score", "ngram"], ascending=[False, True]).head(top_n).reset_index(drop=True)
@@ -3,11 +3,11 @@ from __future__ import annotations
 import math
 import re
 from collections import Counter, defaultdict
-from typing import Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 import pandas as pd
 
-from src.tests.trend import quarterly_bin
+from src.binning import row_bins
 
 CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
 
@@ -30,12 +30,22 @@ def extract_candidates(texts: List[str], n_min: int, n_max: int, stoplist: set[s
     return pd.DataFrame(ranked, columns=["slogan", "frequency"])
 
 
-def slogan_metrics(rows: List[Dict[str, any]], slogans: List[str]) -> pd.DataFrame:
+def slogan_metrics(
+    rows: List[Dict[str, any]],
+    slogans: List[str],
+    binning: str = "quarterly",
+    periods: List[Dict[str, str]] | None = None,
+    bins: Iterable[str | None] | None = None,
+    index: Any = None,
+) -> pd.DataFrame:
     slogans = [s for s in slogans if s]
+    bins = list(row_bins(rows, binning, periods) if bins is None else bins)
     records = []
-    for row in rows:
-        bin_id = quarterly_bin(row["date"]) if row["source_type"] == "mfa_presser" else row["date"]
-        for slogan in slogans:
+    for slogan, positions in slogan_rows(rows, slogans, index).items():
+        for pos in positions:
+            row, bin_id = rows[pos], bins[pos]
+            if bin_id is None:
+                continue
             count = row["text"].count(slogan)
             if count:
                 records.append(
@@ -69,13 +79,37 @@ def slogan_metrics(rows: List[Dict[str, any]], slogans: List[str]) -> pd.DataFra
     return pd.DataFrame(rows_out)
 
 
-def slogan_presence(rows: List[Dict[str, any]], slogans: List[str]) -> Dict[str, List[str]]:
-    mapping = defaultdict(list)
-    for row in rows:
-        for slogan in slogans:
-            if slogan and slogan in row["text"]:
-                mapping[slogan].append(row["segment_id"])
-    return mapping
+def slogan_rows(rows: List[Dict[str, Any]], slogans: List[str], index: Any = None) -> Dict[str, List[int]]:
+    """Positions in ``rows`` of the segments containing each slogan (slogans without any are left out).
+
+    ``index`` is an ``src.ngram_index.NgramIndex`` covering ``rows``; with it only
+    the segments holding every bigram of a slogan are checked.
+    """
+    found: Dict[str, List[int]] = {}
+    if index is None:
+        hits = defaultdict(list)
+        for pos, row in enumerate(rows):
+            for slogan in slogans:
+                if slogan and slogan in row["text"]:
+                    hits[slogan].append(pos)
+        return {slogan: hits[slogan] for slogan in slogans if hits.get(slogan)}
+    at = {row["segment_id"]: pos for pos, row in enumerate(rows)}
+    segment_ids = index.meta["segment_id"]
+    for slogan in slogans:
+        if not slogan or slogan in found:
+            continue
+        candidates = (at.get(sid) for sid in segment_ids[index.candidates(slogan)].tolist())
+        positions = sorted(pos for pos in candidates if pos is not None and slogan in rows[pos]["text"])
+        if positions:
+            found[slogan] = positions
+    return found
+
+
+def slogan_presence(rows: List[Dict[str, any]], slogans: List[str], index: Any = None) -> Dict[str, List[str]]:
+    return {
+        slogan: [rows[pos]["segment_id"] for pos in positions]
+        for slogan, positions in slogan_rows(rows, slogans, index).items()
+    }
 
 
 def entropy_from_counts(counts: List[int]) -> float:
@@ -5,11 +5,8 @@ from typing import Any, Dict, List
 import numpy as np
 import pandas as pd
 
-
-def quarterly_bin(date_str: str) -> str:
-    month = int(date_str[5:7])
-    quarter = (month - 1) // 3 + 1
-    return f"{date_str[:4]}-Q{quarter}"
+from src.binning import build_cube, rollup, row_bins
+from src.tests.bootstrap import bootstrap_settings, percentile_ci, ratio, resample_group_sums
 
 
 def length_weighted_mean(values: List[float], weights: List[int]) -> float:
@@ -20,34 +17,68 @@ def length_weighted_mean(values: List[float], weights: List[int]) -> float:
     return float((v * w).sum() / w.sum()) if w.sum() > 0 else 0.0
 
 
-def run_trend(rows: List[Dict[str, Any]]) -> pd.DataFrame:
-    records = []
-    for row in rows:
-        if not row["scores"].get("is_outward"):
-            continue
-        bin_id = quarterly_bin(row["date"]) if row["source_type"] == "mfa_presser" else row["date"]
-        records.append(
-            {
-                "bin": bin_id,
-                "source_type": row["source_type"],
-                "security": row["scores"]["security_axis"],
-                "growth": row["scores"]["growth_axis"],
-                "char_len": row["char_len"],
-            }
-        )
-    if not records:
+def trend_ci(df: pd.DataFrame, keys: List[str], bootstrap_cfg: Dict[str, Any] | None) -> pd.DataFrame | None:
+    n_resamples, ci, seed = bootstrap_settings(bootstrap_cfg)
+    if n_resamples <= 0:
+        return None
+    df = df.sort_values(keys, kind="stable")
+    sizes = df.groupby(keys, sort=True).size()
+    w = df["char_len"].to_numpy(dtype=float)
+    sums = resample_group_sums(
+        {"w": w, "ws": w * df["security"].to_numpy(dtype=float), "wg": w * df["growth"].to_numpy(dtype=float)},
+        sizes.to_numpy(),
+        n_resamples,
+        seed,
+    )
+    out = sizes.index.to_frame(index=False)
+    for col, num in [("security_mean", "ws"), ("growth_mean", "wg")]:
+        out[f"{col}_lo"], out[f"{col}_hi"] = percentile_ci(ratio(sums[num], sums["w"]), ci)
+    return out
+
+
+def trend_from_cube(cube: pd.DataFrame, binning: str, periods: List[Dict[str, str]] | None = None) -> pd.DataFrame:
+    stats = rollup(cube[cube["is_outward"].astype(bool)], binning, periods, by=("source_type",))
+    w = stats["w"].to_numpy(dtype=float)
+    return pd.DataFrame(
+        {
+            "bin": stats["bin"],
+            "source_type": stats["source_type"],
+            "security_mean": np.nan_to_num(ratio(stats["wsum_security"].to_numpy(dtype=float), w)),
+            "growth_mean": np.nan_to_num(ratio(stats["wsum_growth"].to_numpy(dtype=float), w)),
+            "n_segments": stats["n"].astype(int),
+        }
+    )
+
+
+def run_trend(
+    rows: List[Dict[str, Any]],
+    bootstrap_cfg: Dict[str, Any] | None = None,
+    binning: str = "quarterly",
+    periods: List[Dict[str, str]] | None = None,
+    cube: pd.DataFrame | None = None,
+    bins: np.ndarray | None = None,
+) -> pd.DataFrame:
+    if cube is None:
+        cube = build_cube(rows)
+    result = trend_from_cube(cube, binning, periods)
+    if result.empty:
         return pd.DataFrame(columns=["bin", "source_type", "security_mean", "growth_mean", "n_segments"])
-    df = pd.DataFrame(records)
-    out = []
-    for (bin_id, source_type), group in df.groupby(["bin", "source_type"]):
-        out.append(
-            {
-                "bin": bin_id,
-                "source_type": source_type,
-                "security_mean": length_weighted_mean(group["security"].tolist(), group["char_len"].tolist()),
-                "growth_mean": length_weighted_mean(group["growth"].tolist(), group["char_len"].tolist()),
-                "n_segments": int(group.shape[0]),
-            }
+    if bootstrap_settings(bootstrap_cfg)[0] > 0:
+        if bins is None:
+            bins = row_bins(rows, binning, periods)
+        df = pd.DataFrame(
+            [
+                {
+                    "bin": bin_id,
+                    "source_type": row["source_type"],
+                    "security": row["scores"]["security_axis"],
+                    "growth": row["scores"]["growth_axis"],
+                    "char_len": row["char_len"],
+                }
+                for row, bin_id in zip(rows, bins)
+                if bin_id is not None and row["scores"].get("is_outward")
+            ]
         )
-    return pd.DataFrame(out).sort_values(["bin", "source_type"])
-
+        cis = trend_ci(df, ["bin", "source_type"], bootstrap_cfg)
+        result = result.merge(cis, on=["bin", "source_type"], how="left")
+    return result.sort_values(["bin", "source_type"])
@@ -1,12 +1,17 @@
 import hashlib
 import json
 import os
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from typing import IO, Any, Dict, Iterable, Iterator, List
 
-import chardet
 import yaml
 
+# mkstemp creates files readable by the owner only; renamed files get the usual umask mode instead.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 
 def load_yaml(path: str | Path) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
@@ -23,9 +28,39 @@ def sha1_text(text: str) -> str:
     return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
 
+@contextmanager
+def atomic_open(path: str | Path, mode: str = "w", durable: bool = False) -> Iterator[IO]:
+    """Write to a temporary file beside ``path`` and rename it over ``path`` on success.
+
+    Readers see either the old file or the complete new one; on an exception the
+    temporary file is removed and ``path`` is left untouched. ``durable`` also
+    fsyncs before the rename, for aggregates that are expensive to rebuild.
+    """
+    path = Path(path)
+    ensure_dir(path.parent)
+    # A unique temporary name per writer, so concurrent writers of one path never share it.
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    tmp = Path(name)
+    try:
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_text(path: str | Path, text: str) -> None:
+    with atomic_open(path) as f:
+        f.write(text)
+
+
 def jsonl_write(path: str | Path, rows: Iterable[Dict[str, Any]]) -> None:
-    ensure_dir(Path(path).parent)
-    with open(path, "w", encoding="utf-8") as f:
+    with atomic_open(path, durable=True) as f:
         for row in rows:
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
@@ -38,9 +73,14 @@ def jsonl_read(path: str | Path) -> List[Dict[str, Any]]:
     return rows
 
 
+def jsonl_iter(path: str | Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
 def save_json(path: str | Path, data: Dict[str, Any]) -> None:
-    ensure_dir(Path(path).parent)
-    with open(path, "w", encoding="utf-8") as f:
+    with atomic_open(path) as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
@@ -100,6 +140,8 @@ def load_curated(path: str | Path) -> List[str]:
 def ensure_utf8(data: str | bytes) -> str:
     """Return a UTF-8 string, detecting encoding when given bytes."""
     if isinstance(data, bytes):
+        import chardet
+
         detected = chardet.detect(data)
         encoding = detected.get("encoding") or "utf-8"
         try:
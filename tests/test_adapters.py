@@ -68,3 +68,24 @@ def test_party_heading_detection(tmp_path: Path) -> None:
     parsed = adapter.parse(html)
     segments = adapter.segment(parsed["text"])
     assert any(seg["segment_type"] == "heading" for seg in segments)
+
+
+def test_mfa_main_content_drops_boilerplate(tmp_path: Path) -> None:
+    html = """
+    <html><head><title>例行记者会</title></head><body>
+    <div class="menu"><ul><li><a href="/a">首页</a></li><li><a href="/b">外交部新闻发布</a></li></ul></div>
+    <div class="article">
+      <p>问：请介绍一下中方对当前国际形势的看法和立场。</p>
+      <p>答：中方始终坚持多边主义，愿同各方一道维护以联合国为核心的国际体系，推动构建人类命运共同体。</p>
+      <ul class="links"><li><a href="/r1">相关新闻：外交部发言人答记者问全文</a></li></ul>
+    </div>
+    <div class="bottom"><p>版权所有 中华人民共和国外交部</p></div>
+    </body></html>
+    """
+    adapter = MFAPressersAdapter({"source_type": "mfa_presser", "source_org": "mfa"}, tmp_path)
+    parsed = adapter.parse(html)
+    assert parsed["metadata"]["extraction"]["method"] == "density"
+    segments = adapter.segment(parsed["text"])
+    assert [seg["segment_type"] for seg in segments] == ["q_turn", "a_turn"]
+    assert "版权所有" not in parsed["text"] and "相关新闻" not in parsed["text"]
+    assert "版权所有" in parsed["full_text"]
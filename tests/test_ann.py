@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+
+from src.ann import IVFIndex, update_index
+
+
+def test_incremental_index_search_with_filters(tmp_path) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(3, 4, 16)).astype(np.float32)
+    scored = tmp_path / "segments" / "segments_scored.jsonl"
+    scored.parent.mkdir(parents=True)
+
+    def write_docs(n_docs: int) -> None:
+        with open(scored, "w", encoding="utf-8") as f:
+            for d in range(n_docs):
+                for s in range(4):
+                    row = {"segment_id": f"d{d}s{s}", "doc_id": f"doc{d}", "date": f"201{d}-06-01", "segment_type": "body",
+                           "source_type": "mfa_presser" if d < 2 else "party_report", "text": f"t{d}{s}", "scores": {}}
+                    f.write(json.dumps(row) + "\n")
+
+    arrays = {f"doc{d}": vectors[d] for d in range(3)}
+    index_dir = tmp_path / "index"
+    write_docs(2)
+    assert update_index("config", tmp_path, index_dir, arrays=arrays, nlist=3)["added"] == 8
+    write_docs(3)
+    assert update_index("config", tmp_path, index_dir, arrays=arrays)["added"] == 4
+
+    index = IVFIndex(index_dir)
+    hits = index.search(vectors[2, 1], k=2, nprobe=3)
+    assert hits[0][0] == index.row_of("d2s1") and abs(hits[0][1] - 1.0) < 1e-3
+    filtered = index.search(vectors[2, 1], k=20, nprobe=3, end="2011-12-31", source_types=["mfa_presser"])
+    assert len(filtered) == 8 and all(row < 8 for row, _ in filtered)
+    assert next(index.records(hits, scored))["text"] == "t21"
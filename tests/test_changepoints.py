@@ -0,0 +1,92 @@
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.tests.changepoints import changepoint_table, noise_scale, pelt
+
+CFG = {"penalty": 15.0, "min_size": 2}
+
+
+def exact_segmentation(z: np.ndarray, penalty: float, min_size: int) -> list[int]:
+    n = len(z)
+    best, best_cost = [], np.inf
+    for k in range(n // min_size):
+        for points in itertools.combinations(range(min_size, n - min_size + 1), k):
+            bounds = [0, *points, n]
+            if any(b - a < min_size for a, b in zip(bounds, bounds[1:])):
+                continue
+            cost = sum(((z[a:b] - z[a:b].mean()) ** 2).sum() for a, b in zip(bounds, bounds[1:])) + penalty * k
+            if cost < best_cost - 1e-9:
+                best, best_cost = list(points), cost
+    return best
+
+
+def test_pelt_matches_exhaustive_search() -> None:
+    rng = np.random.default_rng(1)
+    series = rng.normal(size=(20, 12)) + np.repeat(rng.integers(0, 3, size=(20, 3)) * 2.0, 4, axis=1)
+    found = pelt(series, penalty=3.0, min_size=2)
+    for row, points in zip(series, found):
+        scale = np.median(np.abs(np.diff(row) - np.median(np.diff(row)))) * 1.4826 / np.sqrt(2)
+        assert points == exact_segmentation(row / scale, 3.0, 2)
+
+
+def optimal_partitioning(z: np.ndarray, penalty: float, min_size: int) -> list[int]:
+    """O(n^2) dynamic program over every feasible last change point (no pruning)."""
+    n = len(z)
+    c1, c2 = np.concatenate([[0.0], np.cumsum(z)]), np.concatenate([[0.0], np.cumsum(z * z)])
+    best, last = np.full(n + 1, np.inf), np.zeros(n + 1, dtype=int)
+    best[0] = -penalty
+    for t in range(min_size, n + 1):
+        for s in range(t - min_size + 1):
+            cost = best[s] + c2[t] - c2[s] - (c1[t] - c1[s]) ** 2 / (t - s) + penalty
+            if cost < best[t]:
+                best[t], last[t] = cost, s
+    points, t = [], n
+    while (t := int(last[t])) > 0:
+        points.append(t)
+    return points[::-1]
+
+
+@pytest.mark.parametrize("min_size", [1, 2, 3])
+def test_pelt_matches_optimal_partitioning(min_size: int) -> None:
+    rng = np.random.default_rng(0)
+    # Sparse large jumps on noise: series where pruning too early leaves extra change points.
+    series = rng.normal(size=(1600, 14)) + (rng.random((1600, 14)) < 0.2) * rng.normal(scale=3, size=(1600, 14))
+    found = pelt(series, penalty=4.0, min_size=min_size)
+    z = series / noise_scale(series)[:, None]
+    assert found == [optimal_partitioning(row, 4.0, min_size) for row in z]
+
+
+def test_changepoint_table_covers_hundreds_of_slogans_quickly() -> None:
+    rng = np.random.default_rng(0)
+    bins = [f"{y}-Q{q}" for y in range(2012, 2026) for q in range(1, 5)]
+    level = np.where(np.arange(len(bins)) < 30, 0.2, 0.8)
+    trend = pd.DataFrame(
+        {
+            "bin": bins,
+            "source_type": "mfa_presser",
+            "security_mean": level + rng.normal(scale=0.05, size=len(bins)),
+            "growth_mean": 0.5 + rng.normal(scale=0.05, size=len(bins)),
+        }
+    )
+    coupling = pd.DataFrame({"bin": bins, "corr_outward_security": rng.normal(scale=0.1, size=len(bins))})
+    slogans = pd.DataFrame(
+        [
+            {"bin": b, "source_type": "mfa_presser", "slogan": f"s{i}", "freq_per_10k": 5.0 * (j >= 20) + rng.random()}
+            for i in range(400)
+            for j, b in enumerate(bins)
+            if i or j % 7  # slogan s0 is absent from some bins: zero frequency there
+        ]
+    )
+    start = time.perf_counter()
+    table = changepoint_table(trend, coupling, slogans, CFG)
+    assert time.perf_counter() - start < 5
+    security = table[(table.table == "trend") & (table.series == "security_mean")]
+    assert security["bin"].tolist() == [bins[30]] and security["shift"].iloc[0] > 0.5
+    assert table[(table.table == "trend") & (table.series == "growth_mean")].empty
+    slogan_bins = table[table.table == "slogans"].groupby("series")["bin"].apply(list)
+    assert len(slogan_bins) == 400 and slogan_bins.apply(lambda b: bins[20] in b).all()
+    assert (slogan_bins.apply(len) == 1).sum() > 390
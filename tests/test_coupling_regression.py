@@ -0,0 +1,99 @@
+import numpy as np
+
+from src.tests.coupling import coupling_regression
+
+
+def make_rows(n: int, seed: int = 0) -> tuple[list[dict], np.ndarray]:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        source = "mfa_presser" if rng.random() < 0.7 else "party_report"
+        seg_type = rng.choice(["a_turn", "q_turn"]) if source == "mfa_presser" else "body"
+        s, g = rng.normal(size=2)
+        length = int(rng.integers(5, 300))
+        outward = 0.3 * s - 0.2 * g + 0.1 * np.log(length) + 0.5 * (seg_type == "q_turn") + rng.normal(scale=0.5)
+        rows.append(
+            {
+                "source_type": source,
+                "segment_type": seg_type,
+                "char_len": length,
+                "scores": {"security_axis": s, "growth_axis": g, "outward_axis": outward},
+            }
+        )
+    bins = rng.choice(["2019-Q1", "2019-Q2", "2019-Q3"], size=n).astype(object)
+    bins[:5] = None
+    return rows, bins
+
+
+def test_batched_fit_matches_per_group_least_squares() -> None:
+    rows, bins = make_rows(3000)
+    table = coupling_regression(rows, bins)
+    assert len(table) == 6 and table["n"].sum() == 2995
+    for record in table.itertuples():
+        group = [
+            r for r, b in zip(rows, bins) if b == record.bin and r["source_type"] == record.source_type
+        ]
+        X = [[1.0, r["scores"]["security_axis"], r["scores"]["growth_axis"], np.log(r["char_len"])] for r in group]
+        if record.source_type == "mfa_presser":
+            X = [x + [float(r["segment_type"] == "q_turn")] for x, r in zip(X, group)]
+        X, y = np.array(X), np.array([r["scores"]["outward_axis"] for r in group])
+        coef, rss, *_ = np.linalg.lstsq(X, y, rcond=None)
+        se = np.sqrt(rss[0] / (len(y) - X.shape[1]) * np.diag(np.linalg.inv(X.T @ X)))
+        terms = ["intercept", "security", "growth", "log_char_len"]
+        terms += ["segment_type_q_turn"] if record.source_type == "mfa_presser" else []
+        np.testing.assert_allclose([getattr(record, f"coef_{t}") for t in terms], coef, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose([getattr(record, f"se_{t}") for t in terms], se, rtol=1e-8)
+        # Types absent from (or constant within) a group get no coefficient.
+        assert np.isnan(record.coef_segment_type_body)
+        if record.source_type == "party_report":
+            assert np.isnan(record.coef_segment_type_q_turn)
+
+
+def make_row(source: str, seg_type: str, rng: np.random.Generator) -> dict:
+    s, g = rng.normal(size=2)
+    length = int(rng.integers(5, 300))
+    outward = 0.3 * s - 0.2 * g + 0.1 * np.log(length) + 0.4 * (seg_type == "q_turn") + rng.normal(scale=0.5)
+    if seg_type == "heading":
+        s = g = outward = 0.0
+    return {
+        "source_type": source,
+        "segment_type": seg_type,
+        "char_len": length,
+        "scores": {"security_axis": s, "growth_axis": g, "outward_axis": outward},
+    }
+
+
+def test_reference_level_is_chosen_per_group_and_singular_groups_are_nan() -> None:
+    rng = np.random.default_rng(3)
+    # 2019-Q1 has a_turn (the global reference) and q_turn; 2019-Q2 only body and q_turn.
+    q1 = [make_row("mfa_presser", rng.choice(["a_turn", "q_turn"]), rng) for _ in range(200)]
+    q2 = [make_row("mfa_presser", rng.choice(["body", "q_turn"]), rng) for _ in range(200)]
+    headings = [make_row("mfa_presser", "heading", rng) for _ in range(30)]
+    # Three rows cannot identify five coefficients.
+    tiny = [make_row("party_report", t, rng) for t in ["body", "body", "q_turn"]]
+    rows = q1 + q2 + headings + tiny
+    bins = np.array(["2019-Q1"] * 200 + ["2019-Q2"] * 230 + ["2019-Q3"] * 3, dtype=object)
+    table = coupling_regression(rows, bins).set_index(["bin", "source_type"])
+    assert table["n"].tolist() == [200, 200, 3]
+    assert table["reference_type"].tolist() == ["a_turn", "body", "body"]
+
+    q2_fit = table.loc[("2019-Q2", "mfa_presser")]
+    X = np.array(
+        [
+            [1.0, r["scores"]["security_axis"], r["scores"]["growth_axis"], np.log(r["char_len"]), 0.0]
+            for r in q2
+        ]
+    )
+    X[:, 4] = [r["segment_type"] == "q_turn" for r in q2]
+    y = np.array([r["scores"]["outward_axis"] for r in q2])
+    coef, rss, *_ = np.linalg.lstsq(X, y, rcond=None)
+    se = np.sqrt(rss[0] / (len(y) - 5) * np.diag(np.linalg.inv(X.T @ X)))
+    terms = ["intercept", "security", "growth", "log_char_len", "segment_type_q_turn"]
+    np.testing.assert_allclose([q2_fit[f"coef_{t}"] for t in terms], coef, rtol=1e-8)
+    np.testing.assert_allclose([q2_fit[f"se_{t}"] for t in terms], se, rtol=1e-8)
+    assert np.isnan(q2_fit["coef_segment_type_body"]) and np.isnan(q2_fit["coef_segment_type_a_turn"])
+    assert "coef_segment_type_heading" not in table.columns
+
+    singular = table.loc[("2019-Q3", "party_report")]
+    assert np.isnan(singular["r2"])
+    assert all(np.isnan(singular[f"coef_{t}"]) and np.isnan(singular[f"se_{t}"]) for t in terms)
@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pytest
+
+from src.dag import Task, run_tasks, select_tasks, shared
+
+
+def noop() -> None:
+    pass
+
+
+def log_name(name: str) -> None:
+    with open(shared()["log"], "a", encoding="utf-8") as f:
+        f.write(name + "\n")
+
+
+def make_tasks() -> list[Task]:
+    return [
+        Task("trends", noop),
+        Task("coupling", noop),
+        Task("keyness:2019", noop),
+        Task("keyness:2020", noop),
+        Task("keyness:period", noop, deps=("keyness:2019", "keyness:2020")),
+        Task("changepoints", noop, deps=("trends", "coupling")),
+    ]
+
+
+def names(tasks: list[Task]) -> list[str]:
+    return [t.name for t in tasks]
+
+
+def test_select_by_group_and_full_name() -> None:
+    assert names(select_tasks(make_tasks(), ["keyness"], None)) == ["keyness:2019", "keyness:2020", "keyness:period"]
+    assert names(select_tasks(make_tasks(), ["keyness:2020", "trends"], None)) == ["trends", "keyness:2020"]
+    assert names(select_tasks(make_tasks(), None, ["keyness"])) == ["trends", "coupling", "changepoints"]
+    assert names(select_tasks(make_tasks(), ["keyness"], ["keyness:2019"])) == ["keyness:2020", "keyness:period"]
+    assert names(select_tasks(make_tasks(), None, None)) == names(make_tasks())
+
+
+def test_select_rejects_unknown_names() -> None:
+    with pytest.raises(ValueError, match="elasticity"):
+        select_tasks(make_tasks(), ["elasticity"], None)
+    with pytest.raises(ValueError, match="keyness:2030"):
+        select_tasks(make_tasks(), None, ["keyness:2030"])
+
+
+def test_select_keeps_dependencies_that_run_and_drops_the_rest() -> None:
+    selected = {t.name: t for t in select_tasks(make_tasks(), ["changepoints", "trends"], None)}
+    assert list(selected) == ["trends", "changepoints"]
+    # coupling is not selected: changepoints reads its last written output instead of waiting for it.
+    assert selected["changepoints"].deps == ("trends",)
+    selected = {t.name: t for t in select_tasks(make_tasks(), None, ["keyness:2019"])}
+    assert selected["keyness:period"].deps == ("keyness:2020",)
+    assert selected["changepoints"].deps == ("trends", "coupling")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_tasks_orders_dependencies(tmp_path: Path, workers: int) -> None:
+    tasks = [
+        Task("c", log_name, ("c",), deps=("a", "b")),
+        Task("b", log_name, ("b",), deps=("a",)),
+        Task("a", log_name, ("a",)),
+        Task("d", log_name, ("d",)),
+    ]
+    log = tmp_path / "log.txt"
+    timings = run_tasks(tasks, {"log": str(log)}, workers=workers)
+    order = log.read_text(encoding="utf-8").split()
+    assert sorted(order) == ["a", "b", "c", "d"] and set(timings) == set(order)
+    assert order.index("a") < order.index("b") < order.index("c")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_tasks_rejects_cycles(tmp_path: Path, workers: int) -> None:
+    tasks = [
+        Task("a", log_name, ("a",), deps=("c",)),
+        Task("b", log_name, ("b",), deps=("a",)),
+        Task("c", log_name, ("c",), deps=("b",)),
+    ]
+    log = tmp_path / "log.txt"
+    with pytest.raises(ValueError, match="cycle"):
+        run_tasks(tasks, {"log": str(log)}, workers=workers)
+    assert not log.exists()
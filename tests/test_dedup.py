@@ -0,0 +1,26 @@
+from src.dedup import Deduplicator, dedup_config, mark_duplicates
+
+
+def test_near_duplicates_point_at_first_occurrence() -> None:
+    base = "外交部发言人主持例行记者会。问：关于美国对中国商品加征关税一事，中方有何回应？答：我们已多次表明立场，坚决反对单边主义。"
+    edited = base.replace("坚决反对", "坚定反对")
+    other = "经济增长与合作共赢是双边关系的重要基础，双方同意加强贸易投资和人文交流。" * 2
+    results = Deduplicator(threshold=0.7).add_many([("a", base), ("b", edited), ("c", other)])
+    assert results[0] is None and results[2] is None
+    assert results[1][0] == "a"
+
+
+def test_mark_duplicates_flags_docs_and_segments() -> None:
+    def doc(doc_id: str, texts: list[str]) -> dict:
+        segments = [
+            {"segment_id": f"{doc_id}-{i}", "segment_type": "answer", "text": t, "char_len": len(t)}
+            for i, t in enumerate(texts)
+        ]
+        return {"doc_id": doc_id, "clean_text": "\n".join(texts), "segments": segments}
+
+    opening = "各位记者朋友们，下午好！欢迎参加今天的外交部例行记者会，首先我发布一条消息。"
+    docs = [doc("d1", [opening, "谢谢。"]), doc("d2", [opening, "谢谢。"]), doc("d3", ["完全不同的内容在这里出现，与前两篇无关。"])]
+    stats = mark_duplicates(docs, dedup_config({}))
+    assert docs[1]["dup_of"] == "d1" and docs[2]["dup_of"] is None
+    assert [s["dup_of"] for s in docs[1]["segments"]] == ["d1-0", "d1-1"]
+    assert stats["dup_segments"] == 2
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from src.tests.elasticity import fit_minibatch, sampled_silhouette, select_k
+
+
+def test_minibatch_sweep_prefers_true_cluster_count() -> None:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=10.0, size=(3, 8))
+    matrix = np.vstack([c + rng.normal(size=(200, 8)) for c in centers]).astype(np.float32)
+    metrics = []
+    for k in [4, 2, 3]:
+        labels, inertia = fit_minibatch(matrix, k, 42, batch_size=128, n_init=3)
+        assert labels.shape == (600,) and len(np.unique(labels)) == k
+        metrics.append({"k": k, "inertia": inertia, "silhouette": sampled_silhouette(matrix, labels, 300, 42)})
+    table = select_k(pd.DataFrame(metrics))
+    assert table["k"].tolist() == [2, 3, 4]
+    assert table.loc[table["selected"], "k"].tolist() == [3]
+    assert np.isnan(sampled_silhouette(matrix, np.zeros(600, dtype=int), 300, 42))
@@ -0,0 +1,48 @@
+import threading
+
+import numpy as np
+
+from src.embed import EmbeddingEngine, HashingEncoder
+from src.embed_server import EmbeddingServer
+
+MODEL_CFG = {
+    "model_name": "m",
+    "backend": "hashing",
+    "dim": 16,
+    "batch_size": 8,
+    "max_length": 64,
+    "cache_mode": "embeddings",
+    "embedding_dtype": "float16",
+}
+
+
+def test_engine_encodes_through_server(tmp_path) -> None:
+    cfg = {**MODEL_CFG, "server": {"socket": str(tmp_path / "embed.sock"), "max_wait_ms": 50}}
+    server = EmbeddingServer(tmp_path / "embed.sock", cfg)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        engines = [EmbeddingEngine(cfg, tmp_path / f"cache{i}") for i in range(3)]
+        texts = [["维护国家安全", "推动高质量发展"], ["维护国家安全"], ["坚持对外开放"]]
+        results: list = [None] * 3
+
+        def embed(i: int) -> None:
+            results[i] = engines[i].embed_texts(texts[i])
+
+        workers = [threading.Thread(target=embed, args=(i,)) for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        local = HashingEncoder(16)
+        for got, batch in zip(results, texts):
+            np.testing.assert_allclose(got, local.encode(batch), atol=1e-6)
+        assert type(engines[0].model).__name__ == "RemoteEncoder"
+        stats = server.batcher.stats
+        assert stats["texts"] == 4 and stats["encoded"] == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not (tmp_path / "embed.sock").exists()
+    # With no server running the engine loads the model itself.
+    assert isinstance(EmbeddingEngine(cfg, tmp_path / "cache").model, HashingEncoder)
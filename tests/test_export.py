@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.export import ExcerptLabel, build_excerpt_bank, stream_excerpt_bank
+
+
+def make_row(i: int, date: str, security: float, outward: bool) -> dict:
+    return {
+        "segment_id": f"s{i}",
+        "doc_id": f"d{i}",
+        "title": "t",
+        "date": date,
+        "source_type": "mfa_presser",
+        "url": "u",
+        "text": f"text {i}",
+        "scores": {"security_axis": security, "outward_axis": security / 2, "is_outward": outward},
+    }
+
+
+def test_stream_matches_in_memory_and_respects_labels(tmp_path) -> None:
+    rows = [make_row(i, f"2020-0{1 + i % 6}-01", float(i % 7), i % 3 != 0) for i in range(40)]
+    path = tmp_path / "scored.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+    labels = [
+        ExcerptLabel("low_security", "security_axis", "bottom", {"is_outward": True}),
+        ExcerptLabel("mid_security", "security_axis", "top", {"security_axis": {"max": 4.0}, "doc_id": ["d4", "d11"]}),
+    ]
+    in_memory = build_excerpt_bank(rows, top_n=2, labels=labels)
+    streamed, n_rows = stream_excerpt_bank(path, top_n=2, labels=labels)
+    assert streamed == in_memory and n_rows == len(rows)
+    assert {r["bin"] for r in in_memory} == {"2020-Q1", "2020-Q2"}
+    low_q1 = [r["scores"]["security_axis"] for r in in_memory if r["label"] == "low_security" and r["bin"] == "2020-Q1"]
+    eligible = [r for r in rows if r["scores"]["is_outward"] and r["date"] < "2020-04"]
+    assert low_q1 == sorted(r["scores"]["security_axis"] for r in eligible)[:2]
+    assert [r["doc_id"] for r in in_memory if r["label"] == "mid_security"] == ["d4", "d11"]
+
+
+def test_diversity_skips_near_duplicate_excerpts(tmp_path) -> None:
+    # Rows 0-3 score highest but share one direction; rows 4-7 each point elsewhere.
+    rows = [make_row(i, "2021-02-01", 10.0 - i * 0.1 if i < 4 else 5.0 - i * 0.1, True) for i in range(8)]
+    basis = np.eye(8, dtype=np.float32)
+    vectors = {f"s{i}": basis[0] + 0.01 * basis[i] if i < 4 else basis[i] for i in range(8)}
+
+    def load(batch: list) -> np.ndarray:
+        return np.stack([vectors[r["segment_id"]] for r in batch])
+
+    labels = [ExcerptLabel("top_security", "security_axis", "top", {})]
+    plain = build_excerpt_bank(rows, top_n=3, labels=labels)
+    assert [r["doc_id"] for r in plain] == ["d0", "d1", "d2"]
+    assert build_excerpt_bank(rows, top_n=3, labels=labels, diversity=0.0, load_vectors=load) == plain
+    diverse = build_excerpt_bank(rows, top_n=3, labels=labels, diversity=0.5, load_vectors=load)
+    assert [r["doc_id"] for r in diverse] == ["d0", "d4", "d5"]
+    path = tmp_path / "scored.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+    streamed, _ = stream_excerpt_bank(path, top_n=3, labels=labels, diversity=0.5, load_vectors=load)
+    assert streamed == diverse
+    with pytest.raises(ValueError):
+        build_excerpt_bank(rows, top_n=3, labels=labels, diversity=0.5)
+
+    # A list with an uncached candidate keeps its plain top-n instead of favouring the unknown row.
+    def load_partial(batch: list) -> np.ndarray:
+        matrix = load(batch)
+        matrix[[r["segment_id"] == "s6" for r in batch]] = np.nan
+        return matrix
+
+    assert build_excerpt_bank(rows, top_n=3, labels=labels, diversity=0.5, load_vectors=load_partial) == plain
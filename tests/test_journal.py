@@ -0,0 +1,67 @@
+import argparse
+import multiprocessing
+import shutil
+from pathlib import Path
+
+import yaml
+
+from src.journal import StageJournal
+from src.pipeline import PipelineRunner
+from src.utils import atomic_write_text, load_yaml
+
+
+def test_resume_skips_finished_and_drops_torn_line(tmp_path) -> None:
+    with StageJournal(tmp_path, "embed") as journal:
+        journal.record("a", {"n": 1})
+        journal.record("b", {"n": 2})
+    path = tmp_path / "journal" / "embed.jsonl"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "c", "data": {"n"')
+    with StageJournal(tmp_path, "embed", resume=True) as journal:
+        assert "a" in journal and "b" in journal and "c" not in journal
+        journal.record("c", {"n": 3})
+        assert journal.load() == {"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}}
+    assert StageJournal(tmp_path, "embed").load() == {}
+
+
+def test_discard_removes_the_journal(tmp_path) -> None:
+    journal = StageJournal(tmp_path, "score_values")
+    journal.record("a", {"s1": [0.1, 0.2, 0.3]})
+    journal.discard()
+    assert not journal.path.exists()
+    assert StageJournal(tmp_path, "score_values", resume=True).load() == {}
+
+
+def _write_many(path: str) -> int:
+    failures = 0
+    for i in range(300):
+        try:
+            atomic_write_text(path, str(i))
+        except OSError:
+            failures += 1
+    return failures
+
+
+def test_concurrent_atomic_writes_to_one_path(tmp_path) -> None:
+    target = tmp_path / "out.txt"
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        assert pool.map(_write_many, [str(target)] * 4) == [0, 0, 0, 0]
+    assert target.read_text(encoding="utf-8") == "299"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+
+def test_completed_pipeline_run_leaves_no_journal(tmp_path, monkeypatch) -> None:
+    fixtures, config_dir = Path("tests/fixtures").resolve(), tmp_path / "config"
+    shutil.copytree("config", config_dir)
+    models = load_yaml(config_dir / "models.yaml")
+    models["embedding"].update(backend="hashing", dim=16)
+    (config_dir / "models.yaml").write_text(yaml.safe_dump(models, allow_unicode=True), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    runner = PipelineRunner(str(config_dir))
+    runner.state["docs"] = [
+        {"doc_id": "mfa1", "source_type": "mfa_presser", "raw_path": str(fixtures / "mfa_sample.html")},
+        {"doc_id": "party1", "source_type": "party_report", "raw_path": str(fixtures / "party_sample.html")},
+    ]
+    runner.run(["segment", "dedup", "embed"], argparse.Namespace(profile=False, resume=False, force=False))
+    assert len(runner.state["docs"]) == 2 and Path("data/segments/segments_embedded.jsonl").exists()
+    assert list(Path("data/journal").iterdir()) == []
@@ -0,0 +1,22 @@
+import numpy as np
+
+from src.tests.keyness import bh_qvalues, compute_keyness
+
+
+def test_bh_qvalues_match_reference() -> None:
+    p = np.array([0.01, 0.04, 0.03, 0.2])
+    # Sorted: 0.01*4/1=0.04, 0.03*4/2=0.06, 0.04*4/3=0.0533 -> monotone 0.0533, 0.2*4/4=0.2
+    np.testing.assert_allclose(bh_qvalues(p), [0.04, 0.05333333, 0.05333333, 0.2])
+
+
+def test_permutation_test_separates_key_terms_from_rare_ones() -> None:
+    high = ["坚决维护国家安全"] * 20 + ["今天天气很好"] * 20
+    low = ["今天天气很好"] * 39 + ["偶然出现一次"]
+    table = compute_keyness(high, low, 2, 2, "log_odds", 0.01, 100, n_permutations=500, seed=1)
+    assert list(table.columns) == ["ngram", "score", "count_high", "count_low", "p_value", "q_value"]
+    rows = table.set_index("ngram")
+    assert rows.loc["安全", "count_high"] == 20 and rows.loc["安全", "count_low"] == 0
+    assert rows.loc["安全", "p_value"] < 0.01 and rows.loc["安全", "q_value"] < 0.05
+    assert rows.loc["天气", "p_value"] > 0.5
+    plain = compute_keyness(high, low, 2, 2, "chi_square", 0.01, 5)
+    assert list(plain.columns) == ["ngram", "score", "count_high", "count_low"] and len(plain) == 5
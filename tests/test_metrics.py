@@ -0,0 +1,46 @@
+import json
+
+from src.metrics import RunMetrics
+
+
+def test_nested_stages_substeps_and_summary() -> None:
+    metrics = RunMetrics()
+    metrics.count("outside")  # no active stage: ignored
+    with metrics.stage("score"):
+        for _ in range(3):
+            with metrics.substep("encode"):
+                metrics.count("embed.cache.hit")
+        metrics.count("embed.cache.miss")
+        metrics.count("rows", 10)
+        for value in [2.0, 4.0, 9.0]:
+            metrics.observe("batch", value)
+        with metrics.stage("inner"):
+            with metrics.substep("encode"):
+                metrics.count("rows", 5)
+        metrics.count("rows", 1)
+    score, inner = metrics.summary("score"), metrics.summary("inner")
+    assert score["substeps"]["encode"]["calls"] == 3 and inner["substeps"]["encode"]["calls"] == 1
+    assert score["counters"] == {"embed.cache.hit": 3, "embed.cache.miss": 1, "rows": 11}
+    assert inner["counters"] == {"rows": 5}
+    assert score["rates"] == {"embed.cache.hit_rate": 0.75}
+    assert score["observations"]["batch"] == {"n": 3, "sum": 15.0, "min": 2.0, "max": 9.0, "mean": 5.0}
+    assert score["wall_s"] >= inner["wall_s"] >= 0 and score["cpu_s"] >= 0
+    assert "peak_rss_mb" in score or "process_peak_rss_mb" in score
+    assert score["children_cpu_s"] >= 0 and score["children_peak_rss_mb"] >= 0
+
+
+def test_write_merges_into_existing_file(tmp_path) -> None:
+    path = tmp_path / "run_metrics.json"
+    path.write_text(json.dumps({"stages": {"collect": {"wall_s": 1.0}, "segment": {"wall_s": 2.0}}}), encoding="utf-8")
+    metrics = RunMetrics()
+    with metrics.stage("segment"):
+        metrics.count("docs", 4)
+    with metrics.stage("embed"):
+        metrics.count("texts", 8)
+    metrics.write(path)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert set(data["stages"]) == {"collect", "segment", "embed"}
+    assert data["stages"]["collect"] == {"wall_s": 1.0}
+    assert data["stages"]["segment"]["counters"] == {"docs": 4}
+    assert data["stages"]["embed"]["counters"] == {"texts": 8}
+    assert "updated_at" in data
@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.embed import cache_namespace
+from src.multimodel import agreement_table, build_engines, model_variants
+
+BASE = {
+    "model_name": "intfloat/multilingual-e5-small",
+    "backend": "hashing",
+    "dim": 16,
+    "batch_size": 8,
+    "device": "cpu",
+    "max_length": 512,
+    "cache_mode": "embeddings",
+    "embedding_dtype": "float16",
+}
+
+
+def test_cache_namespace_tracks_model_and_dtype() -> None:
+    namespaces = {
+        cache_namespace(BASE),
+        cache_namespace({**BASE, "dim": 32}),
+        cache_namespace({**BASE, "embedding_dtype": "int8"}),
+        cache_namespace({**BASE, "backend": None}),
+    }
+    assert len(namespaces) == 4
+    assert cache_namespace({**BASE, "batch_size": 64, "device": "cuda"}) == cache_namespace(BASE)
+    assert cache_namespace({**BASE, "backend": None}).startswith("intfloat_multilingual-e5-small-float16-")
+
+
+def test_dtype_variants_share_one_encoder(tmp_path) -> None:
+    compare = [{"name": "f32", "embedding_dtype": "float32"}, {"name": "wide", "dim": 32}]
+    variants = model_variants({"embedding": BASE, "compare": compare})
+    assert list(variants) == ["primary", "f32", "wide"]
+    engines = build_engines(variants, tmp_path)
+    assert engines["primary"].model is engines["f32"].model
+    assert engines["primary"].model is not engines["wide"].model
+    segments = [{"segment_id": "s1", "text": "维护国家安全"}, {"segment_id": "s2", "text": "推动高质量发展"}]
+    half = engines["primary"].embed_segments("d1", segments)
+    full = engines["f32"].embed_segments("d1", segments)
+    assert half.dtype == np.float16 and full.dtype == np.float32
+    np.testing.assert_allclose(half, full, atol=1e-3)
+    assert engines["primary"].cache_dir != engines["f32"].cache_dir
+    assert engines["f32"].load_cache("d1")["segment_ids"] == ["s1", "s2"]
+
+
+def test_agreement_table_compares_each_pair() -> None:
+    rng = np.random.default_rng(0)
+    rows = {}
+    for name in ["a", "b"]:
+        rows[name] = [
+            {
+                "segment_id": f"s{i}",
+                "segment_type": "body",
+                "scores": {
+                    "security_axis": float(v),
+                    "growth_axis": float(v),
+                    "outward_axis": float(v),
+                    "is_outward": bool(v > 0),
+                },
+            }
+            for i, v in enumerate(rng.normal(size=50) if name == "b" else np.linspace(-1, 1, 50))
+        ]
+    rows["c"] = rows["a"]
+    report = agreement_table(rows)
+    assert len(report) == 3 * 4
+    same = report[(report.model_a == "a") & (report.model_b == "c")].set_index("measure")
+    assert same.loc["security_axis", "pearson"] == 1.0
+    assert same.loc["is_outward", "kappa"] == 1.0
@@ -0,0 +1,86 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from src.ngram_index import NgramIndex, update_index, varint_decode, varint_encode
+from src.pipeline import PipelineRunner
+from src.tests.slogans import slogan_metrics, slogan_presence
+
+ANALYSIS = {"binning": "yearly", "ngram_index": {"compact_ratio": 0.5}}
+PHRASES = ["国家安全", "高质量发展", "安全", "发展", "共同体", "A", "不存在的词"]
+
+
+def make_docs(n_docs: int, seed: int = 0, tag: str = "") -> list[dict]:
+    rng = np.random.default_rng(seed)
+    words = ["维护", "国家安全", "推动", "高质量发展", "人类命运", "共同体", "合作", "A股", "。"]
+    docs = []
+    for d in range(n_docs):
+        segments = [
+            {
+                "segment_id": f"d{d}s{s}",
+                "segment_type": "a_turn" if s % 2 else "body",
+                "text": tag + "".join(rng.choice(words, size=int(rng.integers(1, 8)))),
+            }
+            for s in range(4)
+        ]
+        docs.append({"doc_id": f"d{d}", "date": f"{2015 + d % 4}-06-01", "source_type": "mfa_presser", "segments": segments})
+    return docs
+
+
+def rows_of(docs: list[dict]) -> list[dict]:
+    return [
+        {**seg, "doc_id": doc["doc_id"], "date": doc["date"], "source_type": doc["source_type"], "char_len": len(seg["text"])}
+        for doc in docs
+        for seg in doc["segments"]
+    ]
+
+
+def test_varint_round_trip() -> None:
+    values = np.array([0, 1, 127, 128, 300, 2**35 + 7], dtype=np.uint64)
+    encoded, nbytes = varint_encode(values)
+    assert nbytes.tolist() == [1, 1, 1, 2, 2, 6] and len(encoded) == nbytes.sum()
+    assert varint_decode(encoded).tolist() == values.tolist()
+
+
+def test_incremental_index_matches_scans(tmp_path) -> None:
+    docs = make_docs(40)
+    update_index(docs[:30], ANALYSIS, tmp_path)
+    # New documents are appended; two documents are re-segmented and one disappears.
+    changed = make_docs(40, seed=1, tag="修订")
+    docs = docs[:27] + changed[27:29] + docs[30:]
+    stats = update_index(docs, ANALYSIS, tmp_path)
+    assert stats["docs_added"] == 12 and stats["docs_removed"] == 1 and stats["compacted"] == 0
+    index = NgramIndex.load(tmp_path)
+    rows = rows_of(docs)
+    assert index.covers(rows) and not index.covers(rows_of(make_docs(40, seed=2)))
+    for phrase in PHRASES:
+        expected = [r["segment_id"] for r in rows if phrase in r["text"]]
+        positions, counts = index.search(phrase)
+        assert sorted(index.meta["segment_id"][positions].tolist()) == sorted(expected)
+        assert counts.sum() == sum(r["text"].count(phrase) for r in rows)
+    assert slogan_presence(rows, PHRASES, index) == slogan_presence(rows, PHRASES)
+    assert slogan_metrics(rows, PHRASES, "yearly", index=index).equals(slogan_metrics(rows, PHRASES, "yearly"))
+
+    # Replacing every document compacts the index into a new generation.
+    fresh = make_docs(40, seed=3, tag="新")
+    assert update_index(fresh, ANALYSIS, tmp_path)["compacted"] == 1
+    index = NgramIndex.load(tmp_path)
+    assert index.size == 160 and index.live.all() and len(list((tmp_path / "ngram_index").glob("texts-*.bin"))) == 1
+    assert slogan_presence(rows_of(fresh), PHRASES, index) == slogan_presence(rows_of(fresh), PHRASES)
+
+
+def test_pipeline_segment_step_updates_index_without_writing_segments(tmp_path, monkeypatch) -> None:
+    fixtures, config_dir = Path("tests/fixtures").resolve(), str(Path("config").resolve())
+    monkeypatch.chdir(tmp_path)
+    docs = [
+        {"doc_id": "mfa1", "source_type": "mfa_presser", "raw_path": str(fixtures / "mfa_sample.html")},
+        {"doc_id": "party1", "source_type": "party_report", "raw_path": str(fixtures / "party_sample.html")},
+    ]
+    runner = PipelineRunner(config_dir)
+    runner.state["docs"] = docs
+    # segment is not the last stage here, so it runs with write=False.
+    runner.run(["segment", "dedup"], argparse.Namespace(profile=False, resume=False))
+    segments = rows_of([{**doc, "date": "2020-01-01"} for doc in runner.state["docs"]])
+    index = NgramIndex.load(Path("data"))
+    assert segments and index.covers(segments)
@@ -0,0 +1,43 @@
+import argparse
+
+import pytest
+
+from src import pipeline
+from src.pipeline import STAGE_NAMES, PipelineRunner, stage_index
+
+
+class RecordingRunner(PipelineRunner):
+    """Records the write flag each stage is called with instead of running it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        for name in STAGE_NAMES:
+            setattr(self, f"_run_{name}", lambda module, args, write, name=name: self.calls.append((name, write)))
+
+
+def test_stage_index_accepts_names_and_script_numbers() -> None:
+    assert [stage_index(name) for name in STAGE_NAMES] == list(range(len(STAGE_NAMES)))
+    assert stage_index("02b") == STAGE_NAMES.index("dedup")
+    assert stage_index("3") == stage_index("03") == STAGE_NAMES.index("embed")
+    assert stage_index("06") == STAGE_NAMES.index("export")
+    for value in ["07", "2c", "scoring", ""]:
+        with pytest.raises(ValueError, match="Unknown stage"):
+            stage_index(value)
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, [False, False, False, True]),
+        ({"write_all": True}, [True, True, True, True]),
+        ({"shard": "2020"}, [True, True, True, True]),
+    ],
+)
+def test_only_last_stage_writes_unless_write_all_or_shard(tmp_path, monkeypatch, kwargs, expected) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, "load_stage", lambda name: None)
+    runner = RecordingRunner("config", **kwargs)
+    stages = ["segment", "dedup", "embed", "score"]
+    runner.run(stages, argparse.Namespace(profile=False))
+    assert runner.calls == list(zip(stages, expected))
@@ -0,0 +1,18 @@
+import numpy as np
+
+from src.quantize import EmbeddingCodec
+
+
+def test_codec_scores_match_reconstruction_and_bound_error() -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 24)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    axis = vectors[:10].mean(axis=0)
+    for pca_dim in [None, 8]:
+        codec = EmbeddingCodec.fit(vectors, pca_dim)
+        codes = codec.encode(vectors)
+        assert codes.dtype == np.int8 and codes.shape == (500, pca_dim or 24)
+        np.testing.assert_allclose(codec.scores(codes, axis), codec.reconstruct(codes) @ axis, atol=1e-5)
+    codec = EmbeddingCodec.fit(vectors)
+    # Each coordinate is off by at most half a quantization step.
+    assert np.all(np.abs(codec.reconstruct(codec.encode(vectors)) - vectors) <= codec.scale / 2 + 1e-6)
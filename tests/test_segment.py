@@ -0,0 +1,34 @@
+from src.segment import pack_segments, split_sentences
+
+
+def count_chars(texts: list[str]) -> list[int]:
+    return [len(t) for t in texts]
+
+
+def test_split_sentences_keeps_punctuation_and_closing_quotes() -> None:
+    text = "我们反对霸权主义。他说：“合作共赢！”双方同意加强交流；会谈取得成果"
+    assert split_sentences(text) == ["我们反对霸权主义。", "他说：“合作共赢！”", "双方同意加强交流；", "会谈取得成果"]
+
+
+def test_pack_segments_respects_budget_turns_and_headings() -> None:
+    segments = [
+        {"segment_index": 0, "segment_type": "heading", "text": "第一部分"},
+        {"segment_index": 1, "segment_type": "body", "text": "一二三四。五六七八。"},
+        {"segment_index": 2, "segment_type": "body", "text": "甲乙丙。"},
+        {"segment_index": 3, "segment_type": "q_turn", "text": "问题一？"},
+        {"segment_index": 4, "segment_type": "q_turn", "text": "问题二？"},
+        {"segment_index": 5, "segment_type": "a_turn", "text": "这是一个非常非常长的回答没有任何标点符号"},
+    ]
+    packed = pack_segments(segments, 10, count_chars)
+    assert [(s["segment_type"], s["text"]) for s in packed] == [
+        ("heading", "第一部分"),
+        ("body", "一二三四。五六七八。"),
+        ("body", "甲乙丙。"),
+        ("q_turn", "问题一？"),
+        ("q_turn", "问题二？"),
+        ("a_turn", "这是一个非常非常长的"),
+        ("a_turn", "回答没有任何标点符号"),
+    ]
+    assert [s["segment_index"] for s in packed] == list(range(len(packed)))
+    merged = pack_segments(segments[1:3], 20, count_chars)
+    assert [s["text"] for s in merged] == ["一二三四。五六七八。\n甲乙丙。"]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from src.quantize import EmbeddingCodec
+from src.sensitivity import VariantPlan, axis_variants
+
+
+def unit(vector: np.ndarray) -> np.ndarray:
+    return vector / np.linalg.norm(vector)
+
+
+def test_axis_variants_leave_out_each_seed() -> None:
+    rng = np.random.default_rng(0)
+    seeds = rng.normal(size=(5, 16))
+    labels, matrix = axis_variants(seeds, 3, np.random.default_rng(1))
+    assert labels == ["base", "loo:0", "loo:1", "loo:2", "loo:3", "loo:4", "boot:0", "boot:1", "boot:2"]
+    assert matrix.shape == (16, 9)
+    np.testing.assert_allclose(matrix[:, 0], unit(seeds.mean(axis=0)), atol=1e-6)
+    for i in range(5):
+        np.testing.assert_allclose(matrix[:, 1 + i], unit(np.delete(seeds, i, axis=0).mean(axis=0)), atol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=0), 1.0, atol=1e-6)
+
+
+def test_variant_plan_varies_one_axis_at_a_time() -> None:
+    plan = VariantPlan({"security": ["base", "loo:0"], "growth": ["base"], "outward": ["base", "loo:0", "boot:0"]})
+    assert plan.n_columns == 6
+    assert [(r["axis"], r["variant"]) for r in plan.rows] == [
+        ("baseline", "base"),
+        ("security", "loo:0"),
+        ("outward", "loo:0"),
+        ("outward", "boot:0"),
+    ]
+    assert plan.columns["security"].tolist() == [0, 1, 0, 0]
+    assert plan.columns["growth"].tolist() == [2, 2, 2, 2]
+    assert plan.columns["outward"].tolist() == [3, 3, 4, 5]
+    assert plan.outward_columns[plan.outward_of].tolist() == plan.columns["outward"].tolist()
+
+
+def test_codec_projects_stacked_axes() -> None:
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(300, 12)).astype(np.float32)
+    axes = rng.normal(size=(12, 4)).astype(np.float32)
+    for pca_dim in [None, 6]:
+        codec = EmbeddingCodec.fit(vectors, pca_dim)
+        codes = codec.encode(vectors)
+        weights, bias = codec.project_axis(axes)
+        expected = np.stack([codec.scores(codes, axes[:, j]) for j in range(4)], axis=1)
+        np.testing.assert_allclose(codes @ weights + bias, expected, atol=1e-4)
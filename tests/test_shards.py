@@ -0,0 +1,175 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.ngram_index import NgramIndex
+from src.quantize import CODEC_NAME, EmbeddingCodec, load_codec
+from src.shards import merge_embeddings, merge_shards
+from src.utils import jsonl_read
+
+NAMESPACE = "hashing-int8-test"
+TEXTS = [
+    "维护国家安全是头等大事，必须统筹发展和安全。",
+    "推动高质量发展，构建新发展格局，扩大高水平对外开放。",
+    "坚持共商共建共享，推动共建一带一路高质量发展。",
+    "记者提问：请介绍中方对地区局势的立场和主张。",
+]
+
+
+def write_shard(root: Path, year: str, docs: list[dict], vectors: dict, codec: EmbeddingCodec) -> None:
+    shard = root / "data" / "shards" / year
+    for sub in ["raw", "parsed", "segments", f"embeddings/{NAMESPACE}"]:
+        (shard / sub).mkdir(parents=True, exist_ok=True)
+    rows = []
+    for doc in docs:
+        (shard / "raw" / f"{doc['doc_id']}.html").write_text("<html></html>", encoding="utf-8")
+        doc["raw_path"] = str(shard / "raw" / f"{doc['doc_id']}.html")
+        (shard / "parsed" / f"{doc['doc_id']}.json").write_text(json.dumps(doc), encoding="utf-8")
+        ids = [seg["segment_id"] for seg in doc["segments"]]
+        np.savez_compressed(
+            shard / "embeddings" / NAMESPACE / f"{doc['doc_id']}.npz",
+            segment_ids=np.array(ids),
+            embeddings=codec.encode(np.stack([vectors[i] for i in ids])),
+            codec_id=np.array(codec.codec_id),
+        )
+        for i, seg in enumerate(doc["segments"]):
+            outward = float(vectors[seg["segment_id"]][0])
+            rows.append(
+                {
+                    **{k: doc[k] for k in ["doc_id", "date", "source_type", "title", "url"]},
+                    **seg,
+                    "scores": {"security_axis": 0.1 * i, "growth_axis": -0.1 * i, "outward_axis": outward},
+                }
+            )
+    codec.save(shard / "embeddings" / NAMESPACE / CODEC_NAME)
+    meta = [{k: v for k, v in doc.items() if k != "segments"} for doc in docs]
+    (shard / "parsed" / "docs.jsonl").write_text("".join(json.dumps(d) + "\n" for d in meta), encoding="utf-8")
+    (shard / "segments" / "segments.jsonl").write_text("".join(json.dumps(d) + "\n" for d in docs), encoding="utf-8")
+    scored = "".join(json.dumps(r) + "\n" for r in rows)
+    (shard / "segments" / "segments_scored.jsonl").write_text(scored, encoding="utf-8")
+
+
+def make_doc(doc_id: str, date: str, source_type: str, texts: list[str]) -> dict:
+    segments = [
+        {"segment_id": f"{doc_id}_{i}", "segment_type": "body", "text": text, "char_len": len(text)}
+        for i, text in enumerate(texts)
+    ]
+    return {
+        "doc_id": doc_id,
+        "date": date,
+        "source_type": source_type,
+        "title": doc_id,
+        "url": f"https://example.org/{doc_id}",
+        "segments": segments,
+        "clean_text": "\n".join(texts),
+    }
+
+
+def test_merge_two_shards_with_different_codecs(tmp_path, monkeypatch) -> None:
+    config_dir = str(Path("config").resolve())
+    monkeypatch.chdir(tmp_path)
+    shards = {
+        "2019": [
+            make_doc("a", "2019-03-01", "mfa_presser", TEXTS[:2]),
+            make_doc("p1", "2019-05-01", "party_report", TEXTS[2:]),
+        ],
+        # p2 is a 2019 party report placed in the 2020 shard by URL hash; c repeats document a.
+        "2020": [
+            make_doc("p2", "2019-09-01", "party_report", TEXTS[1:3]),
+            make_doc("c", "2020-02-01", "mfa_presser", TEXTS[:2]),
+        ],
+    }
+    rng = np.random.default_rng(0)
+    ids = [seg["segment_id"] for docs in shards.values() for doc in docs for seg in doc["segments"]]
+    vectors = dict(zip(ids, rng.normal(size=(len(ids), 12)).astype(np.float32)))
+    shard_vectors = {
+        year: np.stack([vectors[s["segment_id"]] for d in docs for s in d["segments"]]) for year, docs in shards.items()
+    }
+    # The first shard's codec covers every vector; the second is fitted on its own rows only.
+    codecs = {
+        "2019": EmbeddingCodec.fit(np.concatenate(list(shard_vectors.values()))),
+        "2020": EmbeddingCodec.fit(shard_vectors["2020"]),
+    }
+    assert codecs["2019"].codec_id != codecs["2020"].codec_id
+    for year, docs in shards.items():
+        write_shard(tmp_path, year, docs, vectors, codecs[year])
+
+    stats = merge_shards(config_dir)
+    data = Path("data")
+    assert stats["shards"] == 2 and stats["raw"] == 4 and stats["embeddings"] == 4 and stats["docs"] == 4
+    merged_docs = jsonl_read(data / "parsed" / "docs.jsonl")
+    assert [d["doc_id"] for d in merged_docs] == ["a", "p1", "p2", "c"]
+    assert all(Path(d["raw_path"]) == data / "raw" / f"{d['doc_id']}.html" for d in merged_docs)
+    assert all(Path(d["raw_path"]).exists() for d in merged_docs)
+
+    # Duplicates are flagged across shards: c repeats a, and p2 repeats a segment each of a and p1.
+    segments = {d["doc_id"]: d for d in jsonl_read(data / "segments" / "segments.jsonl")}
+    assert segments["c"]["dup_of"] == "a" and segments["a"]["dup_of"] is None
+    assert [s["dup_of"] for s in segments["p2"]["segments"]] == ["a_1", "p1_0"]
+    assert json.loads((data / "segments" / "c.json").read_text(encoding="utf-8"))["dup_of"] == "a"
+
+    # Outward thresholds are recomputed per (year, source_type) over both shards.
+    scored = jsonl_read(data / "segments" / "segments_scored.jsonl")
+    assert len(scored) == stats["segments_scored"] == 8
+    party_2019 = [r for r in scored if r["source_type"] == "party_report"]
+    threshold = np.percentile([r["scores"]["outward_axis"] for r in party_2019], 80)
+    expected = [r["scores"]["outward_axis"] >= threshold for r in party_2019]
+    assert [r["scores"]["is_outward"] for r in party_2019] == expected
+    assert sum(r["scores"]["is_outward"] for r in party_2019) == 1
+    assert {r["segment_id"]: r["doc_dup_of"] for r in scored}["c_0"] == "a"
+
+    # Caches of both shards are re-coded to one codec fitted on all of them.
+    target = load_codec(data / "embeddings" / NAMESPACE / CODEC_NAME)
+    assert target.codec_id not in {codec.codec_id for codec in codecs.values()}
+    axis = rng.normal(size=12).astype(np.float32)
+    # Re-coding moves each coordinate by at most half a step of the target codec.
+    step = float(np.abs(axis) @ target.scale) / 2 + 1e-4
+    for year, docs in shards.items():
+        for doc in docs:
+            merged = np.load(data / "embeddings" / NAMESPACE / f"{doc['doc_id']}.npz")
+            source = np.load(Path("data/shards") / year / "embeddings" / NAMESPACE / f"{doc['doc_id']}.npz")
+            assert str(merged["codec_id"]) == target.codec_id
+            assert merged["segment_ids"].tolist() == source["segment_ids"].tolist()
+            before = codecs[year].reconstruct(source["embeddings"]) @ axis
+            after = target.scores(merged["embeddings"], axis)
+            assert np.all(np.abs(after - before) <= step)
+
+    assert NgramIndex.load(data).covers([s for d in segments.values() for s in d["segments"]])
+    assert stats["stats_groups"] == 3
+
+
+@pytest.mark.parametrize("pca_dim", [None, 4])
+def test_merged_codec_covers_shards_outside_the_first_range(tmp_path, monkeypatch, pca_dim) -> None:
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(1)
+    basis = rng.normal(size=(4, 12))
+    # Same 4-dim subspace in both shards, but the 2020 vectors lie well outside the 2019 range.
+    latent = {"2019": rng.normal(size=(40, 4)), "2020": rng.normal(loc=6.0, size=(40, 4))}
+    vectors, codecs = {}, {}
+    for year, coords in latent.items():
+        vectors[year] = (coords @ basis).astype(np.float32)
+        codecs[year] = EmbeddingCodec.fit(vectors[year], pca_dim)
+        cache = Path("data/shards") / year / "embeddings" / NAMESPACE
+        cache.mkdir(parents=True)
+        for i in range(0, 40, 10):
+            np.savez_compressed(
+                cache / f"{year}_{i}.npz",
+                segment_ids=np.array([f"{year}_{j}" for j in range(i, i + 10)]),
+                embeddings=codecs[year].encode(vectors[year][i : i + 10]),
+                codec_id=np.array(codecs[year].codec_id),
+            )
+        codecs[year].save(cache / CODEC_NAME)
+
+    assert merge_embeddings(["2019", "2020"], Path("data/embeddings")) == 8
+    target = load_codec(Path("data/embeddings") / NAMESPACE / CODEC_NAME)
+    axis = rng.normal(size=12).astype(np.float32)
+    weights, _ = target.project_axis(axis)
+    step = float(np.abs(weights).sum()) / 2 + 1e-3
+    for year, vecs in vectors.items():
+        codes = np.concatenate(
+            [np.load(Path("data/embeddings") / NAMESPACE / f"{year}_{i}.npz")["embeddings"] for i in range(0, 40, 10)]
+        )
+        before = codecs[year].reconstruct(codecs[year].encode(vecs)) @ axis
+        assert np.all(np.abs(target.scores(codes, axis) - before) <= step)
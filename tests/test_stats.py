@@ -0,0 +1,58 @@
+import numpy as np
+
+from src.binning import bin_label, build_cube, rollup
+from src.sketch import KLLSketch
+from src.tests.bootstrap import cohens_d_from_sums, pearson_from_sums, resample_group_sums
+from src.tests.coupling import cohens_d
+
+
+def test_resample_group_sums_stays_within_groups() -> None:
+    sums = resample_group_sums({"n": np.ones(10), "x": np.array([1.0] * 3 + [5.0] * 7)}, np.array([3, 7]), 50, 0)
+    assert np.all(sums["n"] == [3, 7])
+    assert np.all(sums["x"] == [3, 35])
+    # Many groups, including an empty one, in one reduction.
+    sizes = np.array([2, 0, 5] * 400)
+    values = np.repeat(np.arange(len(sizes), dtype=np.float64), sizes)
+    sums = resample_group_sums({"n": np.ones(len(values)), "x": values}, sizes, 20, 1)
+    assert np.all(sums["n"] == sizes) and np.all(sums["x"] == sizes * np.arange(len(sizes)))
+
+
+def test_sum_based_statistics_match_direct() -> None:
+    rng = np.random.default_rng(1)
+    x, y = rng.normal(size=40), rng.normal(size=40)
+    r = pearson_from_sums(40, x.sum(), y.sum(), (x * x).sum(), (y * y).sum(), (x * y).sum())
+    assert np.isclose(r, np.corrcoef(x, y)[0, 1])
+    a, b = x[:15], x[15:]
+    d = cohens_d_from_sums(15, a.sum(), (a * a).sum(), 25, b.sum(), (b * b).sum())
+    assert np.isclose(d, cohens_d(a.tolist(), b.tolist()))
+
+
+def test_cube_rollup_matches_direct_binning() -> None:
+    rows = [
+        {"date": d, "source_type": "mfa_presser", "char_len": 10, "scores": {"security_axis": s, "is_outward": o}}
+        for d, s, o in [("2020-01-05", 1.0, True), ("2020-02-10", 3.0, False), ("2020-04-01", 2.0, True), ("", 9.0, True)]
+    ]
+    cube = build_cube(rows)
+    quarterly = rollup(cube, "quarterly", by=())
+    assert quarterly["bin"].tolist() == ["2020-Q1", "2020-Q2"]
+    assert quarterly["sum_security"].tolist() == [4.0, 2.0]
+    periods = [{"name": "early", "start": "2020-01-01", "end": "2020-01-31"}]
+    custom = rollup(cube, "custom", periods, by=())
+    assert custom["bin"].tolist() == ["early"] and custom["n"].tolist() == [1.0]
+    assert bin_label("2020-11-30", "monthly") == "2020-11"
+
+
+def test_kll_sketch_is_exact_when_small_and_bounded_when_large() -> None:
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=50_000)
+    small = KLLSketch(k=200)
+    small.update(values[:150])
+    assert np.isclose(small.quantile(0.8), np.percentile(values[:150], 80))
+    left, right = KLLSketch(k=200, seed=0), KLLSketch(k=200, seed=1)
+    for chunk in np.array_split(values[:25_000], 50):
+        left.update(chunk)
+    right.update(values[25_000:])
+    left.merge(right)
+    assert left.n == values.size and left.size() < 1_000
+    rank = (values < left.quantile(0.8)).mean()
+    assert abs(rank - 0.8) <= left.rank_error()["worst"]
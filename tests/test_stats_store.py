@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from src.binning import build_cube, stat_columns
+from src.outward_filter import compute_year_thresholds, mark_outward
+from src.stats_store import StatsStore, update_store
+
+CFG = {
+    "axes": {"security_axis": {"seeds": ["安全"]}},
+    "models": {"embedding": {"model_name": "m", "backend": "hashing", "dim": 8, "max_length": 64}},
+    "analysis": {"dedup": {"exclude_from_analyses": True}},
+}
+
+
+def make_rows(n_docs: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in range(n_docs):
+        date = f"{2018 + d % 3}-{1 + d % 12:02d}-{1 + d % 28:02d}"
+        source = "mfa_presser" if d % 4 else "party_report"
+        for s in range(3):
+            rows.append(
+                {
+                    "doc_id": f"d{d}",
+                    "segment_id": f"d{d}s{s}",
+                    "date": date,
+                    "source_type": source,
+                    "char_len": int(rng.integers(10, 100)),
+                    "dup_of": "x" if s == 2 and d % 5 == 0 else None,
+                    "scores": {k: float(rng.normal()) for k in ["security_axis", "growth_axis", "outward_axis"]},
+                }
+            )
+    return rows
+
+
+def score(rows: list[dict]) -> dict:
+    thresholds = compute_year_thresholds(rows, 0.8)
+    mark_outward(rows, thresholds)
+    return thresholds
+
+
+def test_incremental_update_matches_full_build(tmp_path) -> None:
+    rows = make_rows(60)
+    early = [r for r in rows if int(r["doc_id"][1:]) < 50]
+    stats = update_store(CFG, early, score(early), tmp_path)
+    assert stats["groups_rebuilt"] == stats["groups"] == 6
+    # The new documents fall in one year; groups of the other years are kept as they are.
+    late = early + [r for r in rows if int(r["doc_id"][1:]) >= 50 and r["date"].startswith("2019")]
+    stats = update_store(CFG, late, score(late), tmp_path)
+    assert stats["groups_rebuilt"] == 2
+    assert update_store(CFG, late, score(late), tmp_path)["groups_rebuilt"] == 0
+
+    expected = build_cube([r for r in late if not r["dup_of"]])
+    stored = StatsStore(CFG, tmp_path).cube
+    pd.testing.assert_frame_equal(
+        stored[stat_columns()].reset_index(drop=True), expected[stat_columns()].reset_index(drop=True)
+    )
+    assert stored["day"].tolist() == expected["day"].tolist()